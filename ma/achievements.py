@@ -0,0 +1,94 @@
+"""Achievement rules.
+
+Every achievement is one row of the rules table: the metric it watches, the
+threshold that unlocks it, a stable id (saved in user data) and a label.
+Rules are indexed by metric with thresholds sorted, so an event only looks
+at the rules for the metrics it changed, and finds the reached ones with a
+bisect instead of scanning the whole table.
+"""
+from bisect import bisect_right
+from collections import namedtuple
+
+from math_content import math_data
+
+Rule = namedtuple('Rule', 'metric threshold id label')
+
+# Board heading and unit for the headline metrics
+METRICS = {
+    'problems': ("📐 Math Problems", "problems"),
+    'streak': ("🔥 Streaks", "days"),
+    'points': ("⭐ Points", "points"),
+}
+
+# Per question type: (type, label) - unlocked after TYPE_THRESHOLD correct answers
+TYPE_ACHIEVEMENTS = [
+    ("solve", "Equation Solver"),
+    ("area", "Area Expert"),
+    ("derivative", "Derivative Pro"),
+    ("probability", "Chance Master"),
+]
+TOPIC_THRESHOLD = 5
+TYPE_THRESHOLD = 10
+
+RULES = [
+    Rule('problems', 1, '1_math_problem', "First Problem Solved"),
+    Rule('problems', 10, '10_math_problems', "Math Beginner"),
+    Rule('problems', 25, '25_math_problems', "Math Enthusiast"),
+    Rule('problems', 50, '50_math_problems', "Math Master"),
+    Rule('streak', 1, '1_day_streak', "Daily Learner"),
+    Rule('streak', 3, '3_day_streak', "3-Day Streak"),
+    Rule('streak', 7, '7_day_streak', "Weekly Warrior"),
+    Rule('points', 50, '50_points', "50 Points"),
+    Rule('points', 100, '100_points', "Century Scorer"),
+    Rule('points', 500, '500_points', "Math Power Player"),
+] + [
+    Rule(f'topic:{topic}', TOPIC_THRESHOLD, f'{topic.lower()}_explorer', f"{topic} Explorer")
+    for topic in math_data
+] + [
+    Rule(f'type:{problem_type}', TYPE_THRESHOLD, f'{problem_type}_type', label)
+    for problem_type, label in TYPE_ACHIEVEMENTS
+]
+
+def metric_value(user_data, metric):
+    """Current value of a metric for a student"""
+    if metric == 'points':
+        return user_data['points']
+    if metric == 'streak':
+        return user_data['daily_streak']
+    if metric == 'problems':
+        return user_data['problems_solved']
+    kind, _, name = metric.partition(':')
+    if kind == 'topic':
+        return user_data['math_problems_completed'].get(name, 0)
+    return user_data['math_types_completed'].get(name, 0)
+
+class RuleBook:
+    """Rules indexed by metric, each metric's rules sorted by threshold"""
+
+    def __init__(self, rules):
+        self._rules = {}
+        self._thresholds = {}
+        for rule in sorted(rules, key=lambda r: (r.metric, r.threshold)):
+            self._rules.setdefault(rule.metric, []).append(rule)
+            self._thresholds.setdefault(rule.metric, []).append(rule.threshold)
+
+    def metrics(self):
+        """Every metric that has at least one rule"""
+        return list(self._rules)
+
+    def rules_for(self, metric):
+        """A metric's rules, lowest threshold first"""
+        return self._rules.get(metric, [])
+
+    def newly_reached(self, metric, value, unlocked):
+        """Rules for `metric` that `value` reaches and that are not in `unlocked` yet"""
+        reached = bisect_right(self._thresholds.get(metric, []), value)
+        return [rule for rule in self._rules.get(metric, [])[:reached] if rule.id not in unlocked]
+
+    def next_rule(self, metric, value):
+        """The lowest-threshold rule for `metric` that `value` hasn't reached, or None"""
+        rules = self._rules.get(metric, [])
+        index = bisect_right(self._thresholds.get(metric, []), value)
+        return rules[index] if index < len(rules) else None
+
+RULEBOOK = RuleBook(RULES)
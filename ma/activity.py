@@ -0,0 +1,132 @@
+"""Active days as a bitmap.
+
+Each student's active days are one bit per day counted from their first
+active day, held in a Python int and saved as hex: three years of activity
+take about 300 bytes. Streaks and the calendar work on the whole int at
+once (shifts, masks, bit_length), so they cost the same however old the
+history is.
+"""
+from datetime import date, timedelta
+
+CALENDAR_WEEKS = 53
+
+class ActiveDays:
+    """Days a student was active, bit i standing for `start` + i days"""
+
+    __slots__ = ('start', 'bits')
+
+    def __init__(self, start=None, bits=0):
+        self.start = start  # date.toordinal() of bit 0, None until the first mark
+        self.bits = bits
+
+    def __eq__(self, other):
+        return isinstance(other, ActiveDays) and (self.start, self.bits) == (other.start, other.bits)
+
+    def mark(self, day):
+        """Record activity on `day`; returns False if it was already recorded"""
+        ordinal = day.toordinal()
+        if self.start is None:
+            self.start = ordinal
+        elif ordinal < self.start:
+            self.bits <<= self.start - ordinal  # activity before the first day, e.g. graded later
+            self.start = ordinal
+        bit = 1 << (ordinal - self.start)
+        if self.bits & bit:
+            return False
+        self.bits |= bit
+        return True
+
+    def count(self):
+        """Number of active days"""
+        return self.bits.bit_count()
+
+    def last_day(self):
+        """The latest active day, or None"""
+        return date.fromordinal(self.start + self.bits.bit_length() - 1) if self.bits else None
+
+    def streak_ending(self, day):
+        """Length of the run of active days ending on `day`"""
+        if not self.bits:
+            return 0
+        position = day.toordinal() - self.start
+        if position < 0 or not (self.bits >> position) & 1:
+            return 0
+        mask = (1 << (position + 1)) - 1
+        gaps = ~self.bits & mask  # inactive days up to `day`
+        return position + 1 - gaps.bit_length()
+
+    def current_streak(self, today):
+        """The streak still alive today: ending today, or yesterday if today isn't done yet"""
+        return self.streak_ending(today) or self.streak_ending(today - timedelta(days=1))
+
+    def longest_streak(self):
+        """Longest run of active days.
+
+        runs[k] marks the days that start k active days in a row; runs of
+        twice the length come from runs[k] & (runs[k] >> k), so the longest
+        run is found in O(log n) whole-int operations rather than one per day.
+        """
+        if not self.bits:
+            return 0
+        runs = [(1, self.bits)]
+        while True:
+            length, starts = runs[-1]
+            doubled = starts & (starts >> length)
+            if not doubled:
+                break
+            runs.append((2 * length, doubled))
+        best, starts = runs.pop()
+        for length, run_starts in reversed(runs):
+            longer = starts & (run_starts >> best)
+            if longer:
+                best, starts = best + length, longer
+        return best
+
+    def window(self, first, last):
+        """Bits for the days from `first` to `last`, bit 0 being `first`"""
+        if not self.bits:
+            return 0
+        offset = first.toordinal() - self.start
+        bits = self.bits >> offset if offset >= 0 else self.bits << -offset
+        return bits & ((1 << (last.toordinal() - first.toordinal() + 1)) - 1)
+
+    def to_json(self):
+        return {'start': date.fromordinal(self.start).isoformat() if self.start else None, 'bits': format(self.bits, 'x')}
+
+def load_active_days(saved):
+    """ActiveDays from its to_json() form"""
+    if isinstance(saved, ActiveDays):
+        return saved
+    if not saved or not saved.get('start'):
+        return ActiveDays()
+    return ActiveDays(date.fromisoformat(saved['start']).toordinal(), int(saved['bits'], 16))
+
+def backfill_active_days(user_data):
+    """Active days for a save made before the bitmap: days that earned points, challenges and the last active day"""
+    days = ActiveDays()
+    for day, totals in user_data.get('daily_rollup', {}).items():
+        if totals['points_gained'] > 0:
+            days.mark(date.fromisoformat(day))
+    for day in user_data.get('daily_challenges_completed', []):
+        days.mark(date.fromisoformat(day))
+    if user_data.get('last_activity_date'):
+        days.mark(date.fromisoformat(user_data['last_activity_date']))
+    return days
+
+def calendar(days, today, weeks=CALENDAR_WEEKS):
+    """The last `weeks` weeks as columns of seven (date, active) cells, Monday first.
+
+    Cells after today are None. The work is fixed by `weeks`, not by how
+    long the student has been active.
+    """
+    first = today - timedelta(days=today.weekday() + 7 * (weeks - 1))
+    bits = days.window(first, today)
+    columns = []
+    for week in range(weeks):
+        column = []
+        for weekday in range(7):
+            offset = week * 7 + weekday
+            day = first + timedelta(days=offset)
+            column.append((day, bool((bits >> offset) & 1)) if day <= today else None)
+        columns.append(column)
+    return columns
@@ -0,0 +1,331 @@
+"""Per-question analytics over every student's quiz history.
+
+    python analytics.py [--out math_analytics] [--top 15] [--min-attempts 20]
+
+Each run exports the attempts saved since the previous run (see
+Storage.attempts_since) into a new Parquet file, together with small
+aggregates of just those attempts:
+
+    math_analytics/
+        state.json                   run counter and storage watermark
+        attempts/run-00001.parquet   one row per attempt
+        questions/run-00001.parquet  attempts, correct and response time sums per question
+        times/run-00001.parquet      response time histogram per question
+        students/run-00001.parquet   attempts and correct per student
+        pairs/run-00001.parquet      attempts and correct per question and student
+        question_stats.parquet       the report below, for all runs
+
+Once COMPACT_EVERY run files of an aggregate have piled up, they are
+summed into one upto-NNNNN.parquet file covering every run so far, and
+the files it replaces are deleted. The attempt files are the export
+itself: they are kept as they are and never read again.
+
+The report combines the aggregates into per-question accuracy, response
+time percentiles and discrimination, and prints the hardest questions. A
+run reads the new attempts and the aggregates, never the attempts of
+earlier runs. Attempts are read and written in batches and every summary
+is a vectorized group-by over a batch or over the (smaller) aggregates,
+so memory depends on the number of questions, students and the pairs of
+them with attempts, not on the number of attempts.
+
+Discrimination is the point-biserial correlation between answering a
+question correctly and the student's accuracy over all questions: near 0
+the question doesn't separate strong students from weak ones, negative it
+favours the weak ones. Accuracies change as students answer more, so this
+one column is recomputed on every run, from the per-question and student
+counts. Directories exported before those counts were kept have them
+rebuilt from their attempt files once.
+
+Response time percentiles come from histograms with buckets a factor of
+sqrt(2) apart and report the upper edge of the bucket, so they are within
+about 40% of the exact value. Attempts without a response time (recorded
+before it was tracked, or graded offline without one) are left out of them.
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+import question_bank
+import storage
+
+DEFAULT_DIR = 'math_analytics'
+EXPORT_BATCH = 50_000  # attempts per batch read from storage and per Parquet row group
+SCAN_BATCH = 250_000  # attempts per batch when scanning the exported files
+RESPONSE_EDGES = 250 * 2 ** (np.arange(25) / 2)  # bucket edges in ms, 250 ms to about 17 minutes
+COMPACT_EVERY = 16  # run files of an aggregate before they are summed into one
+
+# Group-by keys of each aggregate; its other columns are counts and sums
+AGGREGATE_KEYS = {
+    'questions': ['problem_id', 'topic', 'question_type'],
+    'times': ['problem_id', 'bucket'],
+    'students': ['student'],
+    'pairs': ['problem_id', 'student'],
+}
+
+ATTEMPT_SCHEMA = pa.schema([
+    ('student', pa.string()),
+    ('ts', pa.timestamp('s')),
+    ('topic', pa.string()),
+    ('question_type', pa.string()),
+    ('correct', pa.bool_()),
+    ('points', pa.int32()),
+    ('problem_id', pa.string()),
+    ('response_ms', pa.int32()),  # null if unknown
+])
+
+# --- EXPORT ---
+
+def attempts_table(attempts):
+    """Attempt tuples from Storage.attempts_since as a table"""
+    student, ts, topic, question_type, correct, points, problem_id, response_ms = zip(*attempts)
+    return pa.table({
+        'student': pa.array(student, pa.string()),
+        'ts': pa.array(ts, pa.int64()).cast(pa.timestamp('s')),
+        'topic': pa.array(topic, pa.string()),
+        'question_type': pa.array(question_type, pa.string()),
+        'correct': pa.array(correct, pa.int8()).cast(pa.bool_()),
+        'points': pa.array(points, pa.int32()),
+        'problem_id': pa.array(problem_id, pa.string()),
+        'response_ms': pa.array([ms or None for ms in response_ms], pa.int32()),
+    }, schema=ATTEMPT_SCHEMA)
+
+def response_buckets(response_ms):
+    """Histogram bucket of each response time; bucket i holds times below RESPONSE_EDGES[i]"""
+    return pa.array(np.searchsorted(RESPONSE_EDGES, response_ms.to_numpy(zero_copy_only=False), side='right'),
+                    pa.int8())
+
+def aggregate(table, keys, aggregations):
+    """table.group_by(keys) with the aggregations given as {result column: (column, function)}"""
+    grouped = table.group_by(keys).aggregate(list(aggregations.values()))
+    return pa.table({**{key: grouped[key] for key in keys},
+                     **{name: grouped[f"{column}_{function}"] for name, (column, function) in aggregations.items()}})
+
+def answered(table):
+    """Attempts with a problem id (not those recorded before problem ids were), with correct as a count"""
+    table = table.filter(pc.not_equal(table['problem_id'], ''))
+    return table.append_column('correct_n', pc.cast(table['correct'], pa.int64()))
+
+def pair_counts(answered):
+    """Attempts and correct answers per question and student"""
+    return aggregate(answered, AGGREGATE_KEYS['pairs'],
+                     {'attempts': ('correct_n', 'count'), 'correct': ('correct_n', 'sum')})
+
+def summarize(table):
+    """Every aggregate (see AGGREGATE_KEYS) of a batch of attempts"""
+    table = table.append_column('correct_n', pc.cast(table['correct'], pa.int64()))
+    students = aggregate(table, AGGREGATE_KEYS['students'],
+                         {'attempts': ('correct_n', 'count'), 'correct': ('correct_n', 'sum')})
+    table = answered(table.drop_columns(['correct_n']))
+    table = table.append_column('response_ms_n', pc.fill_null(pc.cast(table['response_ms'], pa.int64()), 0))
+    questions = aggregate(table, AGGREGATE_KEYS['questions'], {
+        'attempts': ('correct_n', 'count'), 'correct': ('correct_n', 'sum'),
+        'timed': ('response_ms', 'count'), 'response_ms_sum': ('response_ms_n', 'sum')})
+    timed = table.filter(pc.is_valid(table['response_ms']))
+    timed = timed.select(['problem_id']).append_column('bucket', response_buckets(timed['response_ms']))
+    times = aggregate(timed, AGGREGATE_KEYS['times'], {'attempts': ('bucket', 'count')})
+    return {'questions': questions, 'times': times, 'students': students, 'pairs': pair_counts(table)}
+
+def combine(tables, keys):
+    """Sum partial aggregates that share keys"""
+    table = pa.concat_tables(tables)
+    return aggregate(table, keys, {name: (name, 'sum') for name in table.column_names if name not in keys})
+
+def read_state(directory):
+    path = os.path.join(directory, 'state.json')
+    if not os.path.exists(path):
+        return {'runs': 0, 'watermark': None, 'backend': None}
+    with open(path) as f:
+        return json.load(f)
+
+def export(store, backend, directory, batch_size=EXPORT_BATCH):
+    """Write the attempts saved since the last run, and their aggregates, as a new run; returns its row count"""
+    state = read_state(directory)
+    if state['backend'] not in (None, backend):
+        raise ValueError(f"{directory} holds attempts exported from {state['backend']} storage, not {backend}")
+    run = state['runs'] + 1
+    paths = {part: os.path.join(directory, part, f"run-{run:05d}.parquet") for part in ('attempts', *AGGREGATE_KEYS)}
+    for path in paths.values():
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    if state['runs'] and not run_files(directory, 'pairs'):
+        backfill_pairs(directory, state['runs'])
+
+    writer, rows, watermark = None, 0, state['watermark']
+    partials = {part: [] for part in AGGREGATE_KEYS}
+    try:
+        for attempts, watermark in store.attempts_since(state['watermark'], batch_size):
+            table = attempts_table(attempts)
+            if writer is None:
+                writer = pq.ParquetWriter(paths['attempts'] + '.tmp', ATTEMPT_SCHEMA)
+            writer.write_table(table)
+            rows += len(table)
+            for part, summary in summarize(table).items():
+                partials[part].append(summary)
+            # Fold the partials down so they stay as small as the number of questions and students
+            if len(partials['questions']) >= 16:
+                fold(partials)
+    finally:
+        if writer is not None:
+            writer.close()
+    if not rows:
+        return 0
+
+    fold(partials)
+    for part, (table,) in partials.items():
+        pq.write_table(table, paths[part] + '.tmp')
+    for path in paths.values():
+        os.replace(path + '.tmp', path)
+    storage.write_atomic(os.path.join(directory, 'state.json'),
+                         json.dumps({'runs': run, 'watermark': watermark, 'backend': backend}))
+    for part in AGGREGATE_KEYS:
+        compact(directory, part, run)
+    return rows
+
+def fold(partials):
+    """Combine each kind of partial aggregate into one table"""
+    for part, keys in AGGREGATE_KEYS.items():
+        partials[part] = [combine(partials[part], keys)]
+
+def backfill_pairs(directory, runs):
+    """Per-question and student counts for runs exported before they were kept, from their attempt files"""
+    partials = []
+    dataset = ds.dataset(run_files(directory, 'attempts'), format='parquet')
+    for batch in dataset.to_batches(columns=['problem_id', 'student', 'correct'], batch_size=SCAN_BATCH):
+        partials.append(pair_counts(answered(pa.Table.from_batches([batch]))))
+        if len(partials) >= COMPACT_EVERY:
+            partials = [combine(partials, AGGREGATE_KEYS['pairs'])]
+    if partials:
+        write_folded(directory, 'pairs', runs, combine(partials, AGGREGATE_KEYS['pairs']))
+
+# --- RUN FILES ---
+# An aggregate's files are run-NNNNN.parquet, one per run, and after a
+# compaction upto-NNNNN.parquet, the sum of runs 1 to NNNNN. Writing the
+# upto file is what completes a compaction, so a crash before the files it
+# replaces are deleted leaves them behind but never counts them twice.
+
+def run_number(name):
+    """The run a run-NNNNN or upto-NNNNN file ends with"""
+    return int(name.split('-')[1].split('.')[0])
+
+def run_files(directory, part):
+    """Paths of the files of one kind that together cover every finished run, oldest first"""
+    folder = os.path.join(directory, part)
+    if not os.path.isdir(folder):
+        return []
+    names = sorted(name for name in os.listdir(folder) if name.endswith('.parquet'))
+    folded = [name for name in names if name.startswith('upto-')][-1:]
+    start = run_number(folded[0]) if folded else 0
+    return [os.path.join(folder, name)
+            for name in folded + [name for name in names if name.startswith('run-') and run_number(name) > start]]
+
+def read_runs(directory, part):
+    """The aggregate tables of one kind that cover every finished run"""
+    return [pq.read_table(path) for path in run_files(directory, part)]
+
+def write_folded(directory, part, run, table):
+    """Save the sum of runs 1 to `run` of an aggregate, then delete the files it replaces"""
+    folder = os.path.join(directory, part)
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"upto-{run:05d}.parquet")
+    pq.write_table(table, path + '.tmp')
+    os.replace(path + '.tmp', path)
+    for name in os.listdir(folder):
+        if name.endswith('.parquet') and name != os.path.basename(path) and run_number(name) <= run:
+            os.remove(os.path.join(folder, name))
+
+def compact(directory, part, run):
+    """Sum an aggregate's files into one once COMPACT_EVERY of them have piled up"""
+    if len(run_files(directory, part)) >= COMPACT_EVERY:
+        write_folded(directory, part, run, combine(read_runs(directory, part), AGGREGATE_KEYS[part]))
+
+# --- REPORT ---
+
+def response_percentiles(questions, times):
+    """p50 and p90 response times per question, in the order of `questions`"""
+    row = pc.index_in(times['problem_id'], value_set=questions['problem_id']).to_numpy()
+    counts = np.zeros((len(questions), len(RESPONSE_EDGES) + 1), dtype=np.int64)
+    np.add.at(counts, (row, times['bucket'].to_numpy()), times['attempts'].to_numpy())
+    cumulative = np.cumsum(counts, axis=1)
+    total = cumulative[:, -1]
+    upper_edges = np.append(RESPONSE_EDGES, np.inf)
+    result = {}
+    for q in (50, 90):
+        bucket = np.argmax(cumulative >= np.ceil(total * q / 100)[:, None], axis=1)
+        result[f"response_p{q}_ms"] = pa.array(np.where(total > 0, upper_edges[bucket], np.nan), mask=total == 0)
+    return result
+
+def discrimination(questions, students, pairs):
+    """Point-biserial correlation per question between correct and the student's overall accuracy"""
+    ability = (pc.cast(students['correct'], pa.float64()).to_numpy() /
+               pc.cast(students['attempts'], pa.float64()).to_numpy())
+    row = pc.index_in(pairs['problem_id'], value_set=questions['problem_id']).to_numpy()
+    x = ability[pc.index_in(pairs['student'], value_set=students['student']).to_numpy()]
+    attempts = pc.cast(pairs['attempts'], pa.float64()).to_numpy()
+    correct = pc.cast(pairs['correct'], pa.float64()).to_numpy()
+    # attempts, correct, sum of ability, over correct, of squares
+    n, n1, s, s1, q = (np.bincount(row, weights=values, minlength=len(questions))
+                       for values in (attempts, correct, attempts * x, correct * x, attempts * x * x))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r = (n * s1 - n1 * s) / np.sqrt((n * q - s * s) * (n * n1 - n1 * n1))
+    return pa.array(r, mask=~np.isfinite(r))
+
+def report(directory):
+    """Per-question statistics over every run, also saved as question_stats.parquet"""
+    questions, times, students, pairs = (combine(read_runs(directory, part), keys)
+                                         for part, keys in AGGREGATE_KEYS.items())
+    stats = questions.append_column(
+        'accuracy', pc.divide(pc.cast(questions['correct'], pa.float64()), pc.cast(questions['attempts'], pa.float64())))
+    timed = pc.greater(questions['timed'], 0)
+    stats = stats.append_column('response_mean_ms', pc.if_else(
+        timed, pc.divide(pc.cast(questions['response_ms_sum'], pa.float64()), pc.cast(questions['timed'], pa.float64())),
+        None))
+    for name, column in response_percentiles(questions, times).items():
+        stats = stats.append_column(name, column)
+    stats = stats.append_column('discrimination', discrimination(questions, students, pairs))
+    stats = stats.drop_columns(['response_ms_sum'])
+    path = os.path.join(directory, 'question_stats.parquet')
+    pq.write_table(stats, path + '.tmp')
+    os.replace(path + '.tmp', path)
+    return stats
+
+def hardest(stats, top, min_attempts):
+    """The `top` questions with the lowest accuracy among those tried at least `min_attempts` times"""
+    tried = stats.filter(pc.greater_equal(stats['attempts'], min_attempts))
+    return tried.sort_by([('accuracy', 'ascending'), ('attempts', 'descending')]).slice(0, top)
+
+def main():
+    parser = argparse.ArgumentParser(description="Export quiz attempts to Parquet and report per-question statistics")
+    parser.add_argument('--out', default=os.environ.get('MATH_ANALYTICS_DIR', DEFAULT_DIR))
+    parser.add_argument('--top', type=int, default=15, help="hardest questions to list")
+    parser.add_argument('--min-attempts', type=int, default=20, help="attempts a question needs to be listed")
+    parser.add_argument('--batch', type=int, default=EXPORT_BATCH, help="attempts read from storage at a time")
+    args = parser.parse_args()
+
+    backend = os.environ.get('MATH_STORAGE', 'json')
+    store = storage.open_storage(backend)
+    try:
+        exported = export(store, backend, args.out, args.batch)
+    finally:
+        store.close()
+    print(f"Exported {exported} new attempts to {args.out}")
+    if not os.path.exists(os.path.join(args.out, 'questions')):
+        return
+
+    stats = report(args.out)
+    print(f"{len(stats)} questions, {pc.sum(stats['attempts']).as_py()} attempts")
+    bank = question_bank.open_bank()
+    print(f"\n{'problem':12}  {'topic':12} {'type':10} {'tries':>6} {'correct':>7} {'p50 s':>6} {'discr':>6}  question")
+    for row in hardest(stats, args.top, args.min_attempts).to_pylist():
+        question = bank.get(row['problem_id'])
+        p50 = '-' if row['response_p50_ms'] is None else f"{row['response_p50_ms'] / 1000:.1f}"
+        discr = '-' if row['discrimination'] is None else f"{row['discrimination']:+.2f}"
+        print(f"{row['problem_id']:12}  {row['topic'][:12]:12} {row['question_type'][:10]:10} {row['attempts']:>6} "
+              f"{row['accuracy']:>7.0%} {p50:>6} {discr:>6}  {question['question'][:50] if question else ''}")
+
+if __name__ == '__main__':
+    main()
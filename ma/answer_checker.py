@@ -0,0 +1,218 @@
+"""Answer checking by mathematical equivalence.
+
+Answers are parsed into small arithmetic expressions (numbers, the variables
+x, y, z, t and n, pi, sqrt/sin/cos/tan/ln/log/abs, implicit multiplication and
+^ for powers) and compared by evaluating both at the same batch of random
+sample points in one NumPy call. Answers that are not expressions, such as
+"Adjacent/Hypotenuse", fall back to the old comparison: spaces removed,
+lowercased. Comma-separated answers like "2,3" are unordered sets.
+"""
+import ast
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+
+SAMPLE_SIZE = 16
+VARIABLES = ('x', 'y', 'z', 't', 'n')
+FUNCTIONS = {'sqrt': np.sqrt, 'sin': np.sin, 'cos': np.cos, 'tan': np.tan,
+             'ln': np.log, 'log': np.log, 'abs': np.abs}
+CONSTANTS = {'pi': np.pi}
+INTEGRATION_CONSTANT = 'c'
+MAX_ANSWER_LENGTH = 200
+VERDICT_CACHE = 65_536  # (submitted, expected, type) checks remembered by verdict()
+
+_rng = np.random.default_rng(2024)
+SAMPLES = {name: _rng.uniform(-3, 3, SAMPLE_SIZE) for name in VARIABLES}
+
+Part = namedtuple('Part', 'text values places is_product')
+# text: normalized text, used when either side is not an expression
+# values: the expression evaluated at SAMPLES, or None
+# places: decimal places when the part is a plain decimal like 153.94
+# is_product: top-level multiplication, e.g. (x-3)(x+3)
+
+REPLACEMENTS = [('−', '-'), ('×', '*'), ('·', '*'), ('÷', '/'), ('π', 'pi'), ('√', 'sqrt'),
+                ('²', '^2'), ('³', '^3'), ('°', '')]
+TOKEN = re.compile(r'\d+\.?\d*|\.\d+|[a-z]+|\*\*|[-+*/^(),=]')
+DECIMAL = re.compile(r'-?\d*\.(\d+)')
+ALLOWED_NODES = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Call, ast.Name, ast.Constant, ast.Load,
+                 ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.USub, ast.UAdd)
+
+# --- PARSING ---
+
+def normalize(text):
+    """Lowercase, unify symbols, turn 'or'/'and' into commas and drop whitespace"""
+    text = text.strip().lower()
+    for old, new in REPLACEMENTS:
+        text = text.replace(old, new)
+    text = re.sub(r'\s+(?:or|and)\s+|;', ',', text)
+    return re.sub(r'\s+', '', text)
+
+def split_top_level(text):
+    """Split on commas that are not inside parentheses"""
+    parts, depth, start = [], 0, 0
+    for i, char in enumerate(text):
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return parts
+
+def split_name(run, names):
+    """Break a run of letters into known names, e.g. 'sinx' -> ['sin', 'x'], or None"""
+    tokens = []
+    while run:
+        for name in sorted(names, key=len, reverse=True):
+            if run.startswith(name):
+                tokens.append(name)
+                run = run[len(name):]
+                break
+        else:
+            return None
+    return tokens
+
+def is_number(token):
+    """True for numeric tokens such as '12', '0.5' or '.5'"""
+    return token[0].isdigit() or token[0] == '.'
+
+def to_python(text, variables):
+    """Rewrite answer text as Python expression source, or None if it is not an expression"""
+    if TOKEN.sub('', text):
+        return None
+    names = set(FUNCTIONS) | set(CONSTANTS) | set(variables)
+    tokens = []
+    for token in TOKEN.findall(text):
+        if token[0].isalpha():
+            split = split_name(token, names)
+            if split is None:
+                return None
+            tokens.extend(split)
+        elif token in (',', '='):
+            return None
+        else:
+            tokens.append(token)
+
+    # A function written without parentheses applies to the next token: sqrt3, sinx
+    expanded = []
+    i = 0
+    while i < len(tokens):
+        expanded.append(tokens[i])
+        if tokens[i] in FUNCTIONS and i + 1 < len(tokens) and tokens[i + 1] != '(':
+            expanded.extend(['(', tokens[i + 1], ')'])
+            i += 1
+        i += 1
+
+    atoms = set(variables) | set(CONSTANTS)
+    source = []
+    previous = None
+    for token in expanded:
+        starts_operand = is_number(token) or token in atoms or token in FUNCTIONS or token == '('
+        ends_operand = previous is not None and (is_number(previous) or previous in atoms or previous == ')')
+        if starts_operand and ends_operand:
+            source.append('*')  # implicit multiplication: 2x, x(x+1), (x-3)(x+3)
+        if is_number(token):
+            source.append(repr(float(token)))  # floats keep 9^9^9 from becoming a huge int
+        else:
+            source.append('**' if token == '^' else token)
+        previous = token
+    return ''.join(source)
+
+def evaluate(source, constant):
+    """Evaluate expression source at the sample points, returning (values, is_product) or None"""
+    try:
+        tree = ast.parse(source, mode='eval')
+    except SyntaxError:
+        return None
+    for node in ast.walk(tree):
+        if not isinstance(node, ALLOWED_NODES):
+            return None
+        if isinstance(node, ast.Call) and (not isinstance(node.func, ast.Name) or node.keywords
+                                           or len(node.args) != 1):
+            return None
+    namespace = {'__builtins__': {}, **FUNCTIONS, **CONSTANTS, **SAMPLES}
+    if constant:
+        namespace[INTEGRATION_CONSTANT] = 0.0
+    try:
+        with np.errstate(all='ignore'):
+            values = eval(compile(tree, '<answer>', 'eval'), namespace)
+        values = np.broadcast_to(np.asarray(values, dtype=float), (SAMPLE_SIZE,))
+    except (ArithmeticError, TypeError, ValueError):
+        return None
+    body = tree.body.operand if isinstance(tree.body, ast.UnaryOp) else tree.body
+    is_product = isinstance(body, ast.BinOp) and isinstance(body.op, (ast.Mult, ast.Pow))
+    return values, is_product
+
+def parse_answer(text, constant=False):
+    """Parse an answer into a tuple of Parts, one per comma-separated item.
+
+    With `constant`, C is accepted as a constant of integration.
+    """
+    text = normalize(text)[:MAX_ANSWER_LENGTH]
+    variables = VARIABLES + ((INTEGRATION_CONSTANT,) if constant else ())
+    parts = []
+    for item in split_top_level(text):
+        # "x=3" answers the same as "3"
+        expression = re.sub(r'^[a-z]=', '', item)
+        source = to_python(expression, variables) if expression else None
+        evaluated = evaluate(source, constant) if source else None
+        decimal = DECIMAL.fullmatch(expression)
+        if evaluated is None:
+            parts.append(Part(item, None, None, False))
+        else:
+            parts.append(Part(item, evaluated[0], len(decimal.group(1)) if decimal else None, evaluated[1]))
+    return tuple(parts)
+
+@lru_cache(maxsize=4096)
+def parse_expected(text, constant=False):
+    """parse_answer for canonical answers, which repeat across submissions"""
+    return parse_answer(text, constant)
+
+# --- COMPARISON ---
+
+def rounding_tolerance(places):
+    """Half a unit in the last place for decimals given to 2+ places, which are taken as rounded"""
+    return 0.5 * 10 ** -places if places is not None and places >= 2 else 0.0
+
+def parts_match(expected, submitted, constant):
+    """Compare one expected item with one submitted item"""
+    if expected.values is None or submitted.values is None:
+        return expected.text == submitted.text
+    defined = np.isfinite(expected.values)
+    if not defined.any() or not np.isfinite(submitted.values[defined]).all():
+        return False
+    difference = submitted.values[defined] - expected.values[defined]
+    if constant:
+        difference = difference - difference[0]
+    tolerance = max(rounding_tolerance(expected.places), rounding_tolerance(submitted.places)) + \
+        1e-9 * np.maximum(1.0, np.abs(expected.values[defined]))
+    return bool(np.all(np.abs(difference) <= tolerance))
+
+def is_correct(submitted, expected, problem_type=None):
+    """Check a submitted answer against the canonical one for a problem"""
+    constant = problem_type == 'integral'
+    expected_parts = parse_expected(expected, constant)
+    submitted_parts = parse_answer(submitted, constant)
+    if len(submitted_parts) != len(expected_parts) or not any(p.text for p in submitted_parts):
+        return False
+    if problem_type == 'factor' and not all(p.is_product for p in submitted_parts if p.values is not None):
+        return False
+    # Answers with several items are unordered sets: match each expected item to a distinct submitted one
+    unmatched = list(submitted_parts)
+    for part in expected_parts:
+        for i, candidate in enumerate(unmatched):
+            if parts_match(part, candidate, constant):
+                del unmatched[i]
+                break
+        else:
+            return False
+    return True
+
+@lru_cache(maxsize=VERDICT_CACHE)
+def verdict(submitted, expected, problem_type=None):
+    """is_correct, remembered: a class sitting one exam hands in the same answers over and over"""
+    return is_correct(submitted, expected, problem_type)
@@ -0,0 +1,419 @@
+"""Headless benchmarks for the app's hot paths and full-page reruns.
+
+Seeds synthetic students with 10, 10k and 1M quiz attempts into a throwaway
+data directory, then drives mathaa.py through Streamlit's AppTest:
+
+- micro: add_points, update_streak, check_achievements, save_user_data,
+  load_user_data and the Progress Report chart build, called directly
+  inside a script run
+- rerun: script runs: loading the student, the Dashboard, the whole Math
+  Practice page, submitting an answer (which only reruns the quiz panel and
+  sidebar stats fragments) and the Progress Report with its charts rebuilt
+- sessions: the memory held in session state by each of several sessions
+  open on Math Practice, with objects shared between sessions (catalog
+  problems, interned strings) counted once
+
+Each operation reports p50/p90/p99 latency, the p50 time spent inside the
+app's own script runs (excluding AppTest's overhead), peak traced memory and
+bytes written. Bytes written come from the process's write() calls in
+/proc/self/io, so they are only reported on Linux. Writes are synchronous
+(MATH_WRITE_BEHIND=0) so their cost lands on the operation that made them.
+
+    python benchmark.py --save-baseline baseline.json
+    python benchmark.py --compare baseline.json   # exit status 1 on a regression
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+from collections import deque
+from datetime import datetime
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mathaa.py')
+SIZES = (10, 10_000, 1_000_000)
+BACKENDS = ('json', 'sqlite')
+CHUNK = 10_000  # attempts per seeded change record
+REVIEW_CARDS = 1000  # most review cards a synthetic student has
+SESSIONS = 20  # sessions opened for the session memory report
+STUDENT = "Benchmark Student"
+
+# --- MEASURING ---
+
+def bytes_written():
+    """Bytes this process has passed to write(), or None off Linux"""
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                if line.startswith('wchar:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+def percentile(samples, q):
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+_script = {'seconds': 0.0}  # time spent in the app's script runs, fragment reruns and callbacks
+
+def record_script_run(seconds, page, status):
+    _script['seconds'] += seconds
+
+def measure(op, repeat, setup=None):
+    """Time `op` `repeat` times, then run it once more under tracemalloc for its peak memory"""
+    timings, script = [], []
+    written = 0
+    for _ in range(repeat):
+        if setup:
+            setup()
+        before = bytes_written()
+        script_before = _script['seconds']
+        start = time.perf_counter()
+        op()
+        timings.append(time.perf_counter() - start)
+        script.append(_script['seconds'] - script_before)
+        if before is not None:
+            written += bytes_written() - before
+    if setup:
+        setup()
+    tracemalloc.start()
+    op()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'n': repeat,
+            'p50_ms': percentile(timings, 50) * 1000,
+            'p90_ms': percentile(timings, 90) * 1000,
+            'p99_ms': percentile(timings, 99) * 1000,
+            'script_ms': percentile(script, 50) * 1000 if any(script) else None,
+            'peak_kb': peak / 1024,
+            'bytes_written': written // repeat if before is not None else None}
+
+# --- SYNTHETIC STUDENTS ---
+
+def synthetic_changes(entries):
+    """Change records for a student with `entries` quiz attempts, one a minute, oldest first"""
+    import achievements
+    from math_content import math_data
+
+    topics = list(math_data)
+    start = int(time.time()) - entries * 60
+    points = 0
+    completed, rollup = {}, {}
+    quiz, points_history = [], []
+    for i in range(entries):
+        ts = start + i * 60
+        topic = topics[i % len(topics)]
+        correct = i % 4 != 0
+        gained = 10 if correct else 0
+        quiz.append((ts, topic, 'solve', int(correct), gained))
+        day = rollup.setdefault(datetime.fromtimestamp(ts).strftime("%Y-%m-%d"),
+                                {'points_gained': 0, 'total_points': points, 'topics': {}})
+        day['topics'].setdefault(topic, [0, 0])[0 if correct else 1] += 1
+        if correct:
+            points += gained
+            completed[topic] = completed.get(topic, 0) + 1
+            points_history.append((ts, gained, points))
+            day['points_gained'] += gained
+            day['total_points'] = points
+        if len(quiz) == CHUNK:
+            yield {'append': {'math_quiz_history': quiz, 'points_history': points_history}}
+            quiz, points_history = [], []
+
+    user_data = {'points': points, 'level': points // 100 + 1, 'daily_streak': 1,
+                 'last_activity_date': datetime.now().strftime("%Y-%m-%d"),
+                 'problems_solved': sum(completed.values()),
+                 'math_problems_completed': completed, 'math_types_completed': {'solve': sum(completed.values())}}
+    unlocked = [rule.id for metric in achievements.RULEBOOK.metrics()
+                for rule in achievements.RULEBOOK.newly_reached(metric, achievements.metric_value(user_data, metric), ())]
+    yield {'set': {'student_name': STUDENT, 'points': points, 'level': user_data['level'], 'daily_streak': 1,
+                   'last_activity_date': user_data['last_activity_date'],
+                   'problems_solved': user_data['problems_solved']},
+           'merge': {'daily_rollup': rollup, 'math_problems_completed': completed,
+                     'math_types_completed': user_data['math_types_completed'],
+                     'review_cards': synthetic_cards(min(entries, REVIEW_CARDS), start)},
+           'append': {'math_quiz_history': quiz, 'points_history': points_history, 'achievements': unlocked}}
+
+def synthetic_cards(count, start):
+    """Review cards for `count` generated problems, spread over the topics"""
+    import numpy as np
+    import problem_generator
+    from math_content import math_data
+
+    rng = np.random.default_rng(0)
+    topics = list(math_data)
+    cards = {}
+    for i, topic in enumerate(topics):
+        for problem in problem_generator.generate_batch(topic, count // len(topics) + (i < count % len(topics)), rng):
+            cards[problem.id] = {'box': 1, 'due': start + len(cards) * 60, 'topic': topic, 'problem': problem}
+    return cards
+
+def seed_student(backend, entries):
+    """Write a synthetic student through the storage backend, as the app would have over time"""
+    import storage
+
+    store = storage.open_storage(backend)
+    for changes in synthetic_changes(entries):
+        store.save(STUDENT, changes)
+    if isinstance(store, storage.JsonLogStorage):
+        # Fold the log into a snapshot now rather than in the background
+        store._compact(store._state(STUDENT), *store._paths(STUDENT))
+    store.close()
+
+# --- MICRO BENCHMARKS (run inside the app's script context) ---
+
+def micro_script(app_path, student, repeat):
+    """Run mathaa.py once, then call its functions directly and time them"""
+    import os
+    import sys
+    sys.path.insert(0, os.path.dirname(app_path))
+    import runpy
+    import time
+    import streamlit as st
+    import achievements
+    import benchmark
+    import progress
+    import storage
+
+    app = runpy.run_path(app_path)
+    state = st.session_state
+
+    def reset_changes():
+        state.pending_changes = storage.new_changes()
+        state.announcements = []
+
+    def bump_rollup():
+        state.rollup_version += 1
+
+    def now():
+        return int(time.time())
+
+    def apply_progress(update, *args):
+        app['apply_progress'](state.user_data, update, *args)
+
+    results = {
+        'add_points': benchmark.measure(lambda: apply_progress(progress.add_points, 10, now()), repeat, reset_changes),
+        'update_streak': benchmark.measure(lambda: apply_progress(progress.update_streak, now()), repeat, reset_changes),
+        'check_achievements': benchmark.measure(
+            lambda: apply_progress(progress.check_achievements, *achievements.RULEBOOK.metrics()), repeat, reset_changes),
+        'save_user_data': benchmark.measure(app['save_user_data'], repeat,
+                                            lambda: (reset_changes(), apply_progress(progress.add_points, 10, now()))),
+        'load_user_data': benchmark.measure(lambda: app['load_user_data'](student), repeat),
+        'progress_charts': benchmark.measure(app['get_progress_charts'], repeat, bump_rollup),
+    }
+    state.benchmark = results
+
+def run_micro(repeat):
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_function(micro_script, args=(APP_PATH, STUDENT, repeat), default_timeout=600)
+    at.session_state.user_data = load_seeded()
+    at.run()
+    if at.exception:
+        raise RuntimeError(at.exception[0].value)
+    return at.session_state.benchmark
+
+def load_seeded():
+    import storage
+    store = storage.open_storage()
+    data = store.load(STUDENT)
+    store.close()
+    return data
+
+# --- RERUNS ---
+
+def run_reruns(repeat):
+    """Time script runs through AppTest, as a browser session would trigger them"""
+    from streamlit.testing.v1 import AppTest
+    import catalog
+
+    def fresh_app():
+        at = AppTest.from_file(APP_PATH, default_timeout=600).run()
+        at.sidebar.text_input[0].input(STUDENT)
+        return at
+
+    def select(at, page):
+        if not at.sidebar.selectbox:
+            at.run()  # a submit only reruns the quiz panel and sidebar stats, so the menu isn't in its tree
+        at.sidebar.selectbox(key="menu_selector").select(page).run()
+
+    apps = {}
+
+    def new_session():
+        apps['at'] = fresh_app()
+
+    def submit_setup():
+        at = apps['at']
+        select(at, "📐 Math Practice")
+        [b for b in at.button if b.label.startswith("Generate")][0].click().run()
+        problem = catalog.CATALOG.get(at.session_state.math_quiz['problem'])
+        at.text_input(key="math_answer_input").input(problem.answer)
+        apps['submit'] = [b for b in at.button if b.label == "Submit Answer"][0]
+
+    def report_setup():
+        at = apps['at']
+        select(at, "📊 Progress Report")
+        at.session_state.rollup_version += 1
+
+    new_session()
+    apps['at'].run()
+    results = {'rerun: load student': measure(lambda: apps['at'].run(), repeat, new_session)}
+    select(apps['at'], "🏠 Dashboard")
+    results['rerun: dashboard'] = measure(lambda: apps['at'].run(), repeat)
+    select(apps['at'], "📐 Math Practice")
+    results['rerun: math practice'] = measure(lambda: apps['at'].run(), repeat)
+    results['rerun: submit answer'] = measure(lambda: apps['submit'].click().run(), repeat, submit_setup)
+    results['rerun: progress report'] = measure(lambda: apps['at'].run(), repeat, report_setup)
+    return results
+
+# --- SESSION MEMORY ---
+
+def deep_size(value, seen):
+    """Bytes of a value and everything it holds, skipping objects already in `seen` (which it adds to)"""
+    size = 0
+    stack = [value]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, (type, types.ModuleType, types.FunctionType)):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+            stack.extend(obj)
+        elif hasattr(obj, '__dict__'):
+            stack.append(vars(obj))
+        elif hasattr(obj, '__slots__'):
+            stack.extend(getattr(obj, name) for name in obj.__slots__ if hasattr(obj, name))
+    return size
+
+def run_sessions(count):
+    """Session state bytes of the first session and, on average, of each further one"""
+    from streamlit.testing.v1 import AppTest
+
+    seen = set()
+    sizes = []
+    apps = []  # kept open, as concurrent sessions would be
+    for _ in range(count):
+        at = AppTest.from_file(APP_PATH, default_timeout=600).run()
+        at.sidebar.text_input[0].input(STUDENT).run()
+        at.sidebar.selectbox(key="menu_selector").select("📐 Math Practice").run()
+        [b for b in at.button if b.label.startswith("Generate")][0].click().run()
+        apps.append(at)
+        sizes.append(deep_size(dict(at.session_state.items()), seen))
+    return {'sessions': count, 'first_kb': sizes[0] / 1024,
+            'each_kb': sum(sizes[1:]) / max(1, count - 1) / 1024}
+
+# --- RUNNING AND COMPARING ---
+
+def run(sizes, backends, repeat, reruns, sessions):
+    """Benchmark every backend and size; returns lists of result rows and session memory rows"""
+    import streamlit as st
+
+    rows, memory = [], []
+    for backend in backends:
+        for size in sizes:
+            directory = tempfile.mkdtemp(prefix='math-bench-')
+            os.environ.update({'MATH_STORAGE': backend, 'MATH_WRITE_BEHIND': '0',
+                               'MATH_DATA_DIR': os.path.join(directory, 'data'),
+                               'MATH_DB_PATH': os.path.join(directory, 'math.db'),
+                               'MATH_LEADERBOARD_FILE': os.path.join(directory, 'leaderboard.json'),
+                               'MATH_QUESTION_BANK': os.path.join(directory, 'questions.db')})
+            try:
+                start = time.perf_counter()
+                seed_student(backend, size)
+                print(f"seeded {backend} student with {size} attempts in {time.perf_counter() - start:.1f} s",
+                      file=sys.stderr)
+                st.cache_resource.clear()  # pick up this run's storage settings
+                results = run_micro(repeat)
+                results.update(run_reruns(reruns))
+                rows += [dict(backend=backend, size=size, op=op, **stats) for op, stats in results.items()]
+                if sessions:
+                    memory.append(dict(backend=backend, size=size, **run_sessions(sessions)))
+            finally:
+                st.cache_resource.clear()
+                shutil.rmtree(directory, ignore_errors=True)
+    return rows, memory
+
+def print_table(rows, baseline=None):
+    header = f"{'backend':8} {'size':>9} {'operation':28} {'n':>4} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} " \
+             f"{'script ms':>9} {'peak KB':>9} {'written B':>10}"
+    if baseline:
+        header += f" {'p50 vs base':>12}"
+    print(header)
+    for row in rows:
+        written = '-' if row['bytes_written'] is None else row['bytes_written']
+        script = '-' if row['script_ms'] is None else f"{row['script_ms']:.2f}"
+        line = f"{row['backend']:8} {row['size']:>9} {row['op']:28} {row['n']:>4} {row['p50_ms']:>9.2f} " \
+               f"{row['p90_ms']:>9.2f} {row['p99_ms']:>9.2f} {script:>9} " \
+               f"{row['peak_kb']:>9.0f} {written:>10}"
+        base = baseline.get((row['backend'], row['size'], row['op'])) if baseline else None
+        if base:
+            line += f" {row['p50_ms'] / base['p50_ms'] - 1:>+11.0%}"
+        print(line)
+
+def print_memory(memory):
+    print(f"\n{'backend':8} {'size':>9} {'sessions':>8} {'first KB':>9} {'each KB':>9}")
+    for row in memory:
+        print(f"{row['backend']:8} {row['size']:>9} {row['sessions']:>8} {row['first_kb']:>9.0f} {row['each_kb']:>9.0f}")
+
+def regressions(rows, baseline, threshold):
+    """Rows whose p50 latency or peak memory grew by more than `threshold` over the baseline"""
+    found = []
+    for row in rows:
+        base = baseline.get((row['backend'], row['size'], row['op']))
+        if base is None:
+            continue
+        for metric in ('p50_ms', 'peak_kb'):
+            if base[metric] > 0 and row[metric] > base[metric] * (1 + threshold):
+                found.append(f"{row['backend']} {row['size']} {row['op']}: {metric} "
+                             f"{base[metric]:.2f} -> {row[metric]:.2f}")
+    return found
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', default=','.join(map(str, SIZES)),
+                        help="comma-separated quiz attempts per synthetic student")
+    parser.add_argument('--backends', default=','.join(BACKENDS))
+    parser.add_argument('--repeat', type=int, default=50, help="calls per micro benchmark")
+    parser.add_argument('--reruns', type=int, default=10, help="script runs per rerun benchmark")
+    parser.add_argument('--sessions', type=int, default=SESSIONS, help="sessions for the memory report, 0 to skip it")
+    parser.add_argument('--save-baseline', metavar='PATH', help="write the results to PATH")
+    parser.add_argument('--compare', metavar='PATH', help="compare with a saved baseline")
+    parser.add_argument('--threshold', type=float, default=0.25, help="allowed slowdown before failing --compare")
+    args = parser.parse_args()
+
+    rows, memory = run([int(size) for size in args.sizes.split(',')], args.backends.split(','),
+                       args.repeat, args.reruns, args.sessions)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = {(row['backend'], row['size'], row['op']): row for row in json.load(f)['results']}
+    print_table(rows, baseline)
+    print_memory(memory)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({'created': datetime.now().isoformat(timespec='seconds'),
+                       'python': platform.python_version(), 'machine': platform.platform(),
+                       'results': rows, 'sessions': memory}, f, indent=1)
+        print(f"Baseline saved to {args.save_baseline}")
+    if baseline:
+        found = regressions(rows, baseline, args.threshold)
+        for line in found:
+            print(f"REGRESSION {line}")
+        sys.exit(1 if found else 0)
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.dirname(APP_PATH))
+    import profiling
+    profiling.on_run(record_script_run)
+    main()
@@ -0,0 +1,211 @@
+"""Grade exported paper quizzes offline.
+
+    python bulk_grade.py submissions.csv graded.csv [--workers 4] [--chunk 2000]
+
+The input CSV has a header row with student, question_id (an id from the
+question bank) and answer columns, and optionally timestamp (epoch seconds
+or YYYY-MM-DD HH:MM:SS) and response_ms (time taken to answer). Answers
+are checked with the same equivalence rules as Submit Answer, in chunks
+spread over a process pool. Each graded row updates the student's saved
+progress with the same points, streak and achievement rules as the app
+(see progress.py), and is written to the output CSV with correct and
+points columns as soon as its chunk is done, in input order.
+
+Memory stays flat however long the input is: only a few chunks per worker
+are in flight and only recently seen students are kept loaded. With the
+JSON backend, run it while the app is stopped; the SQLite backend can be
+shared with a running app. The leaderboard file is updated too, merged with
+what is already in it; a running app takes the new entries over at its
+next save of the standings, a few seconds after any student's score changes.
+"""
+import argparse
+import csv
+import os
+import sys
+import time
+from collections import OrderedDict, deque
+from multiprocessing import Pool
+
+import catalog
+import history
+import leaderboard
+import progress
+import question_bank
+import storage
+
+CHUNK_SIZE = 2000
+IN_FLIGHT_PER_WORKER = 2
+STUDENT_CACHE = 1024  # students kept loaded between chunks
+REPORT_EVERY = 10  # chunks between progress lines
+
+# --- GRADING (in worker processes) ---
+
+_worker = {}
+
+def init_worker(bank_path):
+    import answer_checker
+    _worker['bank'] = question_bank.open_bank(bank_path)
+    _worker['checker'] = answer_checker
+
+def grade_chunk(rows):
+    """Grade a chunk of submission rows: (question or None, correct) per row"""
+    bank, checker = _worker['bank'], _worker['checker']
+    questions = {}
+    results = []
+    for row in rows:
+        question_id = row.get('question_id', '')
+        if question_id not in questions:
+            questions[question_id] = bank.get(question_id)
+        question = questions[question_id]
+        if question is None:
+            results.append((None, False))
+        else:
+            results.append((question, checker.is_correct(row.get('answer') or '', question['answer'], question['type'])))
+    return results
+
+def graded_chunks(chunks, workers, bank_path):
+    """Grade chunks across a process pool, yielding (chunk, results) in input order.
+
+    At most IN_FLIGHT_PER_WORKER chunks per worker are handed out ahead of
+    the one being consumed, so a long input is never read in all at once.
+    """
+    with Pool(workers, initializer=init_worker, initargs=(bank_path,)) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append((chunk, pool.apply_async(grade_chunk, (chunk,))))
+            if len(pending) >= workers * IN_FLIGHT_PER_WORKER:
+                chunk, result = pending.popleft()
+                yield chunk, result.get()
+        while pending:
+            chunk, result = pending.popleft()
+            yield chunk, result.get()
+
+def read_chunks(reader, size):
+    """Rows of a CSV reader in lists of `size`"""
+    chunk = []
+    for row in reader:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+# --- STUDENT RECORDS ---
+
+class Students:
+    """Recently seen students' data and unsaved changes; the least recent is saved and dropped when full"""
+
+    def __init__(self, store, standings, capacity=STUDENT_CACHE):
+        self.store = store
+        self.standings = standings
+        self.capacity = capacity
+        self._loaded = OrderedDict()  # name -> (user_data, changes)
+        self.updated = set()
+
+    def get(self, name):
+        if name in self._loaded:
+            self._loaded.move_to_end(name)
+            return self._loaded[name]
+        if len(self._loaded) >= self.capacity:
+            self._save(*self._loaded.popitem(last=False))
+        changes = storage.new_changes()
+        user_data = self.store.load(name)
+        if user_data is None:
+            user_data = storage.default_user_data(name)
+            progress.record_change(changes, 'set', 'student_name', name)
+        self._loaded[name] = (user_data, changes)
+        return self._loaded[name]
+
+    def _save(self, name, entry):
+        user_data, changes = entry
+        if any(changes.values()):
+            self.store.save(name, changes)
+            self.standings.update_student(user_data)
+            self.updated.add(name)
+
+    def save_all(self):
+        while self._loaded:
+            self._save(*self._loaded.popitem(last=False))
+
+def row_timestamp(row, default):
+    """A row's timestamp column as epoch seconds"""
+    value = (row.get('timestamp') or '').strip()
+    if not value:
+        return default
+    return int(value) if value.isdigit() else history.parse_ts(value)
+
+def row_response_ms(row):
+    """A row's response_ms column, 0 if it has none"""
+    value = (row.get('response_ms') or '').strip()
+    return int(float(value)) if value else 0
+
+# --- MAIN ---
+
+def grade_file(input_path, output_path, workers, chunk_size, bank_path, save=True):
+    """Grade a submissions file and return a summary dict"""
+    store = storage.open_storage() if save else None
+    standings = leaderboard.open_leaderboard() if save else None
+    students = Students(store, standings) if save else None
+    summary = {'rows': 0, 'correct': 0, 'incorrect': 0, 'unknown_question': 0, 'achievements': 0}
+    started = time.perf_counter()
+    now = int(time.time())
+    with open(input_path, newline='', encoding='utf-8') as infile, \
+            open(output_path, 'w', newline='', encoding='utf-8') as outfile:
+        reader = csv.DictReader(infile)
+        writer = csv.DictWriter(outfile, fieldnames=list(reader.fieldnames or []) + ['correct', 'points', 'topic'])
+        writer.writeheader()
+        for number, (chunk, results) in enumerate(graded_chunks(read_chunks(reader, chunk_size), workers, bank_path), 1):
+            by_student = {}
+            for row, (question, correct) in zip(chunk, results):
+                if question is None:
+                    summary['unknown_question'] += 1
+                    writer.writerow(dict(row, correct='unknown question', points=0, topic=''))
+                    continue
+                summary['correct' if correct else 'incorrect'] += 1
+                writer.writerow(dict(row, correct=int(correct), points=question['points'] if correct else 0,
+                                     topic=question['topic']))
+                name = (row.get('student') or '').strip()
+                if save and name:
+                    by_student.setdefault(name, []).append((row, question, correct))
+            # One lookup per student per chunk, their rows applied in input order
+            for name, graded in by_student.items():
+                user_data, changes = students.get(name)
+                for row, question, correct in graded:
+                    messages = progress.record_attempt(user_data, changes, catalog.to_problem(question),
+                                                       question['topic'], correct, row_timestamp(row, now),
+                                                       row_response_ms(row))
+                    summary['achievements'] += sum(message.startswith("🏆") for message in messages)
+            summary['rows'] += len(chunk)
+            outfile.flush()
+            if number % REPORT_EVERY == 0:
+                elapsed = time.perf_counter() - started
+                print(f"{summary['rows']} rows, {summary['rows'] / elapsed:.0f} rows/sec", file=sys.stderr)
+    if save:
+        students.save_all()
+        store.close()
+        standings.close()
+        summary['students'] = len(students.updated)
+    summary['seconds'] = time.perf_counter() - started
+    summary['rows_per_sec'] = summary['rows'] / summary['seconds'] if summary['seconds'] else 0.0
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Grade a CSV of quiz submissions against the question bank")
+    parser.add_argument('input', help="CSV with student, question_id, answer and optional timestamp columns")
+    parser.add_argument('output', help="where to write the graded rows")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--chunk', type=int, default=CHUNK_SIZE, help="rows per task sent to a worker")
+    parser.add_argument('--bank', default=os.environ.get('MATH_QUESTION_BANK', question_bank.DEFAULT_PATH))
+    parser.add_argument('--grade-only', action='store_true', help="write grades without updating student progress")
+    args = parser.parse_args()
+
+    summary = grade_file(args.input, args.output, args.workers, args.chunk, args.bank, save=not args.grade_only)
+    print(f"Graded {summary['rows']} rows in {summary['seconds']:.1f} s ({summary['rows_per_sec']:.0f} rows/sec): "
+          f"{summary['correct']} correct, {summary['incorrect']} incorrect, "
+          f"{summary['unknown_question']} with an unknown question_id")
+    if 'students' in summary:
+        print(f"Updated {summary['students']} students, {summary['achievements']} achievements unlocked")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Problems shared by every session.
+
+A problem is a Problem record: a named tuple of id, type, question, answer,
+points and image, with the short, often repeated strings interned. The
+process keeps one catalog of them (CATALOG). A session's quiz holds only the
+small integer handle of its problem, and review cards loaded for any number
+of students point at the same record for the same problem, instead of each
+session carrying its own copy of every problem dict.
+
+The catalog keeps the most recent CAPACITY problems; a handle older than
+that no longer resolves, and the session simply picks a new problem.
+"""
+import sys
+import threading
+from collections import namedtuple
+
+from question_bank import problem_id
+
+CAPACITY = 100_000  # problems kept, about 40 MB with generated question texts
+
+Problem = namedtuple('Problem', ('id', 'type', 'question', 'answer', 'points', 'image'))
+
+def intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+def to_problem(value):
+    """A Problem from a problem dict, its saved list form or a Problem"""
+    if isinstance(value, Problem):
+        return value
+    if isinstance(value, dict):
+        value = (value.get('id') or problem_id(value['type'], value['question']), value['type'], value['question'],
+                 value['answer'], value['points'], value.get('image'))
+    pid, problem_type, question, answer, points, image = value
+    return Problem(intern(pid), intern(problem_type), question, intern(answer), int(points), intern(image or None))
+
+class Catalog:
+    """Problem records under integer handles, one record per problem id"""
+
+    def __init__(self, capacity=CAPACITY):
+        self.capacity = capacity
+        self._records = {}  # handle -> Problem, oldest first
+        self._handles = {}  # problem id -> handle
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._records)
+
+    def _add(self, problem):
+        problem = to_problem(problem)
+        with self._lock:
+            handle = self._handles.get(problem.id)
+            if handle is not None:
+                if self._records[handle] != problem:
+                    self._records[handle] = problem  # edited in the question bank
+                return handle, self._records[handle]
+            handle = self._next
+            self._next += 1
+            self._records[handle] = problem
+            self._handles[problem.id] = handle
+            if len(self._records) > self.capacity:
+                oldest = next(iter(self._records))
+                del self._handles[self._records.pop(oldest).id]
+            return handle, problem
+
+    def add(self, problem):
+        """Handle of a problem, adding it (or its edited version) if the catalog doesn't hold it"""
+        return self._add(problem)[0]
+
+    def get(self, handle):
+        """The Problem for a handle, or None if it has been dropped"""
+        return self._records.get(handle)
+
+    def record(self, problem):
+        """The shared Problem record for a problem"""
+        return self._add(problem)[1]
+
+CATALOG = Catalog()
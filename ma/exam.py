@@ -0,0 +1,65 @@
+"""Timed exams: a fixed set of problems answered on one sheet and scored together.
+
+An exam is drawn from its code (any text; the app defaults to the date),
+the grade and the number of questions. The same three always give the same
+problems in the same order, so a whole class can sit one exam and a draw
+can be reproduced later. Problems are generated rather than picked from the
+question bank, so the code alone fixes them; they are spread evenly over the
+topics that have templates for the grade, without repeats where the
+templates allow.
+
+The answer sheet is checked in one pass and applied to the student with
+progress.record_exam as a single change record. Only a student's first
+sitting of an exam counts: the result screen shows the answers, so a
+retake is scored for practice but earns nothing. The exams a student has
+been scored on are kept in user data as exam_id()s.
+"""
+import hashlib
+
+import numpy as np
+
+import answer_checker
+import problem_generator
+from math_content import math_data
+
+EXAM_SIZES = (10, 25, 50, 100)
+SECONDS_PER_QUESTION = 90
+GRACE_SECONDS = 60  # hand-ins this late still count, allowing for the last answer being typed
+
+def exam_seed(code, grade, size):
+    """Seed for an exam's draw, the same on every server"""
+    return int(hashlib.sha1(f"{code}|{grade}|{size}".encode()).hexdigest()[:16], 16)
+
+def exam_id(code, grade, size):
+    """How user data remembers an exam, e.g. '2026-10-17|grade 7|25'"""
+    return f"{code}|grade {grade}|{size}"
+
+def exam_topics(grade):
+    """Topics an exam for a grade draws from"""
+    return [topic for topic in math_data if problem_generator.templates_for(topic, grade)]
+
+def draw_exam(code, grade, size):
+    """The exam's (topic, problem) pairs in question order"""
+    rng = np.random.default_rng(exam_seed(code, grade, size))
+    topics = exam_topics(grade)
+    counts = [size // len(topics) + (i < size % len(topics)) for i in range(len(topics))]
+    drawn = []
+    for topic, count in zip([topics[i] for i in rng.permutation(len(topics))], counts):
+        # Draw extra so repeats can be dropped; small templates (special angles) may still repeat
+        batch = problem_generator.generate_batch(topic, 3 * count, rng, grade)
+        unique = list({problem.id: problem for problem in batch}.values())
+        picked = unique[:count] + batch[:max(0, count - len(unique))]
+        drawn += [(topic, problem) for problem in picked]
+    return [drawn[i] for i in rng.permutation(len(drawn))]
+
+def time_limit(size):
+    """Seconds allowed for an exam of `size` questions"""
+    return size * SECONDS_PER_QUESTION
+
+def score(questions, answers):
+    """(problem, topic, correct) per question; a blank answer is wrong without being checked"""
+    graded = []
+    for (topic, problem), answer in zip(questions, answers):
+        answer = answer.strip()
+        graded.append((problem, topic, bool(answer) and answer_checker.verdict(answer, problem.answer, problem.type)))
+    return graded
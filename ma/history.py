@@ -0,0 +1,141 @@
+"""Compact, bounded activity history.
+
+points_history and math_quiz_history keep only a recent window of detailed
+entries, stored column by column in arrays: epoch-second timestamps, small
+integer codes for repeated strings like topic, question type and problem
+id, and plain integers for points and response times. Entries older than
+the window are dropped; they stay represented in the per-day totals of the
+daily rollup, which the Progress Report charts read.
+"""
+import os
+from array import array
+from datetime import datetime
+
+HISTORY_WINDOW = int(os.environ.get('MATH_HISTORY_WINDOW', '500'))  # detailed entries kept per history
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# (name, typecode) per column; 'code' columns hold indexes into a list of strings
+COLUMNS = {
+    'points_history': (('ts', 'q'), ('points_gained', 'l'), ('total_points', 'q')),
+    'math_quiz_history': (('ts', 'q'), ('topic', 'code'), ('question_type', 'code'),
+                          ('correct', 'b'), ('points', 'l'), ('problem_id', 'code'), ('response_ms', 'l')),
+}
+
+# Values for columns added after entries were saved without them; 0 ms means the response time is unknown
+MISSING = {'problem_id': '', 'response_ms': 0}
+
+def format_ts(ts):
+    """Epoch seconds as the timestamp text shown to students"""
+    return datetime.fromtimestamp(ts).strftime(TIMESTAMP_FORMAT)
+
+def parse_ts(text):
+    """Timestamp text back to epoch seconds"""
+    return int(datetime.strptime(text, TIMESTAMP_FORMAT).timestamp())
+
+def legacy_row(key, entry):
+    """Row for an entry saved as a dict before history became columnar"""
+    if key == 'points_history':
+        return parse_ts(entry['date']), entry['points_gained'], entry['total_points']
+    return (parse_ts(entry['timestamp']), entry['topic'], entry['question_type'],
+            int(entry['result'] == 'Correct'), entry['points'],
+            entry.get('problem_id') or MISSING['problem_id'], entry.get('response_ms') or MISSING['response_ms'])
+
+def pad_row(key, row):
+    """An entry saved before the newer columns existed, filled out with their MISSING values"""
+    columns = COLUMNS[key]
+    if len(row) >= len(columns):
+        return row
+    return tuple(row) + tuple(MISSING[name] for name, _ in columns[len(row):])
+
+class History:
+    """Recent entries of one history, held column by column in arrays.
+
+    Appending trims back to `window` entries once twice that many have piled
+    up, so the cost of trimming is spread over many appends.
+    """
+
+    def __init__(self, key, window=HISTORY_WINDOW):
+        self.key = key
+        self.columns = COLUMNS[key]
+        self.window = window
+        self.data = {name: array('H' if kind == 'code' else kind) for name, kind in self.columns}
+        self.codes = {name: [] for name, kind in self.columns if kind == 'code'}
+        self._lookup = {name: {} for name in self.codes}
+
+    def __len__(self):
+        return len(self.data['ts'])
+
+    def _encode(self, name, value):
+        lookup = self._lookup[name]
+        if value not in lookup:
+            lookup[value] = len(self.codes[name])
+            self.codes[name].append(value)
+        return lookup[value]
+
+    def append(self, row):
+        """Add one entry given as a tuple in column order (or a legacy dict)"""
+        if isinstance(row, dict):
+            row = legacy_row(self.key, row)
+        else:
+            row = pad_row(self.key, row)
+        for (name, kind), value in zip(self.columns, row):
+            self.data[name].append(self._encode(name, value) if kind == 'code' else value)
+        if len(self) > 2 * self.window:
+            self.trim()
+
+    def extend(self, rows):
+        """Add several entries, oldest first"""
+        for row in rows:
+            self.append(row)
+
+    def trim(self):
+        """Drop all but the newest `window` entries"""
+        excess = len(self) - self.window
+        if excess > 0:
+            for column in self.data.values():
+                del column[:excess]
+        for name, codes in self.codes.items():
+            if len(codes) > 2 * self.window:
+                self._recode(name)
+
+    def _recode(self, name):
+        """Drop strings no longer used by any entry, e.g. the ids of problems answered long ago"""
+        values, codes = self.data[name], self.codes[name]
+        self.codes[name], self._lookup[name] = [], {}
+        self.data[name] = array('H', (self._encode(name, codes[code]) for code in values))
+
+    def rows(self, start=0):
+        """Entries from index `start` on, oldest first, as tuples in column order"""
+        columns = [(self.data[name], self.codes.get(name)) for name, _ in self.columns]
+        for i in range(start, len(self)):
+            yield tuple(values[i] if codes is None else codes[values[i]] for values, codes in columns)
+
+    def latest(self, n):
+        """The last n entries, newest first, as tuples in column order"""
+        columns = [(self.data[name], self.codes.get(name)) for name, _ in self.columns]
+        for i in range(len(self) - 1, max(len(self) - n, 0) - 1, -1):
+            yield tuple(values[i] if codes is None else codes[values[i]] for values, codes in columns)
+
+    def to_json(self):
+        """Compact form for snapshots: string tables plus one list per column"""
+        return {'codes': self.codes, 'columns': {name: values.tolist() for name, values in self.data.items()}}
+
+def load_history(key, saved):
+    """Rebuild a History from its to_json() form or from a legacy list of dicts"""
+    loaded = History(key)
+    if isinstance(saved, dict):
+        codes = saved['codes']
+        for name, kind in loaded.columns:
+            if name not in saved['columns']:
+                # A column added since this was saved
+                missing = loaded._encode(name, MISSING[name]) if kind == 'code' else MISSING[name]
+                loaded.data[name].extend([missing] * len(saved['columns']['ts']))
+                continue
+            values = saved['columns'][name]
+            if kind == 'code':
+                values = [loaded._encode(name, codes[name][code]) for code in values]
+            loaded.data[name].extend(values)
+    else:
+        loaded.extend(saved)
+    loaded.trim()
+    return loaded
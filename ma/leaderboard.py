@@ -0,0 +1,248 @@
+"""Class leaderboards shared by every session in a server process.
+
+Boards: overall points, problems solved per topic, and points earned this
+week (from the daily rollup). Each board keeps its students in rank order
+in an indexable skip list, so a score change, a student's rank and the top
+k are all O(log n) (plus k), instead of re-sorting everyone on a rerun.
+
+Standings are saved to MATH_LEADERBOARD_FILE (default math_leaderboard.json)
+a few seconds after they change and reloaded on start; a student's entries
+are refreshed from their own data whenever it changes or is loaded. Each
+save first merges in what other processes (another server, bulk_grade.py)
+saved since, so they can share the file.
+"""
+import atexit
+import json
+import math
+import os
+import random
+import threading
+from datetime import date, datetime, timedelta
+
+from math_content import math_data
+from storage import write_atomic
+
+DEFAULT_PATH = 'math_leaderboard.json'
+SAVE_DELAY = 5.0  # seconds between a change and saving the standings
+MAX_LEVELS = 24  # enough for millions of students
+
+# --- RANKED SCORES ---
+
+class _Node:
+    __slots__ = ('value', 'next', 'width')
+
+    def __init__(self, value, levels):
+        self.value = value
+        self.next = [None] * levels
+        self.width = [1] * levels
+
+_END = _Node((math.inf,), 0)  # sorts after every (-score, name)
+
+class RankedScores:
+    """Students' scores in rank order, in an indexable skip list.
+
+    Entries are (-score, name), so the highest score comes first and ties
+    are broken by name. Each link stores how many entries it skips, which
+    lets a search count the entries ahead of it.
+    """
+
+    def __init__(self):
+        self.scores = {}
+        self._head = _Node(None, MAX_LEVELS)
+        self._head.next = [_END] * MAX_LEVELS
+
+    def __len__(self):
+        return len(self.scores)
+
+    def _insert(self, value):
+        chain = [None] * MAX_LEVELS
+        steps_at_level = [0] * MAX_LEVELS
+        node = self._head
+        for level in reversed(range(MAX_LEVELS)):
+            while node.next[level].value <= value:
+                steps_at_level[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+        levels = min(MAX_LEVELS, 1 - int(math.log(1.0 - random.random(), 2.0)))
+        new = _Node(value, levels)
+        steps = 0
+        for level in range(levels):
+            before = chain[level]
+            new.next[level] = before.next[level]
+            before.next[level] = new
+            new.width[level] = before.width[level] - steps
+            before.width[level] = steps + 1
+            steps += steps_at_level[level]
+        for level in range(levels, MAX_LEVELS):
+            chain[level].width[level] += 1
+
+    def _remove(self, value):
+        chain = [None] * MAX_LEVELS
+        node = self._head
+        for level in reversed(range(MAX_LEVELS)):
+            while node.next[level].value < value:
+                node = node.next[level]
+            chain[level] = node
+        target = chain[0].next[0]
+        for level in range(len(target.next)):
+            before = chain[level]
+            before.width[level] += target.width[level] - 1
+            before.next[level] = target.next[level]
+        for level in range(len(target.next), MAX_LEVELS):
+            chain[level].width[level] -= 1
+
+    def set(self, name, score):
+        """Set a student's score; a score of 0 takes them off the board"""
+        old = self.scores.get(name)
+        if old == score or (old is None and not score):
+            return False
+        if old is not None:
+            self._remove((-old, name))
+            del self.scores[name]
+        if score:
+            self._insert((-score, name))
+            self.scores[name] = score
+        return True
+
+    def rank(self, name):
+        """1-based rank of a student, or None if they aren't on the board"""
+        if name not in self.scores:
+            return None
+        value = (-self.scores[name], name)
+        node, position = self._head, 0
+        for level in reversed(range(MAX_LEVELS)):
+            while node.next[level].value < value:
+                position += node.width[level]
+                node = node.next[level]
+        return position + 1
+
+    def top(self, k):
+        """The first k entries as (name, score)"""
+        entries = []
+        node = self._head.next[0]
+        while node is not _END and len(entries) < k:
+            entries.append((node.value[1], -node.value[0]))
+            node = node.next[0]
+        return entries
+
+# --- BOARDS ---
+
+def week_board(day=None):
+    """Board name for the ISO week containing `day`, e.g. 'week:2026-W42'"""
+    year, week, _ = (day or date.today()).isocalendar()
+    return f"week:{year}-W{week:02d}"
+
+def weekly_points(user_data, day=None):
+    """Points earned from Monday of `day`'s week up to that day, from the daily rollup"""
+    day = day or date.today()
+    rollup = user_data['daily_rollup']
+    monday = day - timedelta(days=day.weekday())
+    return sum(rollup.get((monday + timedelta(days=i)).strftime("%Y-%m-%d"), {}).get('points_gained', 0)
+               for i in range((day - monday).days + 1))
+
+class Leaderboard:
+    """All boards, saved to a JSON file in the background"""
+
+    def __init__(self, path=DEFAULT_PATH, save_delay=SAVE_DELAY):
+        self.path = path
+        self.save_delay = save_delay
+        self.boards = {}
+        self._lock = threading.Lock()
+        self._timer = None
+        self._changed = set()  # (board, student) entries set since the last save
+        self._closed = False
+        for board, scores in self._read().items():
+            for name, score in scores.items():
+                self._board(board).set(name, score)
+        atexit.register(self.save)
+
+    def _read(self):
+        """Boards in the standings file, or {} if there is none yet"""
+        try:
+            with open(self.path) as f:
+                return json.load(f)['boards']
+        except FileNotFoundError:
+            return {}
+
+    def _board(self, board):
+        if board not in self.boards:
+            self.boards[board] = RankedScores()
+        return self.boards[board]
+
+    def update_student(self, user_data, day=None):
+        """Refresh a student's entries on every board from their data"""
+        name = user_data.get('student_name')
+        if not name:
+            return
+        week = week_board(day)
+        scores = {'points': user_data['points'], week: weekly_points(user_data, day)}
+        for topic in math_data:
+            scores[f"topic:{topic}"] = user_data['math_problems_completed'].get(topic, 0)
+        with self._lock:
+            # Last week's board is finished once a new week starts
+            for board in [b for b in self.boards if b.startswith('week:') and b != week]:
+                del self.boards[board]
+            for board, score in scores.items():
+                if self._board(board).set(name, score):
+                    self._changed.add((board, name))
+            if self._changed:
+                self._schedule_save()
+
+    def top(self, board, k=10):
+        """The top k students on a board as (rank, name, score)"""
+        with self._lock:
+            return [(i + 1, name, score) for i, (name, score) in enumerate(self._board(board).top(k))]
+
+    def rank(self, board, name):
+        """A student's (rank, number of students) on a board; rank is None if they aren't on it"""
+        with self._lock:
+            scores = self._board(board)
+            return scores.rank(name), len(scores)
+
+    def _schedule_save(self):
+        if self._timer is None and self.save_delay is not None and not self._closed:
+            self._timer = threading.Timer(self.save_delay, self.save)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def save(self):
+        """Write the standings file, merged with what other processes saved to it.
+
+        Entries set here since the last save win; every other entry in the
+        file is taken over, so students graded by bulk_grade.py show up in a
+        running app and stay. Two saves at the same moment can still drop
+        one side's new entries, until those students next change.
+        """
+        saved = self._read()
+        with self._lock:
+            self._timer = None
+            weeks = sorted(board for board in [*saved, *self.boards] if board.startswith('week:'))
+            for board, scores in saved.items():
+                if board.startswith('week:') and board != weeks[-1]:
+                    continue  # a finished week
+                for name, score in scores.items():
+                    if (board, name) not in self._changed:
+                        self._board(board).set(name, score)
+            for board in [b for b in self.boards if b.startswith('week:') and b != weeks[-1]]:
+                del self.boards[board]
+            self._changed.clear()
+            text = json.dumps({'saved': datetime.now().isoformat(timespec='seconds'),
+                               'boards': {board: scores.scores for board, scores in self.boards.items()}},
+                              separators=(',', ':'))
+        write_atomic(self.path, text)
+
+    def close(self):
+        """Save pending changes now and stop saving in the background or at exit"""
+        with self._lock:
+            self._closed = True
+            timer, self._timer = self._timer, None
+            pending = bool(self._changed)
+        if timer is not None:
+            timer.cancel()
+        atexit.unregister(self.save)
+        if pending:
+            self.save()
+
+def open_leaderboard(path=None):
+    """The leaderboard saved at MATH_LEADERBOARD_FILE"""
+    return Leaderboard(path or os.environ.get('MATH_LEADERBOARD_FILE', DEFAULT_PATH))
@@ -0,0 +1,404 @@
+"""Load test: simulated students against one local Streamlit server process.
+
+    python loadtest.py [--students 1,5,10,25,50] [--duration 30] [--think 1.0] [--correct 0.7]
+                       [--storage json] [--sync-writes] [--out results.json]
+
+Starts mathaa.py with `streamlit run` on a free port, with its student data,
+leaderboard and question bank in a throwaway directory. For each number of
+students in turn, that many virtual students connect over the same
+websocket protocol as a browser (protobuf BackMsg/ForwardMsg on
+/_stcore/stream) and, for --duration seconds, sign in, open Math Practice,
+generate problems, submit right or wrong answers and every few problems
+open the Progress Report, pausing about --think seconds between actions.
+Right answers come from an answer book built from the question bank and a
+large sample of generated problems, topped up with the answers the app
+reveals after a wrong one.
+
+Each step reports reruns/sec, p50/p95/p99 latency per action (from sending
+the widget change to the end of the run it causes), the server's RSS and
+the bytes it wrote, and how long its saves took, read from the app's own
+metrics (MATH_METRICS_PORT). Every student has their own files under the
+data directory (or rows in the SQLite database). Saves normally go through
+the write-behind queue; with --sync-writes (MATH_WRITE_BEHIND=0) each save
+is written before its rerun ends, so the save times show how storage holds
+up as students are added, next to the rerun latencies.
+The students run in this process on the same machine as the server, so
+keep an eye on this process's CPU when pushing N high.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import websockets
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mathaa.py')
+STEPS = (1, 5, 10, 25, 50)
+DURATION = 30  # seconds per step
+THINK = 1.0  # mean seconds between a student's actions
+CORRECT = 0.7  # share of answers meant to be right
+REPORT_EVERY = 5  # problems between visits to the Progress Report
+SAMPLE = 20_000  # generated problems per topic in the answer book
+TIMEOUT = 60  # seconds to wait for a run to finish
+SAVE_SPAN = 'save_user_data'
+
+PRACTICE = "📐 Math Practice"
+REPORT = "📊 Progress Report"
+FINISHED = {ForwardMsg.FINISHED_SUCCESSFULLY, ForwardMsg.FINISHED_FRAGMENT_RUN_SUCCESSFULLY}
+REVEALED = re.compile(r"The correct answer was: \*\*(.+)\*\*")
+
+# --- SERVER ---
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def start_server(directory, storage, sync_writes, port, metrics_port):
+    """Run the app under `streamlit run` with its files in `directory`; returns the process once it is healthy"""
+    env = dict(os.environ, MATH_STORAGE=storage, MATH_WRITE_BEHIND='0' if sync_writes else '1',
+               MATH_METRICS_PORT=str(metrics_port),
+               MATH_DATA_DIR=os.path.join(directory, 'data'), MATH_DB_PATH=os.path.join(directory, 'math.db'),
+               MATH_LEADERBOARD_FILE=os.path.join(directory, 'leaderboard.json'),
+               MATH_QUESTION_BANK=os.path.join(directory, 'questions.db'))
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'streamlit', 'run', APP_PATH, '--server.port', str(port), '--server.headless', 'true',
+         '--server.fileWatcherType', 'none', '--browser.gatherUsageStats', 'false'],
+        env=env, cwd=directory, stdout=subprocess.DEVNULL, stderr=open(os.path.join(directory, 'server.log'), 'w'))
+    deadline = time.monotonic() + TIMEOUT
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"server exited with status {server.returncode}, see {directory}/server.log")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1) as response:
+                if response.read() == b'ok':
+                    return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError("server did not become healthy")
+
+def proc_value(pid, name, field):
+    """A number from /proc/<pid>/<name>, or None off Linux"""
+    try:
+        with open(f'/proc/{pid}/{name}') as f:
+            for line in f:
+                if line.startswith(field):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+def server_rss_mb(pid):
+    kb = proc_value(pid, 'status', 'VmRSS:')
+    return None if kb is None else kb / 1024
+
+def server_written(pid):
+    return proc_value(pid, 'io', 'wchar:')
+
+def scrape_span(metrics_port, span):
+    """Bucket counts, sum and count of one span's histogram from the app's /metrics"""
+    with urllib.request.urlopen(f"http://127.0.0.1:{metrics_port}/metrics", timeout=5) as response:
+        text = response.read().decode('utf-8')
+    buckets, total, count = [], 0.0, 0
+    for line in text.splitlines():
+        if f'span="{span}"' not in line:
+            continue
+        name, value = line.rsplit(' ', 1)
+        if name.startswith('math_span_seconds_bucket'):
+            bound = re.search(r'le="([^"]+)"', name).group(1)
+            buckets.append((float(bound), int(value)))
+        elif name.startswith('math_span_seconds_sum'):
+            total = float(value)
+        elif name.startswith('math_span_seconds_count'):
+            count = int(value)
+    return {'buckets': buckets, 'sum': total, 'count': count}
+
+def span_summary(before, after):
+    """Mean and bucketed p99 in ms of the span calls made between two scrapes"""
+    count = after['count'] - before['count']
+    if not count:
+        return {'saves': 0, 'save_mean_ms': None, 'save_p99_ms': None}
+    earlier = dict(before['buckets'])
+    p99 = None
+    for bound, cumulative in after['buckets']:
+        if cumulative - earlier.get(bound, 0) >= 0.99 * count:
+            p99 = bound * 1000
+            break
+    return {'saves': count, 'save_mean_ms': (after['sum'] - before['sum']) / count * 1000, 'save_p99_ms': p99}
+
+# --- ANSWER BOOK ---
+
+def build_answer_book(bank_path):
+    """Question text -> answer for the hand-written bank and a sample of generated problems"""
+    import numpy as np
+    import problem_generator
+    import question_bank
+
+    question_bank.open_bank(bank_path)  # create it now so the server finds it ready
+    conn = sqlite3.connect(bank_path)
+    book = dict(conn.execute('SELECT question, answer FROM questions'))
+    conn.close()
+    rng = np.random.default_rng()
+    for topic in problem_generator.TEMPLATES:
+        book.update((problem.question, problem.answer)
+                    for problem in problem_generator.generate_batch(topic, SAMPLE, rng))
+    return book
+
+# --- VIRTUAL STUDENTS ---
+
+class Session:
+    """One browser tab: the widgets it has seen, the values it has set, and its websocket"""
+
+    def __init__(self, url):
+        self.url = url
+        self.ws = None
+        self.widgets = {}  # label -> (widget id, fragment id)
+        self.values = {}  # widget id -> (WidgetState field, value) to send with every run
+        self.elements = []  # elements drawn by the latest run
+        self.errors = 0
+
+    async def connect(self):
+        self.ws = await websockets.connect(self.url, subprotocols=['streamlit'], max_size=None)
+
+    async def close(self):
+        if self.ws is not None:
+            await self.ws.close()
+
+    def widget(self, prefix):
+        """Id and fragment of the widget whose label starts with `prefix`"""
+        for label, found in self.widgets.items():
+            if label.startswith(prefix):
+                return found
+        raise LookupError(f"no widget labelled {prefix!r} on the page")
+
+    async def run(self, prefix=None, value=None):
+        """Change a widget (set a value, or click a button when value is None) and wait for the runs it causes"""
+        message = BackMsg()
+        state = message.rerun_script
+        state.SetInParent()  # an empty client state still makes this a rerun request
+        trigger = None
+        if prefix is not None:
+            widget_id, fragment_id = self.widget(prefix)
+            if value is None:
+                trigger = widget_id
+            else:
+                self.values[widget_id] = ('string_value', value)
+            if fragment_id:
+                state.fragment_id = fragment_id
+        for widget_id, (field, stored) in self.values.items():
+            setattr(state.widget_states.widgets.add(id=widget_id), field, stored)
+        if trigger is not None:
+            state.widget_states.widgets.add(id=trigger, trigger_value=True)
+        self.elements = []
+        await self.ws.send(message.SerializeToString())
+        await asyncio.wait_for(self._receive_run(), TIMEOUT)
+
+    async def _receive_run(self):
+        finished = False
+        while True:
+            forward = ForwardMsg()
+            forward.ParseFromString(await self.ws.recv())
+            kind = forward.WhichOneof('type')
+            if kind == 'delta' and forward.delta.WhichOneof('type') == 'new_element':
+                self._element(forward.delta.new_element, forward.delta.fragment_id)
+            elif kind == 'script_finished':
+                finished = finished or forward.script_finished in FINISHED
+                if forward.script_finished == ForwardMsg.FINISHED_WITH_COMPILE_ERROR:
+                    self.errors += 1
+                    return
+            elif kind == 'session_status_changed' and not forward.session_status_changed.script_is_running \
+                    and finished:
+                return
+
+    def _element(self, element, fragment_id):
+        kind = element.WhichOneof('type')
+        proto = getattr(element, kind)
+        self.elements.append((kind, proto))
+        if kind == 'exception':
+            self.errors += 1
+        if getattr(proto, 'id', '') and hasattr(proto, 'label'):  # charts have ids too
+            self.widgets[proto.label] = (proto.id, fragment_id)
+            if getattr(proto, 'set_value', False):
+                self.values.pop(proto.id, None)  # the app set it; the server's value stands
+
+    def latex(self):
+        """Body of the latest LaTeX element, e.g. the question"""
+        for kind, proto in reversed(self.elements):
+            if kind == 'markdown' and proto.element_type == proto.LATEX:
+                return proto.body.strip().strip('$').strip()
+        return None
+
+    def alerts(self):
+        return [proto.body for kind, proto in self.elements if kind == 'alert']
+
+async def timed(stats, action, coroutine):
+    start = time.perf_counter()
+    await coroutine
+    stats.setdefault(action, []).append(time.perf_counter() - start)
+
+async def student(url, name, book, stats, stop_at, think, correct_share):
+    """One virtual student practicing until `stop_at`"""
+    session = Session(url)
+
+    async def pause():
+        await asyncio.sleep(random.uniform(0.5, 1.5) * think)
+
+    try:
+        await session.connect()
+        await timed(stats, 'open app', session.run())
+        await pause()
+        await timed(stats, 'sign in', session.run("Enter Your Name", name))
+        await pause()
+        await timed(stats, 'math practice', session.run("📋 Select Menu", PRACTICE))
+        problems = 0
+        while time.monotonic() < stop_at:
+            await pause()
+            await timed(stats, 'generate', session.run("Generate New"))
+            question = session.latex()
+            if question is None:
+                continue  # no problem for this topic and grade
+            right = question in book and random.random() < correct_share
+            await pause()
+            await timed(stats, 'type answer', session.run("Your Answer", book[question] if right else "no idea"))
+            await timed(stats, f"submit {'right' if right else 'wrong'}", session.run("Submit Answer"))
+            for alert in session.alerts():
+                revealed = REVEALED.search(alert)
+                if revealed:
+                    book[question] = revealed.group(1)
+            problems += 1
+            if problems % REPORT_EVERY == 0:
+                await pause()
+                await timed(stats, 'progress report', session.run("📋 Select Menu", REPORT))
+                await pause()
+                await timed(stats, 'math practice', session.run("📋 Select Menu", PRACTICE))
+    except (OSError, LookupError, asyncio.TimeoutError, websockets.ConnectionClosed) as e:
+        stats.setdefault('failed', []).append(repr(e))
+    finally:
+        stats.setdefault('errors', []).append(session.errors)
+        await session.close()
+
+# --- RAMP ---
+
+def percentile(samples, q):
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+async def sample_rss(pid, peak, stop):
+    while not stop.is_set():
+        rss = server_rss_mb(pid)
+        if rss is not None:
+            peak['rss_mb'] = max(peak.get('rss_mb', 0), rss)
+        await asyncio.sleep(0.5)
+
+async def run_step(url, students, book, args, server, step):
+    """Run `students` students for args.duration seconds; returns the step's stats"""
+    stats = {}
+    peak = {}
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(sample_rss(server.pid, peak, stop))
+    stop_at = time.monotonic() + args.duration
+    started, cpu = time.perf_counter(), time.process_time()
+    await asyncio.gather(*(student(url, f"Load Student {step}-{i}", book, stats, stop_at, args.think, args.correct)
+                           for i in range(students)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await sampler
+    return stats, elapsed, (time.process_time() - cpu) / elapsed, peak.get('rss_mb')
+
+def summarize(students, stats, elapsed, client_cpu, rss_mb, written, saves):
+    actions = {action: {'n': len(samples),
+                        'p50_ms': percentile(samples, 50) * 1000,
+                        'p95_ms': percentile(samples, 95) * 1000,
+                        'p99_ms': percentile(samples, 99) * 1000}
+               for action, samples in sorted(stats.items()) if action not in ('failed', 'errors')}
+    return dict(students=students, seconds=elapsed, client_cpu=client_cpu,
+                reruns_per_sec=sum(action['n'] for action in actions.values()) / elapsed,
+                rss_mb=rss_mb, written_kb=None if written is None else written / 1024,
+                app_errors=sum(stats.get('errors', [])), failed=stats.get('failed', []),
+                actions=actions, **saves)
+
+def print_step(row):
+    written = '-' if row['written_kb'] is None else f"{row['written_kb']:.0f}"
+    rss = '-' if row['rss_mb'] is None else f"{row['rss_mb']:.0f}"
+    mean = '-' if row['save_mean_ms'] is None else f"{row['save_mean_ms']:.1f}"
+    p99 = '-' if row['save_p99_ms'] is None else f"<={row['save_p99_ms']:.0f}"
+    print(f"\n{row['students']} students: {row['reruns_per_sec']:.1f} reruns/sec, server RSS {rss} MB, "
+          f"{written} KB written, {row['saves']} saves (mean {mean} ms, p99 {p99} ms), "
+          f"{row['app_errors']} app errors, {len(row['failed'])} students failed, "
+          f"load test client at {row['client_cpu']:.0%} CPU")
+    print(f"  {'action':16} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for action, stats in row['actions'].items():
+        print(f"  {action:16} {stats['n']:>6} {stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f}")
+    for failure in row['failed'][:3]:
+        print(f"  failed: {failure}")
+
+async def ramp(args, directory):
+    port, metrics_port = free_port(), free_port()
+    book = build_answer_book(os.path.join(directory, 'questions.db'))
+    server = start_server(directory, args.storage, args.sync_writes, port, metrics_port)
+    url = f"ws://127.0.0.1:{port}/_stcore/stream"
+    rows = []
+    try:
+        for step, students in enumerate(args.students):
+            if step == 0:
+                # The app starts its metrics server on its first run
+                warm_up = Session(url)
+                await warm_up.connect()
+                await warm_up.run()
+                await warm_up.close()
+            written = server_written(server.pid)
+            before = scrape_span(metrics_port, SAVE_SPAN)
+            stats, elapsed, client_cpu, rss_mb = await run_step(url, students, book, args, server, step)
+            after = scrape_span(metrics_port, SAVE_SPAN)
+            written = None if written is None else server_written(server.pid) - written
+            rows.append(summarize(students, stats, elapsed, client_cpu, rss_mb, written, span_summary(before, after)))
+            print_step(rows[-1])
+    finally:
+        server.terminate()
+        server.wait()
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--students', default=','.join(map(str, STEPS)), help="comma-separated students per step")
+    parser.add_argument('--duration', type=float, default=DURATION, help="seconds per step")
+    parser.add_argument('--think', type=float, default=THINK, help="mean seconds between a student's actions")
+    parser.add_argument('--correct', type=float, default=CORRECT, help="share of answers meant to be right")
+    parser.add_argument('--storage', default='json', choices=('json', 'sqlite'))
+    parser.add_argument('--sync-writes', action='store_true', help="save before each rerun ends, not in the background")
+    parser.add_argument('--out', metavar='PATH', help="also write the results as JSON to PATH")
+    parser.add_argument('--keep', action='store_true', help="keep the data directory and server log")
+    args = parser.parse_args()
+    args.students = [int(students) for students in args.students.split(',')]
+
+    directory = tempfile.mkdtemp(prefix='math-load-')
+    try:
+        rows = asyncio.run(ramp(args, directory))
+    finally:
+        if args.keep:
+            print(f"\nData and server log kept in {directory}")
+        else:
+            shutil.rmtree(directory, ignore_errors=True)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({'storage': args.storage, 'sync_writes': args.sync_writes, 'duration': args.duration,
+                       'think': args.think, 'steps': rows},
+                      f, indent=1)
+        print(f"Results saved to {args.out}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""Static content for the app: the hand-written problem bank and the daily challenges.
+
+Kept in its own module so it is built once per server process and shared by
+every session, instead of being rebuilt on each script rerun.
+"""
+
+# --- MATH DATABASE ---
+math_data = {
+    "Algebra": [
+        {"type": "solve", "question": "If $3x + 7 = 19$, what is $x$?", "answer": "4", "points": 10, "image": "algebra_graph.png"},
+        {"type": "simplify", "question": "Simplify: $5(2x - 3) - 4x$", "answer": "6x-15", "points": 15, "image": None},
+        {"type": "solve", "question": "Solve for $y$: $\\frac{y}{2} - 5 = 1$", "answer": "12", "points": 10, "image": None},
+        {"type": "factor", "question": "Factor: $x^2 - 9$", "answer": "(x-3)(x+3)", "points": 15, "image": None},
+        {"type": "solve", "question": "Solve the quadratic equation: $x^2 - 5x + 6 = 0$", "answer": "2,3", "points": 20, "image": None}
+    ],
+    "Geometry": [
+        {"type": "area", "question": "What is the area of a rectangle with length 8 and width 4? (Number only)", "answer": "32", "points": 10, "image": "rectangle_diagram.png"},
+        {"type": "perimeter", "question": "Find the perimeter of a triangle with sides 5, 12, and 13. (Number only)", "answer": "30", "points": 10, "image": "triangle_diagram.png"},
+        {"type": "angle", "question": "If two angles of a triangle are $60^{\\circ}$ and $40^{\\circ}$, what is the third angle? (Number only)", "answer": "80", "points": 15, "image": None},
+        {"type": "volume", "question": "What is the volume of a cube with side length 3? (Number only)", "answer": "27", "points": 15, "image": "cube_diagram.png"},
+        {"type": "area", "question": "What is the area of a circle with radius 7? (Use π and round to 2 decimals)", "answer": "153.94", "points": 20, "image": "circle_diagram.png"}
+    ],
+    "Trigonometry": [
+        {"type": "ratio", "question": "The definition of $\\cos(\\theta)$ is: (Adjacent/Hypotenuse, Opposite/Hypotenuse, Opposite/Adjacent)", "answer": "Adjacent/Hypotenuse", "points": 20, "image": "trig_triangle.png"},
+        {"type": "value", "question": "What is the value of $\\sin(30^{\\circ})$? (Fraction: 1/2 or decimal: 0.5)", "answer": "0.5", "points": 25, "image": None},
+        {"type": "value", "question": "What is the value of $\\tan(45^{\\circ})$? (Number only)", "answer": "1", "points": 25, "image": None},
+        {"type": "identity", "question": "What is the Pythagorean identity? ($\\sin^2(\\theta) + \\cos^2(\\theta)$ = ?)", "answer": "1", "points": 30, "image": None}
+    ],
+    "Calculus": [
+        {"type": "derivative", "question": "Find the derivative of $f(x) = 3x^2 + 2x - 5$", "answer": "6x+2", "points": 25, "image": None},
+        {"type": "integral", "question": "Find the integral of $2x$ with respect to $x$", "answer": "x^2", "points": 25, "image": None},
+        {"type": "limit", "question": "Find the limit: $\\lim_{x \\to 2} (x^2 + 3)$", "answer": "7", "points": 20, "image": None}
+    ],
+    "Statistics": [
+        {"type": "mean", "question": "Find the mean of: 5, 7, 9, 11, 13", "answer": "9", "points": 15, "image": None},
+        {"type": "probability", "question": "What is the probability of getting heads when flipping a fair coin? (Fraction or decimal)", "answer": "0.5", "points": 15, "image": None}
+    ]
+}
+
+# --- DAILY MATH CHALLENGES ---
+daily_math_challenges = {
+    "Monday": {"topic": "Algebra", "task": "Solve 3 algebra problems"},
+    "Tuesday": {"topic": "Geometry", "task": "Complete 2 geometry exercises"},
+    "Wednesday": {"topic": "Trigonometry", "task": "Master trigonometric identities"},
+    "Thursday": {"topic": "Calculus", "task": "Practice derivatives and integrals"},
+    "Friday": {"topic": "Statistics", "task": "Solve probability problems"},
+    "Saturday": {"topic": "Mixed", "task": "Challenge yourself with mixed problems"},
+    "Sunday": {"topic": "Review", "task": "Review all math topics learned this week"}
+}
@@ -1,11 +1,23 @@
+import profiling
+profiling.start_run()
 import streamlit as st
-import pandas as pd
+from datetime import datetime
+import achievements
+import activity
+import catalog
 import random
-import json
-from datetime import datetime, timedelta
-import time
-import os
-import plotly.express as px
+import history
+import leaderboard
+import progress
+import question_bank
+import scheduler
+import storage
+from math_content import math_data, daily_math_challenges
+profiling.mark("imports")
+
+# Heavy modules (pandas, plotly, NumPy and the problem generator / answer
+# checker built on it) are imported by the code that needs them, so the
+# Dashboard doesn't pay for them.
 
 # --- PAGE CONFIGURATION ---
 st.set_page_config(
@@ -15,49 +27,55 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# --- MATH DATABASE ---
-math_data = {
-    "Algebra": [
-        {"type": "solve", "question": "If $3x + 7 = 19$, what is $x$?", "answer": "4", "points": 10, "image": "algebra_graph.png"},
-        {"type": "simplify", "question": "Simplify: $5(2x - 3) - 4x$", "answer": "6x-15", "points": 15, "image": None},
-        {"type": "solve", "question": "Solve for $y$: $\\frac{y}{2} - 5 = 1$", "answer": "12", "points": 10, "image": None},
-        {"type": "factor", "question": "Factor: $x^2 - 9$", "answer": "(x-3)(x+3)", "points": 15, "image": None},
-        {"type": "solve", "question": "Solve the quadratic equation: $x^2 - 5x + 6 = 0$", "answer": "2,3", "points": 20, "image": None}
-    ],
-    "Geometry": [
-        {"type": "area", "question": "What is the area of a rectangle with length 8 and width 4? (Number only)", "answer": "32", "points": 10, "image": "rectangle_diagram.png"},
-        {"type": "perimeter", "question": "Find the perimeter of a triangle with sides 5, 12, and 13. (Number only)", "answer": "30", "points": 10, "image": "triangle_diagram.png"},
-        {"type": "angle", "question": "If two angles of a triangle are $60^{\\circ}$ and $40^{\\circ}$, what is the third angle? (Number only)", "answer": "80", "points": 15, "image": None},
-        {"type": "volume", "question": "What is the volume of a cube with side length 3? (Number only)", "answer": "27", "points": 15, "image": "cube_diagram.png"},
-        {"type": "area", "question": "What is the area of a circle with radius 7? (Use π and round to 2 decimals)", "answer": "153.94", "points": 20, "image": "circle_diagram.png"}
-    ],
-    "Trigonometry": [
-        {"type": "ratio", "question": "The definition of $\\cos(\\theta)$ is: (Adjacent/Hypotenuse, Opposite/Hypotenuse, Opposite/Adjacent)", "answer": "Adjacent/Hypotenuse", "points": 20, "image": "trig_triangle.png"},
-        {"type": "value", "question": "What is the value of $\\sin(30^{\\circ})$? (Fraction: 1/2 or decimal: 0.5)", "answer": "0.5", "points": 25, "image": None},
-        {"type": "value", "question": "What is the value of $\\tan(45^{\\circ})$? (Number only)", "answer": "1", "points": 25, "image": None},
-        {"type": "identity", "question": "What is the Pythagorean identity? ($\\sin^2(\\theta) + \\cos^2(\\theta)$ = ?)", "answer": "1", "points": 30, "image": None}
-    ],
-    "Calculus": [
-        {"type": "derivative", "question": "Find the derivative of $f(x) = 3x^2 + 2x - 5$", "answer": "6x+2", "points": 25, "image": None},
-        {"type": "integral", "question": "Find the integral of $2x$ with respect to $x$", "answer": "x^2", "points": 25, "image": None},
-        {"type": "limit", "question": "Find the limit: $\\lim_{x \\to 2} (x^2 + 3)$", "answer": "7", "points": 20, "image": None}
-    ],
-    "Statistics": [
-        {"type": "mean", "question": "Find the mean of: 5, 7, 9, 11, 13", "answer": "9", "points": 15, "image": None},
-        {"type": "probability", "question": "What is the probability of getting heads when flipping a fair coin? (Fraction or decimal)", "answer": "0.5", "points": 15, "image": None}
-    ]
-}
-
-# --- DAILY MATH CHALLENGES ---
-daily_math_challenges = {
-    "Monday": {"topic": "Algebra", "task": "Solve 3 algebra problems"},
-    "Tuesday": {"topic": "Geometry", "task": "Complete 2 geometry exercises"},
-    "Wednesday": {"topic": "Trigonometry", "task": "Master trigonometric identities"},
-    "Thursday": {"topic": "Calculus", "task": "Practice derivatives and integrals"},
-    "Friday": {"topic": "Statistics", "task": "Solve probability problems"},
-    "Saturday": {"topic": "Mixed", "task": "Challenge yourself with mixed problems"},
-    "Sunday": {"topic": "Review", "task": "Review all math topics learned this week"}
-}
+# --- PROBLEM POOL ---
+
+GRADES = ["Grade 7", "Grade 8", "Grade 9", "Grade 10", "Grade 11", "Grade 12"]
+BANK_SHARE = 0.25  # share of new problems drawn from the question bank rather than generated
+
+@st.cache_resource
+def get_problem_pool():
+    """Generated problems shared by every session"""
+    import problem_generator  # NumPy is only needed once someone practices
+    return problem_generator.ProblemPool()
+
+@st.cache_resource
+def get_question_bank():
+    """Hand-written questions on disk, shared by every session"""
+    return question_bank.open_bank()
+
+def current_grade():
+    """The student's grade as a number, e.g. 9 for Grade 9"""
+    return int(st.session_state.user_data['current_grade'].split()[-1])
+
+def practice_topics(grade):
+    """Topics that have problems for a grade, generated or from the question bank"""
+    import problem_generator
+    return [topic for topic in math_data
+            if problem_generator.templates_for(topic, grade) or get_question_bank().count(topic, grade)]
+
+def fresh_problem(topic):
+    """A new problem for the student's grade: sometimes from the question bank, otherwise generated"""
+    grade = current_grade()
+    problem = get_question_bank().random_problem(topic, grade) if random.random() < BANK_SHARE else None
+    return problem or get_problem_pool().next(topic, grade) or get_question_bank().random_problem(topic, grade)
+
+def get_scheduler():
+    """The current student's review scheduler, built from their saved cards"""
+    if 'scheduler' not in st.session_state:
+        st.session_state.scheduler = scheduler.Scheduler(st.session_state.user_data['review_cards'])
+    return st.session_state.scheduler
+
+def start_problem(topics):
+    """Show the next problem for one of `topics`: a review that is due, else a fresh one"""
+    problem, topic = get_scheduler().next(topics, int(datetime.now().timestamp()), fresh_problem)
+    if problem is None:
+        st.warning(f"No {topic} problems for {st.session_state.user_data['current_grade']} yet.")
+        return
+    st.session_state.math_quiz['active'] = True
+    st.session_state.math_quiz['current_topic'] = topic
+    st.session_state.math_quiz['problem'] = catalog.CATALOG.add(problem)  # a handle, not a copy of the problem
+    st.session_state.math_quiz['user_answer'] = ''
+    st.session_state.math_quiz['shown_at'] = datetime.now().timestamp()
 
 # --- UTILITY FUNCTIONS ---
 
@@ -66,122 +84,416 @@ def get_daily_challenge():
     today = datetime.now().strftime("%A")
     return daily_math_challenges.get(today, {"topic": "General", "task": "Practice math problems today!"})
 
-def update_streak():
-    """Update the daily streak counter"""
-    today = datetime.now().date()
-    last_date = st.session_state.user_data['last_activity_date']
-    
-    if last_date:
-        last_date = datetime.strptime(last_date, "%Y-%m-%d").date()
-        if today == last_date + timedelta(days=1):
-            st.session_state.user_data['daily_streak'] += 1
-            check_achievements()
-        elif today > last_date + timedelta(days=1):
-            st.session_state.user_data['daily_streak'] = 1
-    else:
-        st.session_state.user_data['daily_streak'] = 1
-    
-    st.session_state.user_data['last_activity_date'] = today.strftime("%Y-%m-%d")
-
-def add_points(points):
-    """Add points and check for level up"""
-    st.session_state.user_data['points'] += points
-    
-    # Record points for graphing
-    st.session_state.user_data['points_history'].append({
-        'date': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        'points_gained': points,
-        'total_points': st.session_state.user_data['points']
-    })
-    
-    # Level up every 100 points
-    new_level = st.session_state.user_data['points'] // 100 + 1
-    if new_level > st.session_state.user_data['level']:
-        st.session_state.user_data['level'] = new_level
-        st.balloons()
-        st.sidebar.success(f"🎉 Level Up! You are now Level {new_level}!")
-    check_achievements()
-
-def check_achievements():
-    """Check and unlock math achievements"""
-    achievements = st.session_state.user_data['achievements']
-    points = st.session_state.user_data['points']
-    streak = st.session_state.user_data['daily_streak']
-    math_problems = st.session_state.user_data['math_problems_completed']
-    total_math_problems = sum(math_problems.values())
-    
-    # Point-based achievements
-    if points >= 50 and "50_points" not in achievements:
-        achievements.append("50_points")
-        st.sidebar.success("🏆 Achievement Unlocked: 50 Points!")
-    
-    if points >= 100 and "100_points" not in achievements:
-        achievements.append("100_points")
-        st.sidebar.success("🏆 Achievement Unlocked: Century Scorer!")
-    
-    # Streak-based achievements
-    if streak >= 3 and "3_day_streak" not in achievements:
-        achievements.append("3_day_streak")
-        st.sidebar.success("🏆 Achievement Unlocked: 3-Day Streak!")
-    
-    if streak >= 7 and "7_day_streak" not in achievements:
-        achievements.append("7_day_streak")
-        st.sidebar.success("🏆 Achievement Unlocked: Weekly Warrior!")
-    
-    # Math-specific achievements
-    if total_math_problems >= 10 and "10_math_problems" not in achievements:
-        achievements.append("10_math_problems")
-        st.sidebar.success("🏆 Achievement Unlocked: Math Beginner!")
-    
-    if total_math_problems >= 25 and "25_math_problems" not in achievements:
-        achievements.append("25_math_problems")
-        st.sidebar.success("🏆 Achievement Unlocked: Math Enthusiast!")
-    
-    if total_math_problems >= 50 and "50_math_problems" not in achievements:
-        achievements.append("50_math_problems")
-        st.sidebar.success("🏆 Achievement Unlocked: Math Master!")
-
+def apply_progress(user_data, update, *args):
+    """Run a progress update (see progress.py) on the current student's data and announce what it unlocked"""
+    level = user_data['level']
+    for message in update(user_data, st.session_state.pending_changes, *args):
+        announce(message)
+    if user_data['level'] > level:
+        st.session_state.celebrate = True
+    st.session_state.rollup_version += 1
+    get_leaderboard().update_student(user_data)
+
+def show_unlocked(user_data, metric, unit):
+    """List the student's achievements for a metric from the rules table; returns (value, next rule)"""
+    value = achievements.metric_value(user_data, metric)
+    for rule in achievements.RULEBOOK.rules_for(metric):
+        if rule.id in user_data['achievements']:
+            st.success(f"✅ {rule.label} ({rule.threshold} {unit})")
+    return value, achievements.RULEBOOK.next_rule(metric, value)
+
+def announce(message):
+    """Queue a sidebar message (level up, achievement) for the next render"""
+    st.session_state.announcements.append(message)
+
+def set_feedback(kind, message):
+    """Keep a result message, e.g. for a submitted answer, to show after the rerun"""
+    st.session_state.feedback = (kind, message)
+
+def show_feedback():
+    """Display and clear feedback left by the previous run"""
+    feedback = st.session_state.pop('feedback', None)
+    if feedback:
+        kind, message = feedback
+        getattr(st, kind)(message)
+
+# --- PERSISTENCE ---
+
+@st.cache_resource(on_release=lambda standings: standings.close())
+def get_leaderboard():
+    """Class standings shared by every session in this server process"""
+    return leaderboard.open_leaderboard()
+
+@st.cache_resource(on_release=lambda store: store.close())
+def get_storage():
+    """Storage backend shared by every session in this server process"""
+    return storage.open_storage()
+
+def record_change(op, key, value):
+    """Queue a change to user data so the next save persists it"""
+    progress.record_change(st.session_state.pending_changes, op, key, value)
+
+@profiling.span("save_user_data")
 def save_user_data():
-    """Save user data to JSON file"""
+    """Persist the pending changes for the current student"""
+    student = st.session_state.user_data['student_name']
+    changes = st.session_state.pending_changes
+    if not student or not any(changes.values()):
+        return
     try:
-        with open('math_user_data.json', 'w') as f:
-            json.dump(st.session_state.user_data, f, indent=4)
+        get_storage().save(student, changes)
+        st.session_state.pending_changes = storage.new_changes()
     except Exception as e:
+        # Nothing was saved or queued: the changes stay pending for the next save
         st.error(f"Error saving data: {e}")
 
-def load_user_data():
-    """Load user data from JSON file"""
+@profiling.span("load_user_data")
+def load_user_data(student):
+    """Load a student's saved data, or None if they are new"""
     try:
-        if os.path.exists('math_user_data.json'):
-            with open('math_user_data.json', 'r') as f:
-                return json.load(f)
+        return get_storage().load(student)
     except Exception as e:
         st.error(f"Error loading data: {e}")
     return None
 
+def get_progress_charts():
+    """Progress Report chart data, rebuilt from the daily rollup only after new activity"""
+    charts = st.session_state.get('progress_charts')
+    if charts is not None and charts['version'] == st.session_state.rollup_version:
+        return charts
+    charts = build_progress_charts()
+    st.session_state.progress_charts = charts
+    return charts
+
+@profiling.span("build_progress_charts")
+def build_progress_charts():
+    """Chart data for the Progress Report from the daily rollup and topic counts"""
+    import pandas as pd
+    import plotly.express as px
+    profiling.mark("import pandas + plotly")
+    
+    rollup = st.session_state.user_data['daily_rollup']
+    days = sorted(rollup)
+    charts = {'version': st.session_state.rollup_version, 'points': None, 'topics': None, 'accuracy': None}
+    
+    if days:
+        charts['points'] = pd.DataFrame({
+            'date': pd.to_datetime(days).date,
+            'total_points': [rollup[day]['total_points'] for day in days]
+        })
+    
+    math_completed = st.session_state.user_data['math_problems_completed']
+    if math_completed:
+        math_df = pd.DataFrame(list(math_completed.items()), columns=['Topic', 'Problems Completed'])
+        
+        # Use Plotly for a better Pie Chart visualization
+        charts['topics'] = px.pie(math_df, 
+                                  values='Problems Completed', 
+                                  names='Topic', 
+                                  title='Distribution of Completed Math Problems by Topic',
+                                  color_discrete_sequence=px.colors.sequential.Viridis)
+    
+    accuracy = {}
+    for day in days:
+        for topic, (correct, incorrect) in rollup[day]['topics'].items():
+            totals = accuracy.setdefault(topic, [0, 0])
+            totals[0] += correct
+            totals[1] += incorrect
+    if accuracy:
+        charts['accuracy'] = pd.DataFrame.from_dict(accuracy, orient='index', columns=['Correct', 'Incorrect'])
+    return charts
+
+CALENDAR_SHADES = ["#ebedf0", "#9be9a8", "#40c463", "#30a14e", "#216e39"]
+
+def activity_calendar_html(user_data, today):
+    """GitHub-style calendar of the last year: active days from the bitmap, shaded by that day's attempts"""
+    rollup = user_data['daily_rollup']
+    columns = []
+    for week in activity.calendar(user_data['active_days'], today):
+        cells = []
+        for cell in week:
+            if cell is None:
+                cells.append('<div style="width:11px;height:11px"></div>')
+                continue
+            day, active = cell
+            key = day.strftime("%Y-%m-%d")
+            attempts = sum(map(sum, rollup[key]['topics'].values())) if key in rollup else 0
+            shade = min(1 + attempts // 5, 4) if active else 0
+            cells.append(f'<div title="{key}: {attempts} attempts" style="width:11px;height:11px;'
+                         f'border-radius:2px;background:{CALENDAR_SHADES[shade]}"></div>')
+        columns.append(f'<div style="display:flex;flex-direction:column;gap:2px">{"".join(cells)}</div>')
+    return f'<div style="display:flex;gap:2px;overflow-x:auto">{"".join(columns)}</div>'
+
+# --- PARTIAL RERUNS ---
+# The quiz panel, the sidebar stats and the Progress Report charts are
+# fragments: a widget inside one reruns just that fragment, and submitting
+# an answer reruns only the quiz panel and the stats it changed, instead of
+# the sidebar, menu and whole page.
+
+@st.fragment(key="sidebar_stats")
+@profiling.partial("sidebar_stats")
+def sidebar_stats(user_data):
+    """Level, points and streak, with the level ups and achievements from the last update"""
+    st.markdown(f"**Level:** {user_data['level']}")
+    st.markdown(f"**Points:** {user_data['points']}")
+    st.markdown(f"**Streak:** {user_data['active_days'].current_streak(datetime.now().date())} days")
+
+    for message in st.session_state.announcements:
+        st.success(message)
+    st.session_state.announcements = []
+    if st.session_state.pop('celebrate', False):
+        st.balloons()
+
+@profiling.partial("submit_answer")
+def submit_answer(user_data, quiz):
+    """Grade the answer in the quiz panel, then rerun only the quiz panel and sidebar stats"""
+    problem = catalog.CATALOG.get(quiz['problem'])
+    if problem is None:
+        set_feedback('warning', "That problem is no longer available. Please generate a new one.")
+        quiz['active'] = False
+        st.rerun(["quiz_panel"])
+    # Compare answers by mathematical equivalence (1/2 = 0.5, 6x-15 = -15+6x, ...)
+    import answer_checker
+    correct = answer_checker.is_correct(st.session_state.math_answer_input.strip(), problem.answer, problem.type)
+    if correct:
+        set_feedback('success', f"✅ Correct! You earned **{problem.points}** points.")
+    else:
+        set_feedback('error', f"❌ Incorrect. The correct answer was: **{problem.answer}**")
+
+    topic = quiz['current_topic']
+    profiling.count('math_submissions_total', topic=topic, result="correct" if correct else "incorrect")
+    answered_at = datetime.now().timestamp()
+    response_ms = (answered_at - quiz['shown_at']) * 1000 if quiz.get('shown_at') else 0
+    now = int(answered_at)
+    apply_progress(user_data, progress.record_attempt, problem, topic, correct, now, response_ms)
+    card = get_scheduler().answer(problem, topic, correct, now)
+    record_change('merge', 'review_cards', {problem.id: card})
+
+    # Save data after each attempt
+    save_user_data()
+
+    # Reset quiz state for a new question
+    quiz['active'] = False
+    quiz['user_answer'] = ''
+    st.session_state.math_answer_input = ''
+    st.rerun(["quiz_panel", "sidebar_stats"])
+
+@st.fragment(key="quiz_panel")
+@profiling.partial("quiz_panel")
+def quiz_panel(user_data, quiz):
+    """Topic choice, new problem buttons and the active question of Math Practice"""
+    # Topic selection for the student's grade, starting on today's challenge topic
+    math_topics = practice_topics(current_grade())
+    challenge_topic = get_daily_challenge()['topic']
+    selected_topic = st.selectbox("Select a Math Topic:", math_topics,
+                                  index=math_topics.index(challenge_topic) if challenge_topic in math_topics else 0)
+    
+    st.subheader(f"Practice Problems in {selected_topic}")
+
+    # Display topic statistics
+    topic_count = user_data['math_problems_completed'].get(selected_topic, 0)
+    st.write(f"**Problems solved in {selected_topic}:** {topic_count}")
+
+    due = get_scheduler().due_count(int(datetime.now().timestamp()))
+    if due:
+        st.write(f"**Problems due for review:** {due}")
+    
+    # Buttons to start a new quiz: missed and due problems come back before new ones
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button(f"Generate New {selected_topic} Problem", type="primary"):
+            start_problem([selected_topic])
+    with col2:
+        # Mixed and Review days draw from every topic
+        if st.button(f"📅 Today's Challenge: {challenge_topic}"):
+            start_problem([challenge_topic] if challenge_topic in math_topics else math_topics)
+        
+    st.markdown("---")
+    
+    # Result of the last submitted answer
+    show_feedback()
+    
+    # Active Quiz Logic
+    problem = catalog.CATALOG.get(quiz['problem']) if quiz['active'] else None
+    if problem is not None:
+        st.subheader(f"Question: ({problem.type.capitalize()})")
+        
+        # IMAGE Placeholder for Math Diagrams/Graphs
+        if problem.image:
+            st.info(f"**Diagram:** Imagine a {problem.image} diagram here to help solve the problem.")
+        
+        # Use st.latex for math formulas
+        st.latex(problem.question) 
+        
+        # Input field for user answer
+        st.text_input("Your Answer:", key="math_answer_input")
+
+        col1, col2 = st.columns([1, 4])
+        with col1:
+            st.button("Submit Answer", type="primary", on_click=submit_answer, args=(user_data, quiz))
+
+@st.fragment(key="progress_charts")
+@profiling.partial("progress_charts")
+def progress_charts():
+    """Points, topic and accuracy charts of the Progress Report"""
+    charts = get_progress_charts()
+
+    # 2. Points History Graph (Line Chart)
+    st.subheader("⭐ Points Progress Over Time")
+    
+    if charts['points'] is not None:
+        # Line chart for total points at the end of each day
+        st.line_chart(charts['points'], x='date', y='total_points', width="stretch")
+        st.caption("Total points accumulated over time")
+    else:
+        st.info("No points history yet. Complete math problems to start tracking!")
+
+    st.markdown("---")
+    
+    # 3. Math Problem Distribution (Pie Chart)
+    st.subheader("📐 Math Topic Distribution")
+    
+    if charts['topics'] is not None:
+        st.plotly_chart(charts['topics'], width="stretch")
+    else:
+        st.info("No math problems completed yet. Try the Math Practice section!")
+
+    if charts['accuracy'] is not None:
+        st.subheader("🎯 Correct vs Incorrect by Topic")
+        st.bar_chart(charts['accuracy'], width="stretch")
+
+# --- TIMED EXAMS ---
+# An exam is drawn once per server process and shared by everyone sitting
+# it; a session keeps only the exam's code, grade, size and deadline. The
+# answers are typed into one form and handed in with a single rerun, which
+# scores them in one pass and saves them as one change record. The page
+# shows the hand-in time rather than a live countdown, which would rerun
+# every session every second.
+
+EXAM_CACHE = 32  # exams (code, grade, size) kept drawn
+
+@st.cache_resource(max_entries=EXAM_CACHE)
+def get_exam(code, grade, size):
+    """An exam's (topic, problem) pairs, shared by every session sitting it"""
+    import exam  # NumPy and the generator are only needed once someone sits an exam
+    return tuple((topic, catalog.CATALOG.record(problem)) for topic, problem in exam.draw_exam(code, grade, size))
+
+def start_exam():
+    """Begin the exam whose code and size are in the setup widgets, for the student's grade; the clock starts now"""
+    import exam
+    now = int(datetime.now().timestamp())
+    code = st.session_state.exam_code.strip() or datetime.now().strftime("%Y-%m-%d")
+    size = st.session_state.exam_size
+    st.session_state.exam = {'code': code, 'grade': current_grade(),
+                             'size': size, 'started_at': now, 'deadline': now + exam.time_limit(size)}
+    st.session_state.pop('exam_result', None)
+
+@profiling.partial("hand_in_exam")
+def hand_in_exam(user_data, sitting):
+    """Score the whole answer sheet and apply it to the student as one update and one save"""
+    import exam
+    questions = get_exam(sitting['code'], sitting['grade'], sitting['size'])
+    answers = [st.session_state.get(f"exam_answer_{i}", '') for i in range(len(questions))]
+    now = int(datetime.now().timestamp())
+    graded = exam.score(questions, answers)
+    late = now > sitting['deadline'] + exam.GRACE_SECONDS
+
+    tally = {}
+    for problem, topic, correct in graded:
+        tally[topic, correct] = tally.get((topic, correct), 0) + 1
+    for (topic, correct), amount in tally.items():
+        profiling.count('math_submissions_total', amount, topic=topic, result="correct" if correct else "incorrect")
+
+    # Only the first sitting counts, late or not: the result screen shows the answers
+    exam_id = exam.exam_id(sitting['code'], sitting['grade'], sitting['size'])
+    retake = exam_id in user_data['exams_taken']
+    awarded = not (late or retake)
+    if not retake:
+        user_data['exams_taken'].add(exam_id)
+        record_change('append', 'exams_taken', exam_id)
+    if awarded:
+        apply_progress(user_data, progress.record_exam, graded, now)
+        # Missed questions come back in practice like any other missed problem
+        cards = {problem.id: get_scheduler().answer(problem, topic, correct, now)
+                 for problem, topic, correct in graded if not correct}
+        if cards:
+            record_change('merge', 'review_cards', cards)
+    if not retake:
+        save_user_data()
+
+    st.session_state.exam_result = dict(
+        sitting, handed_in=now, late=late, retake=retake, correct=sum(correct for _, _, correct in graded),
+        points=sum(problem.points for problem, _, correct in graded if correct) if awarded else 0,
+        missed=[(i, answers[i].strip()) for i, (_, _, correct) in enumerate(graded) if not correct])
+    st.session_state.exam = None
+
+def show_exam_result(result):
+    """Score of the last exam handed in, with the questions that were missed"""
+    minutes = (result['handed_in'] - result['started_at']) // 60
+    summary = f"Exam **{result['code']}**: **{result['correct']}/{result['size']}** correct in {minutes} min"
+    if result['retake']:
+        st.info(f"{summary}. You had already sat this exam, so this retake was for practice and earned no points.")
+    elif result['late']:
+        st.warning(f"{summary}. Handed in after the time limit, so no points were awarded.")
+    else:
+        st.success(f"{summary}. You earned **{result['points']}** points.")
+    if result['missed']:
+        questions = get_exam(result['code'], result['grade'], result['size'])
+        with st.expander(f"Review the {len(result['missed'])} missed questions"):
+            for i, answer in result['missed']:
+                topic, problem = questions[i]
+                st.markdown(f"**{i + 1}. {topic}**")
+                st.latex(problem.question)
+                st.markdown(f"Your answer: `{answer or '(blank)'}` · Correct answer: **{problem.answer}**")
+
+def exam_page(user_data):
+    """Start an exam, sit it on one answer sheet, or see how the last one went"""
+    import exam
+    sitting = st.session_state.get('exam')
+    if sitting is None:
+        if st.session_state.get('exam_result'):
+            show_exam_result(st.session_state.exam_result)
+            st.markdown("---")
+        st.subheader("Start an Exam")
+        st.text_input("Exam code (everyone with the same code gets the same questions):",
+                      value=datetime.now().strftime("%Y-%m-%d"), key="exam_code")
+        size = st.selectbox("Number of questions:", exam.EXAM_SIZES, key="exam_size")
+        st.caption(f"You have {exam.SECONDS_PER_QUESTION} seconds per question: "
+                   f"{exam.time_limit(size) // 60} minutes for {size} questions.")
+        # Read from session state in the callback: a code typed just before clicking isn't in this run's values
+        st.button("Start Exam", type="primary", on_click=start_exam)
+        return
+
+    questions = get_exam(sitting['code'], sitting['grade'], sitting['size'])
+    deadline = datetime.fromtimestamp(sitting['deadline'])
+    st.info(f"Exam **{sitting['code']}**: {len(questions)} questions. Hand in by **{deadline:%H:%M}**. "
+            "Answers are only checked when you hand in the sheet.")
+    with st.form("exam_form", clear_on_submit=True):
+        for i, (topic, problem) in enumerate(questions):
+            st.markdown(f"**{i + 1}. {topic}** ({problem.points} points)")
+            st.latex(problem.question)
+            st.text_input(f"Answer {i + 1}", key=f"exam_answer_{i}", label_visibility="collapsed")
+        st.form_submit_button("Hand In", type="primary", on_click=hand_in_exam, args=(user_data, sitting))
+
 # --- INITIALIZE SESSION STATE ---
 if 'user_data' not in st.session_state:
-    # Try to load existing data
-    loaded_data = load_user_data()
-    if loaded_data:
-        st.session_state.user_data = loaded_data
-    else:
-        st.session_state.user_data = {
-            'current_grade': 'Grade 7',
-            'student_name': '',
-            'daily_streak': 0,
-            'last_activity_date': None,
-            'points': 0,
-            'level': 1,
-            'daily_challenges_completed': [],
-            'achievements': [],
-            'points_history': [],
-            'math_problems_completed': {},
-            'math_quiz_history': []
-        }
+    # Saved progress is loaded once the student enters their name
+    st.session_state.user_data = storage.default_user_data()
+
+if 'pending_changes' not in st.session_state:
+    st.session_state.pending_changes = storage.new_changes()
+
+if 'rollup_version' not in st.session_state:
+    st.session_state.rollup_version = 0
+
+if 'announcements' not in st.session_state:
+    st.session_state.announcements = []
 
 if 'math_quiz' not in st.session_state:
-    st.session_state.math_quiz = {'active': False, 'current_topic': None, 'question': None, 'user_answer': ''}
+    st.session_state.math_quiz = {'active': False, 'current_topic': None, 'problem': None, 'user_answer': '',
+                                  'shown_at': None}
+
+profiling.mark("session state")
 
 # --- SIDEBAR (USER PROFILE & MENU) ---
 st.sidebar.title("📐 Math Learning Center")
@@ -192,21 +504,33 @@ st.sidebar.subheader("👤 Student Profile")
 if not st.session_state.user_data.get('student_name', ''):
     name = st.sidebar.text_input("Enter Your Name:", key="name_input")
     if name and name.strip():
-        st.session_state.user_data['student_name'] = name.strip()
+        loaded_data = load_user_data(name.strip())
+        if loaded_data:
+            st.session_state.user_data = loaded_data
+            st.session_state.pending_changes = storage.new_changes()
+            st.session_state.rollup_version += 1
+            st.session_state.pop('scheduler', None)
+            # Rules added since the last visit may already be reached; this also refreshes their standings
+            apply_progress(loaded_data, progress.check_achievements, *achievements.RULEBOOK.metrics())
+        else:
+            # New student: progress made before entering a name becomes theirs
+            st.session_state.user_data['student_name'] = name.strip()
+            record_change('set', 'student_name', name.strip())
         save_user_data()
         st.rerun()
 else:
     st.sidebar.write(f"**Student:** {st.session_state.user_data['student_name']}")
 
-grade = st.sidebar.selectbox("Select Your Grade", ["Grade 7", "Grade 8", "Grade 9", "Grade 10", "Grade 11", "Grade 12"])
-st.session_state.user_data['current_grade'] = grade
+grade = st.sidebar.selectbox("Select Your Grade", GRADES, index=GRADES.index(st.session_state.user_data['current_grade']))
+if grade != st.session_state.user_data['current_grade']:
+    st.session_state.user_data['current_grade'] = grade
+    record_change('set', 'current_grade', grade)
 
-st.sidebar.markdown(f"**Level:** {st.session_state.user_data['level']}")
-st.sidebar.markdown(f"**Points:** {st.session_state.user_data['points']}")
-st.sidebar.markdown(f"**Streak:** {st.session_state.user_data['daily_streak']} days")
+with st.sidebar:
+    sidebar_stats(st.session_state.user_data)
 
 # Main menu - Math focused only
-menu_options = ["🏠 Dashboard", "📐 Math Practice", "📊 Progress Report", "🏆 Achievement Board"]
+menu_options = ["🏠 Dashboard", "📐 Math Practice", "📝 Timed Exam", "📊 Progress Report", "🏆 Achievement Board", "🏅 Leaderboard"]
 
 if 'menu' not in st.session_state:
     st.session_state.menu = menu_options[0]
@@ -216,15 +540,19 @@ menu = st.sidebar.selectbox("📋 Select Menu", menu_options,
                            key="menu_selector")
 
 st.session_state.menu = menu
+profiling.set_page(menu)
 
 # Save data button
 if st.sidebar.button("💾 Save Progress"):
     save_user_data()
+    get_storage().flush(st.session_state.user_data['student_name'])
     st.sidebar.success("Progress saved successfully!")
 
 st.sidebar.markdown("---")
 st.sidebar.info("💡 **Tip:** Practice daily to improve your math skills!")
 
+profiling.mark("sidebar")
+
 # --- MAIN CONTENT AREA ---
 
 # Dashboard
@@ -242,14 +570,18 @@ if menu == "🏠 Dashboard":
         st.info(f"**Topic:** {challenge['topic']}")
         st.info(f"**Task:** {challenge['task']}")
         
+        show_feedback()
         today_str = datetime.now().strftime("%Y-%m-%d")
         if today_str not in st.session_state.user_data['daily_challenges_completed']:
             if st.button("Start Today's Challenge", type="primary"):
                 st.session_state.user_data['daily_challenges_completed'].append(today_str)
-                add_points(10)
-                update_streak()
+                record_change('append', 'daily_challenges_completed', today_str)
+                now = int(datetime.now().timestamp())
+                apply_progress(st.session_state.user_data, progress.add_points, 10, now)
+                apply_progress(st.session_state.user_data, progress.update_streak, now)
                 save_user_data()
-                st.success("+10 points! Challenge started. Complete math problems in the Math Practice section.")
+                set_feedback('success', "+10 points! Challenge started. Complete math problems in the Math Practice section.")
+                st.rerun()
         else:
             st.success("You've already started today's challenge!")
 
@@ -273,10 +605,11 @@ if menu == "🏠 Dashboard":
 
     # Recent activity
     st.subheader("📝 Recent Math Activity")
-    if st.session_state.user_data['math_quiz_history']:
-        recent_activities = st.session_state.user_data['math_quiz_history'][-5:]  # Last 5 activities
-        for activity in reversed(recent_activities):
-            st.write(f"✅ **{activity['topic']}**: {activity['question_type']} - {activity['result']} (+{activity['points']} points) - {activity['timestamp']}")
+    quiz_history = st.session_state.user_data['math_quiz_history']
+    if len(quiz_history):
+        for ts, topic, question_type, correct, points, *_ in quiz_history.latest(5):  # Last 5 activities
+            result = "Correct" if correct else "Incorrect"
+            st.write(f"✅ **{topic}**: {question_type} - {result} (+{points} points) - {history.format_ts(ts)}")
     else:
         st.info("No math activities recorded yet. Start practicing!")
 
@@ -286,90 +619,15 @@ elif menu == "📐 Math Practice":
     st.info("Test your skills in various mathematical fields. Type your answer (numbers only for calculations, or the requested term).")
     st.markdown("---")
     
-    # Topic selection
-    math_topics = list(math_data.keys())
-    selected_topic = st.selectbox("Select a Math Topic:", math_topics)
-    
-    st.subheader(f"Practice Problems in {selected_topic}")
+    quiz_panel(st.session_state.user_data, st.session_state.math_quiz)
 
-    # Display topic statistics
-    topic_count = st.session_state.user_data['math_problems_completed'].get(selected_topic, 0)
-    st.write(f"**Problems solved in {selected_topic}:** {topic_count}")
-
-    # Button to start a new quiz
-    if st.button(f"Generate New {selected_topic} Problem", type="primary"):
-        problem = random.choice(math_data[selected_topic])
-        st.session_state.math_quiz['active'] = True
-        st.session_state.math_quiz['current_topic'] = selected_topic
-        st.session_state.math_quiz['question'] = problem
-        st.session_state.math_quiz['user_answer'] = ''
-        
+# Timed Exam
+elif menu == "📝 Timed Exam":
+    st.title("📝 Timed Exam")
+    st.info("Answer every question on one sheet, then hand it in. Blank answers count as wrong.")
     st.markdown("---")
-    
-    # Active Quiz Logic
-    if st.session_state.math_quiz['active']:
-        problem = st.session_state.math_quiz['question']
-        
-        st.subheader(f"Question: ({problem['type'].capitalize()})")
-        
-        # IMAGE Placeholder for Math Diagrams/Graphs
-        if problem['image']:
-            st.info(f"**Diagram:** Imagine a {problem['image']} diagram here to help solve the problem.")
-        
-        # Use st.latex for math formulas
-        st.latex(problem['question']) 
-        
-        # Input field for user answer
-        user_input = st.text_input("Your Answer:", key="math_answer_input").strip()
 
-        col1, col2 = st.columns([1, 4])
-        with col1:
-            if st.button("Submit Answer", type="primary"):
-                # Normalize answers for comparison (remove spaces and convert to lowercase)
-                correct_answer = problem['answer'].replace(" ", "").lower()
-                submitted_answer = user_input.replace(" ", "").lower()
-                
-                if submitted_answer == correct_answer:
-                    st.success(f"✅ Correct! You earned **{problem['points']}** points.")
-                    add_points(problem['points'])
-                    update_streak() 
-                    
-                    # Update math problems completed count
-                    topic = st.session_state.math_quiz['current_topic']
-                    st.session_state.user_data['math_problems_completed'][topic] = \
-                        st.session_state.user_data['math_problems_completed'].get(topic, 0) + 1
-                    
-                    # Record successful attempt
-                    st.session_state.user_data['math_quiz_history'].append({
-                        'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                        'topic': topic,
-                        'question_type': problem['type'],
-                        'result': 'Correct',
-                        'points': problem['points']
-                    })
-                    
-                    result = "Correct"
-                else:
-                    st.error(f"❌ Incorrect. The correct answer was: **{problem['answer']}**")
-                    
-                    # Record failed attempt
-                    st.session_state.user_data['math_quiz_history'].append({
-                        'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                        'topic': st.session_state.math_quiz['current_topic'],
-                        'question_type': problem['type'],
-                        'result': 'Incorrect',
-                        'points': 0
-                    })
-                    result = "Incorrect"
-                
-                # Save data after each attempt
-                save_user_data()
-                
-                # Reset quiz state for a new question
-                st.session_state.math_quiz['active'] = False
-                st.session_state.math_quiz['user_answer'] = ''
-                time.sleep(2)
-                st.rerun()
+    exam_page(st.session_state.user_data)
 
 # Progress Report (INCLUDES GRAPHS AND PIE CHART)
 elif menu == "📊 Progress Report":
@@ -392,55 +650,32 @@ elif menu == "📊 Progress Report":
     
     st.markdown("---")
 
-    # 2. Points History Graph (Line Chart)
-    st.subheader("⭐ Points Progress Over Time")
-    
-    if st.session_state.user_data['points_history']:
-        # Convert history to DataFrame
-        points_df = pd.DataFrame(st.session_state.user_data['points_history'])
-        points_df['date'] = pd.to_datetime(points_df['date']).dt.date
-        
-        # Group by date for plotting total points
-        daily_points_df = points_df.groupby('date').last().reset_index()
-        
-        # Line chart for total points over time
-        st.line_chart(daily_points_df, x='date', y='total_points', use_container_width=True)
-        st.caption("Total points accumulated over time")
-    else:
-        st.info("No points history yet. Complete math problems to start tracking!")
+    progress_charts()
 
     st.markdown("---")
-    
-    # 3. Math Problem Distribution (Pie Chart)
-    st.subheader("📐 Math Topic Distribution")
-    
-    math_completed = st.session_state.user_data['math_problems_completed']
-    
-    if math_completed:
-        math_df = pd.DataFrame(list(math_completed.items()), columns=['Topic', 'Problems Completed'])
-        
-        # Use Plotly for a better Pie Chart visualization
-        fig = px.pie(math_df, 
-                     values='Problems Completed', 
-                     names='Topic', 
-                     title='Distribution of Completed Math Problems by Topic',
-                     color_discrete_sequence=px.colors.sequential.Viridis)
-        st.plotly_chart(fig, use_container_width=True)
-    else:
-        st.info("No math problems completed yet. Try the Math Practice section!")
 
-    st.markdown("---")
+    # 4. Daily Activity Heatmap
+    st.subheader("📅 Activity Calendar")
 
-    # 4. Daily Activity Heatmap (Simplified)
-    st.subheader("📅 Recent Activity Timeline")
-    
-    if st.session_state.user_data['math_quiz_history']:
-        # Get last 10 activities
-        recent_activities = st.session_state.user_data['math_quiz_history'][-10:]
-        
-        for activity in reversed(recent_activities):
-            status_icon = "✅" if activity['result'] == 'Correct' else "❌"
-            st.write(f"{status_icon} **{activity['timestamp']}** - {activity['topic']} ({activity['question_type']}) - {activity['result']}")
+    today = datetime.now().date()
+    active_days = st.session_state.user_data['active_days']
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Current Streak", f"{active_days.current_streak(today)} days")
+    with col2:
+        st.metric("Longest Streak", f"{active_days.longest_streak()} days")
+    with col3:
+        st.metric("Active Days", active_days.count())
+    st.markdown(activity_calendar_html(st.session_state.user_data, today), unsafe_allow_html=True)
+    st.caption("One square per day over the last year, darker for days with more attempts")
+
+    st.subheader("📝 Latest Attempts")
+    quiz_history = st.session_state.user_data['math_quiz_history']
+    if len(quiz_history):
+        for ts, topic, question_type, correct, *_ in quiz_history.latest(10):  # Last 10 activities
+            status_icon = "✅" if correct else "❌"
+            result = "Correct" if correct else "Incorrect"
+            st.write(f"{status_icon} **{history.format_ts(ts)}** - {topic} ({question_type}) - {result}")
     else:
         st.info("No recent math activities. Start practicing to see your timeline!")
 
@@ -448,61 +683,63 @@ elif menu == "📊 Progress Report":
 elif menu == "🏆 Achievement Board":
     st.title("🏆 Math Achievement Board")
     
-    col1, col2, col3 = st.columns(3)
-    
-    with col1:
-        st.subheader("📐 Math Problems")
-        total_problems = sum(st.session_state.user_data['math_problems_completed'].values())
-        
-        if total_problems >= 1:
-            st.success("✅ First Problem Solved")
-        if total_problems >= 10:
-            st.success("✅ Math Beginner (10 problems)")
-        if total_problems >= 25:
-            st.success("✅ Math Enthusiast (25 problems)")
-        if total_problems >= 50:
-            st.success("✅ Math Master (50 problems)")
-        else:
-            st.info(f"Solve {50 - total_problems} more problems to become a Math Master!")
+    user_data = st.session_state.user_data
     
-    with col2:
-        st.subheader("🔥 Streaks")
-        streak = st.session_state.user_data['daily_streak']
-        
-        if streak >= 1:
-            st.success("✅ Daily Learner")
-        if streak >= 3:
-            st.success("✅ 3-Day Streak")
-        if streak >= 7:
-            st.success("✅ Weekly Warrior")
-        else:
-            st.info(f"Keep practicing for {7 - streak} more days for Weekly Warrior!")
-    
-    with col3:
-        st.subheader("⭐ Points")
-        points = st.session_state.user_data['points']
-        
-        if points >= 50:
-            st.success("✅ 50 Points")
-        if points >= 100:
-            st.success("✅ Century Scorer")
-        if points >= 500:
-            st.success("✅ Math Power Player")
-        else:
-            st.info(f"Earn {500 - points} more points for the Power Player achievement!")
+    # One column per headline metric: unlocked achievements, then the next one to aim for
+    for col, (metric, (heading, unit)) in zip(st.columns(len(achievements.METRICS)), achievements.METRICS.items()):
+        with col:
+            st.subheader(heading)
+            value, next_rule = show_unlocked(user_data, metric, unit)
+            if next_rule:
+                st.info(f"{next_rule.threshold - value} more {unit} to unlock {next_rule.label}!")
     
     st.markdown("---")
     st.subheader("🎯 Topic Mastery")
     
-    math_completed = st.session_state.user_data['math_problems_completed']
     for topic in math_data.keys():
-        count = math_completed.get(topic, 0)
-        if count >= 5:
-            st.success(f"✅ {topic} Explorer (5+ problems)")
-        elif count >= 1:
-            st.info(f"⏳ {topic} Beginner ({count}/5 problems)")
-        else:
+        value, next_rule = show_unlocked(user_data, f"topic:{topic}", "problems")
+        if next_rule and value:
+            st.info(f"⏳ {next_rule.label} ({value}/{next_rule.threshold} problems)")
+        elif next_rule:
             st.write(f"🔲 {topic} (Not started)")
+    
+    st.markdown("---")
+    st.subheader("🧩 Problem Types")
+    
+    for metric in achievements.RULEBOOK.metrics():
+        if metric.startswith('type:'):
+            unit = f"{metric[len('type:'):]} problems"
+            value, next_rule = show_unlocked(user_data, metric, unit)
+            if next_rule:
+                st.info(f"⏳ {next_rule.label} ({value}/{next_rule.threshold} {unit})")
+
+# Leaderboard
+elif menu == "🏅 Leaderboard":
+    st.title("🏅 Class Leaderboard")
+    
+    boards = {"⭐ Total Points": 'points', "📅 Points This Week": leaderboard.week_board()}
+    boards.update({f"📐 {topic} Problems": f"topic:{topic}" for topic in math_data})
+    board_label = st.selectbox("Ranking:", list(boards))
+    board = boards[board_label]
+    unit = "problems" if board.startswith('topic:') else "points"
+    
+    student = st.session_state.user_data['student_name']
+    rank, size = get_leaderboard().rank(board, student)
+    if rank:
+        st.metric("Your Rank", f"#{rank}", help=f"out of {size} students")
+    elif student:
+        st.info("Earn points here to join this leaderboard!")
+    
+    medals = {1: "🥇", 2: "🥈", 3: "🥉"}
+    top = get_leaderboard().top(board, 10)
+    if top:
+        for place, name, score in top:
+            line = f"{medals.get(place, f'#{place}')} **{name}** - {score} {unit}"
+            st.write(f"{line} ⬅️ you" if name == student else line)
+    else:
+        st.info("Nobody is on this leaderboard yet. Be the first!")
+
+profiling.mark(f"page: {menu}")
 
 # Footer
 st.markdown("---")
@@ -523,4 +760,7 @@ st.markdown("""
         color: white;
     }
 </style>
-""", unsafe_allow_html=True)
\ No newline at end of file
+""", unsafe_allow_html=True)
+
+profiling.mark("footer")
+profiling.report()
@@ -0,0 +1,215 @@
+"""Procedural math problem generator.
+
+Each template draws its random parameters for a whole batch in one NumPy
+pass and formats the results into Problem records (see catalog.py) with the
+same fields as the hand-written bank: type, question, answer, points and
+image, plus a stable id derived from the question so a student's progress
+on a problem can be tracked across batches and restarts.
+"""
+import threading
+from collections import deque
+
+import numpy as np
+
+from catalog import Problem, intern
+from question_bank import problem_id
+
+# --- FORMATTING HELPERS ---
+
+def signed(value):
+    """Format a term that follows another one: '+ 7' or '- 7'"""
+    return f"+ {value}" if value >= 0 else f"- {-value}"
+
+def poly(coeffs, compact=False):
+    """Format polynomial coefficients (highest degree first) as '3x^2 + 2x - 5' or, compact, '3x^2+2x-5'"""
+    sep = '' if compact else ' '
+    degree = len(coeffs) - 1
+    text = ''
+    for power, coeff in zip(range(degree, -1, -1), coeffs):
+        if coeff == 0:
+            continue
+        magnitude = abs(coeff)
+        term = ('' if magnitude == 1 and power > 0 else str(magnitude)) + \
+            ('' if power == 0 else 'x' if power == 1 else f'x^{power}')
+        if not text:
+            text = term if coeff > 0 else f"-{term}"
+        else:
+            text += f"{sep}{'+' if coeff > 0 else '-'}{sep}{term}"
+    return text or '0'
+
+def fraction(numerators, denominators):
+    """Reduced fractions as strings, e.g. 3/6 -> '1/2'"""
+    divisor = np.gcd(numerators, denominators)
+    return [f"{n}/{d}" if d != 1 else str(n)
+            for n, d in zip((numerators // divisor).tolist(), (denominators // divisor).tolist())]
+
+def problem(problem_type, question, answer, points, image=None):
+    """Problem record with the same fields as the hand-written bank"""
+    return Problem(problem_id(problem_type, question), intern(problem_type), question, intern(answer), points,
+                   intern(image))
+
+# --- TEMPLATES ---
+# Each template takes (rng, n) and returns n problems.
+
+def linear_equations(rng, n):
+    a = rng.integers(2, 10, n)
+    x = rng.integers(-10, 11, n)
+    b = rng.integers(1, 21, n) * rng.choice([-1, 1], n)
+    c = a * x + b
+    return [problem("solve", f"If ${a_}x {signed(b_)} = {c_}$, what is $x$?", str(x_), 10)
+            for a_, b_, c_, x_ in zip(a.tolist(), b.tolist(), c.tolist(), x.tolist())]
+
+def quadratics(rng, n):
+    roots = np.sort(rng.integers(-9, 10, (n, 2)), axis=1)
+    p = -roots.sum(axis=1)
+    q = roots.prod(axis=1)
+    return [problem("solve", f"Solve the quadratic equation: ${poly([1, p_, q_])} = 0$",
+                    f"{r1},{r2}" if r1 != r2 else str(r1), 20)
+            for p_, q_, (r1, r2) in zip(p.tolist(), q.tolist(), roots.tolist())]
+
+def rectangle_areas(rng, n):
+    length = rng.integers(2, 21, n)
+    width = rng.integers(2, 21, n)
+    area = length * width
+    return [problem("area", f"What is the area of a rectangle with length {l_} and width {w_}? (Number only)",
+                    str(a_), 10, "rectangle_diagram.png")
+            for l_, w_, a_ in zip(length.tolist(), width.tolist(), area.tolist())]
+
+def circle_areas(rng, n):
+    radius = rng.integers(1, 16, n)
+    area = np.pi * radius ** 2
+    return [problem("area", f"What is the area of a circle with radius {r_}? (Use π and round to 2 decimals)",
+                    f"{a_:.2f}", 20, "circle_diagram.png")
+            for r_, a_ in zip(radius.tolist(), area.tolist())]
+
+def box_volumes(rng, n):
+    sides = rng.integers(2, 13, (n, 3))
+    volume = sides.prod(axis=1)
+    return [problem("volume", f"What is the volume of a box measuring {l_} by {w_} by {h_}? (Number only)",
+                    str(v_), 15, "cube_diagram.png")
+            for (l_, w_, h_), v_ in zip(sides.tolist(), volume.tolist())]
+
+SPECIAL_ANGLES = [
+    ("sin", 0, "0"), ("sin", 30, "1/2"), ("sin", 45, "sqrt(2)/2"), ("sin", 60, "sqrt(3)/2"), ("sin", 90, "1"),
+    ("cos", 0, "1"), ("cos", 30, "sqrt(3)/2"), ("cos", 45, "sqrt(2)/2"), ("cos", 60, "1/2"), ("cos", 90, "0"),
+    ("tan", 0, "0"), ("tan", 30, "sqrt(3)/3"), ("tan", 45, "1"), ("tan", 60, "sqrt(3)"),
+]
+
+def special_angles(rng, n):
+    picks = rng.integers(0, len(SPECIAL_ANGLES), n)
+    return [problem("value", f"What is the value of $\\{func}({angle}^{{\\circ}})$? (Exact value, e.g. 1/2 or sqrt(3)/2)",
+                    answer, 25)
+            for func, angle, answer in (SPECIAL_ANGLES[i] for i in picks.tolist())]
+
+def derivatives(rng, n):
+    # Cubics and quadratics: a*x^3 + b*x^2 + c*x + d with a possibly zero
+    a = rng.integers(0, 6, n)
+    b = rng.integers(1, 10, n) * rng.choice([-1, 1], n)
+    c = rng.integers(-9, 10, n)
+    d = rng.integers(-9, 10, n)
+    return [problem("derivative", f"Find the derivative of $f(x) = {poly([a_, b_, c_, d_])}$",
+                    poly([3 * a_, 2 * b_, c_], compact=True), 25)
+            for a_, b_, c_, d_ in zip(a.tolist(), b.tolist(), c.tolist(), d.tolist())]
+
+def means(rng, n):
+    values = rng.integers(1, 21, (n, 5))
+    values[:, -1] += -values.sum(axis=1) % 5  # make the mean a whole number
+    mean = values.sum(axis=1) // 5
+    return [problem("mean", f"Find the mean of: {', '.join(map(str, row))}", str(m_), 15)
+            for row, m_ in zip(values.tolist(), mean.tolist())]
+
+def probabilities(rng, n):
+    red = rng.integers(1, 13, n)
+    blue = rng.integers(1, 13, n)
+    answers = fraction(red, red + blue)
+    return [problem("probability",
+                    f"A bag holds {r_} red and {b_} blue marbles. What is the probability of drawing a red marble? (Fraction or decimal)",
+                    answer, 15)
+            for r_, b_, answer in zip(red.tolist(), blue.tolist(), answers)]
+
+TEMPLATES = {
+    "Algebra": [linear_equations, quadratics],
+    "Geometry": [rectangle_areas, circle_areas, box_volumes],
+    "Trigonometry": [special_angles],
+    "Calculus": [derivatives],
+    "Statistics": [means, probabilities],
+}
+
+# Lowest grade each template is meant for
+MIN_GRADE = {
+    linear_equations: 7, quadratics: 9,
+    rectangle_areas: 7, circle_areas: 7, box_volumes: 7,
+    special_angles: 9,
+    derivatives: 11,
+    means: 7, probabilities: 7,
+}
+
+def templates_for(topic, grade=None):
+    """A topic's templates suitable for a grade (all of them without one)"""
+    return [template for template in TEMPLATES[topic] if grade is None or MIN_GRADE[template] <= grade]
+
+def generate_batch(topic, size, rng, grade=None):
+    """Generate `size` problems for a topic and grade, spread evenly over its templates"""
+    templates = templates_for(topic, grade)
+    counts = rng.multinomial(size, [1 / len(templates)] * len(templates))
+    batch = []
+    for template, count in zip(templates, counts.tolist()):
+        if count:
+            batch.extend(template(rng, count))
+    return [batch[i] for i in rng.permutation(len(batch)).tolist()]
+
+# --- PROBLEM POOL ---
+
+class ProblemPool:
+    """Queues of ready-made problems per topic and grade, refilled by a background thread.
+
+    Serving a problem is a deque pop; when a queue drops below `low_water` a
+    new batch is generated off the request path. A queue is started the
+    first time its topic and grade are asked for.
+    """
+
+    def __init__(self, batch_size=2000, low_water=500, seed=None):
+        self.batch_size = batch_size
+        self.low_water = low_water
+        self._seed = np.random.SeedSequence(seed)
+        self._queues = {}
+        self._refilling = set()
+        self._lock = threading.Lock()
+
+    def _generate(self, key, size):
+        with self._lock:
+            rng = np.random.default_rng(self._seed.spawn(1)[0])
+        topic, grade = key
+        return generate_batch(topic, size, rng, grade)
+
+    def _refill(self, key):
+        try:
+            self._queues[key].extend(self._generate(key, self.batch_size))
+        finally:
+            with self._lock:
+                self._refilling.discard(key)
+
+    def _schedule_refill(self, key):
+        with self._lock:
+            if key in self._refilling:
+                return
+            self._refilling.add(key)
+        threading.Thread(target=self._refill, args=(key,), daemon=True).start()
+
+    def next(self, topic, grade=None):
+        """Take the next problem for a topic and grade, or None if no template suits the grade"""
+        if not templates_for(topic, grade):
+            return None
+        key = (topic, grade)
+        with self._lock:
+            queue = self._queues.setdefault(key, deque())
+        try:
+            item = queue.popleft()
+        except IndexError:
+            # Cold or drained queue: serve from a small batch generated right here
+            batch = self._generate(key, self.low_water)
+            item = batch.pop()
+            queue.extend(batch)
+        if len(queue) < self.low_water:
+            self._schedule_refill(key)
+        return item
@@ -0,0 +1,232 @@
+"""Per-run timing and metrics for the Streamlit entry point.
+
+Every script run is split into sections by mark() calls (imports, session
+state, sidebar, the page branch, footer) and can hold spans around the
+pieces inside them (loading and saving a student, building charts).
+Fragments and widget callbacks that Streamlit runs on their own, without
+the rest of the script, are timed as runs of their own. What
+happens with the timings is set by environment variables, and with none of
+them set nothing is recorded:
+
+- MATH_PROFILE_STARTUP=1: print each run's sections to stderr. The first
+  run in a server process shows the cold start and first paint; later runs
+  show the cost of lazy imports made by the page that needed them.
+- MATH_METRICS_FILE=path: keep a Prometheus text file with run, section and
+  span durations and the counters, rewritten at most once a second.
+- MATH_METRICS_PORT=port: serve the same text at http://127.0.0.1:port/metrics.
+- MATH_SLOW_RERUN_MS=ms: print the section and span breakdown of runs that
+  took longer than this to stderr.
+"""
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+PROFILE_STARTUP = os.environ.get('MATH_PROFILE_STARTUP') == '1'
+METRICS_FILE = os.environ.get('MATH_METRICS_FILE')
+METRICS_PORT = int(os.environ.get('MATH_METRICS_PORT') or 0)
+SLOW_RERUN_MS = float(os.environ.get('MATH_SLOW_RERUN_MS') or 0)
+ENABLED = bool(PROFILE_STARTUP or METRICS_FILE or METRICS_PORT or SLOW_RERUN_MS)
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)  # seconds
+FILE_INTERVAL = 1.0  # seconds between metrics file rewrites
+
+_runs = {'count': 0}
+_run_listeners = []  # called with (seconds, page, status) as each run finishes
+_local = threading.local()  # each session runs the script in its own thread
+
+# --- RUNS, SECTIONS AND SPANS ---
+
+def start_run():
+    """Begin timing a script run"""
+    if not ENABLED:
+        return
+    if hasattr(_local, 'marks'):
+        # The previous run on this thread ended early, e.g. with st.rerun() after a submission
+        finish_run('interrupted')
+    _local.marks = []
+    _local.spans = []
+    _local.page = None
+    _local.start = _local.last = _local.end = time.perf_counter()
+    if METRICS_PORT:
+        start_server()
+
+def mark(label):
+    """Record the time since the previous mark under `label`"""
+    if ENABLED and hasattr(_local, 'marks'):
+        now = time.perf_counter()
+        _local.marks.append((label, now - _local.last))
+        _local.last = _local.end = now
+
+def set_page(page):
+    """Label the current run with the page it renders"""
+    if ENABLED:
+        _local.page = page
+
+@contextmanager
+def span(name):
+    """Time a block or, used as a decorator, every call of a function"""
+    if not (ENABLED and hasattr(_local, 'marks')):
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        _local.spans.append((name, end - start))
+        _local.end = max(_local.end, end)
+
+@contextmanager
+def partial(name):
+    """Time a fragment or widget callback: a span within a full run, or a run of
+    its own (page "partial: name") when Streamlit runs it without the whole script"""
+    if not ENABLED:
+        yield
+        return
+    if hasattr(_local, 'marks'):
+        with span(f"partial: {name}"):
+            yield
+        return
+    start_run()
+    set_page(f"partial: {name}")
+    try:
+        yield
+    finally:
+        mark(name)
+        report()
+
+def on_run(listener):
+    """Call listener(seconds, page, status) after every run in this process, e.g. from a benchmark"""
+    global ENABLED
+    ENABLED = True
+    _run_listeners.append(listener)
+
+def report():
+    """Finish the current run: print, record and export its timings"""
+    if ENABLED and hasattr(_local, 'marks'):
+        finish_run('complete')
+
+def finish_run(status):
+    total = _local.end - _local.start
+    marks, spans, page = _local.marks, _local.spans, _local.page
+    del _local.marks
+    _runs['count'] += 1
+    if PROFILE_STARTUP:
+        lines = [f"[startup profile] run {_runs['count']}: {total * 1000:.1f} ms"]
+        lines += [f"  {seconds * 1000:8.1f} ms  {label}" for label, seconds in marks]
+        print('\n'.join(lines), file=sys.stderr)
+    if SLOW_RERUN_MS and total * 1000 >= SLOW_RERUN_MS:
+        lines = [f"[slow rerun] {total * 1000:.1f} ms on {page or 'no page'} ({status})"]
+        lines += [f"  {seconds * 1000:8.1f} ms  {label}" for label, seconds in marks]
+        lines += [f"  {seconds * 1000:8.1f} ms  span: {name}" for name, seconds in spans]
+        print('\n'.join(lines), file=sys.stderr)
+    for listener in _run_listeners:
+        listener(total, page, status)
+    if METRICS_FILE or METRICS_PORT:
+        observe('math_rerun_seconds', total, page=page or '', status=status)
+        for label, seconds in marks:
+            observe('math_section_seconds', seconds, section=label)
+        for name, seconds in spans:
+            observe('math_span_seconds', seconds, span=name)
+        if METRICS_FILE:
+            write_metrics_file()
+
+# --- METRICS ---
+
+HELP = {
+    'math_rerun_seconds': ('histogram', "Duration of script runs"),
+    'math_section_seconds': ('histogram', "Duration of the sections of a script run"),
+    'math_span_seconds': ('histogram', "Duration of timed operations: loading, saving, building charts"),
+    'math_submissions_total': ('counter', "Answers submitted in Math Practice and Timed Exams"),
+}
+
+_metrics = {}  # name -> {labels: value} for counters, {labels: [bucket counts..., sum, count]} for histograms
+_metrics_lock = threading.Lock()
+_exports = {'file_written': 0.0, 'server': None}
+
+def count(name, amount=1, **labels):
+    """Add to a counter, e.g. count('math_submissions_total', topic='Algebra', result='correct')"""
+    if not (METRICS_FILE or METRICS_PORT):
+        return
+    key = tuple(sorted(labels.items()))
+    with _metrics_lock:
+        series = _metrics.setdefault(name, {})
+        series[key] = series.get(key, 0) + amount
+
+def observe(name, seconds, **labels):
+    """Add a duration to a histogram"""
+    key = tuple(sorted(labels.items()))
+    with _metrics_lock:
+        series = _metrics.setdefault(name, {})
+        values = series.setdefault(key, [0] * (len(BUCKETS) + 2))
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                values[i] += 1
+        values[-2] += seconds
+        values[-1] += 1
+
+def format_labels(labels):
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}' if labels else ''
+
+def metrics_text():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    with _metrics_lock:
+        for name in sorted(_metrics):
+            kind, help_text = HELP.get(name, ('counter', name))
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            for labels, value in sorted(_metrics[name].items()):
+                if kind == 'counter':
+                    lines.append(f"{name}{format_labels(labels)} {value}")
+                    continue
+                for bound, bucket in zip(BUCKETS, value):
+                    lines.append(f"{name}_bucket{format_labels(labels + (('le', bound),))} {bucket}")
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {value[-1]}")
+                lines.append(f"{name}_sum{format_labels(labels)} {value[-2]:.6f}")
+                lines.append(f"{name}_count{format_labels(labels)} {value[-1]}")
+    return '\n'.join(lines) + '\n'
+
+def write_metrics_file():
+    """Rewrite MATH_METRICS_FILE, at most once per FILE_INTERVAL"""
+    now = time.monotonic()
+    if now - _exports['file_written'] < FILE_INTERVAL:
+        return
+    _exports['file_written'] = now
+    tmp_path = f"{METRICS_FILE}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(metrics_text())
+    os.replace(tmp_path, METRICS_FILE)
+
+def start_server():
+    """Serve /metrics on localhost from a background thread, once per process"""
+    with _metrics_lock:
+        if _exports['server'] is not None:
+            return
+        _exports['server'] = False
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != '/metrics':
+                self.send_error(404)
+                return
+            body = metrics_text().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    try:
+        server = ThreadingHTTPServer(('127.0.0.1', METRICS_PORT), MetricsHandler)
+    except OSError as e:
+        print(f"[metrics] can't serve on port {METRICS_PORT}: {e}", file=sys.stderr)
+        return
+    _exports['server'] = server
+    threading.Thread(target=server.serve_forever, daemon=True).start()
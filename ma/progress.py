@@ -0,0 +1,143 @@
+"""Progress rules: points, levels, streaks, achievements and answered problems.
+
+Shared by the app and offline grading so both update a student the same
+way. Each function changes user data in place, adds what it changed to a
+change record (see storage) and returns the messages to show the student,
+such as level ups and unlocked achievements.
+"""
+from datetime import datetime
+
+import achievements
+
+POINTS_PER_LEVEL = 100
+
+def record_change(changes, op, key, value):
+    """Add a change to a change record so the next save persists it"""
+    if op == 'set':
+        changes['set'][key] = value
+    elif op == 'merge':
+        changes['merge'].setdefault(key, {}).update(value)
+    elif op == 'append':
+        changes['append'].setdefault(key, []).append(value)
+
+def day_rollup(user_data, changes, ts):
+    """The daily rollup entry for the day of `ts`, marked as changed"""
+    day_str = datetime.fromtimestamp(ts).strftime("%Y-%m-%d")
+    day = user_data['daily_rollup'].get(day_str)
+    if day is None:
+        day = {'points_gained': 0, 'total_points': user_data['points'], 'topics': {}}
+        user_data['daily_rollup'][day_str] = day
+    record_change(changes, 'merge', 'daily_rollup', {day_str: day})
+    return day
+
+def check_achievements(user_data, changes, *metrics):
+    """Unlock the achievements reached for the metrics that just changed"""
+    messages = []
+    for metric in metrics:
+        value = achievements.metric_value(user_data, metric)
+        for rule in achievements.RULEBOOK.newly_reached(metric, value, user_data['achievements']):
+            user_data['achievements'].add(rule.id)
+            record_change(changes, 'append', 'achievements', rule.id)
+            messages.append(f"🏆 Achievement Unlocked: {rule.label}!")
+    return messages
+
+def update_streak(user_data, changes, ts):
+    """Count activity at `ts` towards the daily streak"""
+    active_days = user_data['active_days']
+    if not active_days.mark(datetime.fromtimestamp(ts).date()):
+        return []  # already active that day
+
+    # Older activity (e.g. a paper quiz graded later) can join up an earlier gap
+    last_day = active_days.last_day()
+    user_data['daily_streak'] = active_days.streak_ending(last_day)
+    user_data['last_activity_date'] = last_day.strftime("%Y-%m-%d")
+    record_change(changes, 'set', 'active_days', active_days)
+    record_change(changes, 'set', 'daily_streak', user_data['daily_streak'])
+    record_change(changes, 'set', 'last_activity_date', user_data['last_activity_date'])
+    return check_achievements(user_data, changes, 'streak')
+
+def add_points(user_data, changes, points, ts):
+    """Add points earned at `ts` and check for level up"""
+    messages = []
+    user_data['points'] += points
+    record_change(changes, 'set', 'points', user_data['points'])
+
+    # Record points for graphing: timestamp, points gained, total points
+    entry = (ts, points, user_data['points'])
+    user_data['points_history'].append(entry)
+    record_change(changes, 'append', 'points_history', entry)
+    day = day_rollup(user_data, changes, ts)
+    day['points_gained'] += points
+    day['total_points'] = user_data['points']
+
+    # Level up every 100 points
+    new_level = user_data['points'] // POINTS_PER_LEVEL + 1
+    if new_level > user_data['level']:
+        user_data['level'] = new_level
+        record_change(changes, 'set', 'level', new_level)
+        messages.append(f"🎉 Level Up! You are now Level {new_level}!")
+    return messages + check_achievements(user_data, changes, 'points')
+
+def record_attempt(user_data, changes, problem, topic, correct, ts, response_ms=0):
+    """Apply an answered problem: points, streak, counts and achievements when correct, history always.
+
+    problem is a catalog.Problem; response_ms is how long the student took to answer, 0 if unknown.
+    """
+    messages = []
+    if correct:
+        messages += add_points(user_data, changes, problem.points, ts)
+        messages += update_streak(user_data, changes, ts)
+
+        # Update math problems completed count
+        completed = user_data['math_problems_completed']
+        completed[topic] = completed.get(topic, 0) + 1
+        record_change(changes, 'merge', 'math_problems_completed', {topic: completed[topic]})
+        user_data['problems_solved'] += 1
+        record_change(changes, 'set', 'problems_solved', user_data['problems_solved'])
+        types_completed = user_data['math_types_completed']
+        types_completed[problem.type] = types_completed.get(problem.type, 0) + 1
+        record_change(changes, 'merge', 'math_types_completed', {problem.type: types_completed[problem.type]})
+        messages += check_achievements(user_data, changes, 'problems', f"topic:{topic}", f"type:{problem.type}")
+
+    # Record the attempt: timestamp, topic, question type, correct, points, problem id, response time
+    attempt = (ts, topic, problem.type, int(correct), problem.points if correct else 0, problem.id, int(response_ms))
+    user_data['math_quiz_history'].append(attempt)
+    record_change(changes, 'append', 'math_quiz_history', attempt)
+    day = day_rollup(user_data, changes, ts)
+    day['topics'].setdefault(topic, [0, 0])[0 if correct else 1] += 1
+    return messages
+
+def record_exam(user_data, changes, graded, ts):
+    """Apply a whole answer sheet with the rules of record_attempt, as one update: a single points
+    entry, streak update and achievement check however many questions there are.
+
+    graded holds (problem, topic, correct) per question. Answers handed in together have no
+    response time of their own, so their history entries record 0 (unknown).
+    """
+    messages = []
+    solved = [(problem, topic) for problem, topic, correct in graded if correct]
+    if solved:
+        messages += add_points(user_data, changes, sum(problem.points for problem, _ in solved), ts)
+        messages += update_streak(user_data, changes, ts)
+
+        completed = user_data['math_problems_completed']
+        types_completed = user_data['math_types_completed']
+        for problem, topic in solved:
+            completed[topic] = completed.get(topic, 0) + 1
+            types_completed[problem.type] = types_completed.get(problem.type, 0) + 1
+        topics = sorted({topic for _, topic in solved})
+        types = sorted({problem.type for problem, _ in solved})
+        record_change(changes, 'merge', 'math_problems_completed', {topic: completed[topic] for topic in topics})
+        record_change(changes, 'merge', 'math_types_completed', {kind: types_completed[kind] for kind in types})
+        user_data['problems_solved'] += len(solved)
+        record_change(changes, 'set', 'problems_solved', user_data['problems_solved'])
+        messages += check_achievements(user_data, changes, 'problems', *(f"topic:{topic}" for topic in topics),
+                                       *(f"type:{kind}" for kind in types))
+
+    day = day_rollup(user_data, changes, ts)
+    for problem, topic, correct in graded:
+        attempt = (ts, topic, problem.type, int(correct), problem.points if correct else 0, problem.id, 0)
+        user_data['math_quiz_history'].append(attempt)
+        record_change(changes, 'append', 'math_quiz_history', attempt)
+        day['topics'].setdefault(topic, [0, 0])[0 if correct else 1] += 1
+    return messages
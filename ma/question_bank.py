@@ -0,0 +1,180 @@
+"""On-disk question bank.
+
+Hand-written questions live in a SQLite file (MATH_QUESTION_BANK, default
+math_questions.db) instead of the app's code. The first time the file is
+opened it is created from math_content.math_data. Questions are indexed by
+topic, grade range, type and points; a process only keeps the row ids for
+the filters it has been asked for, and a random pick reads a single row.
+
+Edits to the file, with the sqlite3 shell or with
+
+    python question_bank.py --import questions.csv
+
+are picked up on the next pick through an mtime check, without restarting
+the server.
+"""
+import argparse
+import csv
+import hashlib
+import os
+import random
+import sqlite3
+import threading
+from array import array
+
+from math_content import math_data
+
+DEFAULT_PATH = 'math_questions.db'
+GRADES = range(7, 13)
+
+# Grades the hand-written questions are seeded for, by topic
+GRADE_RANGES = {
+    "Algebra": (7, 12),
+    "Geometry": (7, 12),
+    "Trigonometry": (9, 12),
+    "Calculus": (11, 12),
+    "Statistics": (7, 12),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS questions (
+    id TEXT NOT NULL UNIQUE,
+    topic TEXT NOT NULL,
+    type TEXT NOT NULL,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    points INTEGER NOT NULL,
+    image TEXT,
+    min_grade INTEGER NOT NULL DEFAULT 7,
+    max_grade INTEGER NOT NULL DEFAULT 12
+);
+CREATE INDEX IF NOT EXISTS questions_topic_grade ON questions (topic, min_grade, max_grade, type, points);
+"""
+COLUMNS = ('id', 'topic', 'type', 'question', 'answer', 'points', 'image', 'min_grade', 'max_grade')
+
+def problem_id(problem_type, question):
+    """Stable id for a problem: the same question always gets the same id"""
+    return hashlib.sha1(f"{problem_type}|{question}".encode()).hexdigest()[:12]
+
+def question_row(topic, item, min_grade=None, max_grade=None):
+    """Table row for a problem dict"""
+    default_min, default_max = GRADE_RANGES.get(topic, (min(GRADES), max(GRADES)))
+    return (problem_id(item['type'], item['question']), topic, item['type'], item['question'], item['answer'],
+            int(item['points']), item.get('image') or None,
+            int(min_grade or default_min), int(max_grade or default_max))
+
+def insert_rows(conn, rows):
+    """Add questions, replacing any with the same id"""
+    with conn:
+        conn.executemany(f"INSERT OR REPLACE INTO questions ({', '.join(COLUMNS)}) "
+                         f"VALUES ({', '.join('?' * len(COLUMNS))})", rows)
+
+def create_bank(path):
+    """Write a new bank file holding the hand-written questions"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.executescript(SCHEMA)
+        insert_rows(conn, [question_row(topic, item) for topic, items in math_data.items() for item in items])
+    finally:
+        conn.close()
+    os.replace(tmp_path, path)
+
+class QuestionBank:
+    """Random picks from the bank file, reloading when the file changes"""
+
+    def __init__(self, path=DEFAULT_PATH):
+        if not os.path.exists(path):
+            create_bank(path)
+        self.path = path
+        self._local = threading.local()  # one read connection per session thread
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._ids = {}  # filter -> row ids
+
+    def _connection(self):
+        if not hasattr(self._local, 'conn'):
+            self._local.conn = sqlite3.connect(self.path, check_same_thread=False)
+        return self._local.conn
+
+    def _check_reload(self):
+        """Forget cached row ids once the file has been edited"""
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime != self._mtime:
+            with self._lock:
+                self._ids = {}
+                self._mtime = mtime
+
+    def _row_ids(self, topic, grade, problem_type, points):
+        key = (topic, grade, problem_type, points)
+        ids = self._ids.get(key)
+        if ids is None:
+            sql, params = 'SELECT rowid FROM questions WHERE topic = ?', [topic]
+            if grade is not None:
+                sql += ' AND min_grade <= ? AND max_grade >= ?'
+                params += [grade, grade]
+            if problem_type is not None:
+                sql += ' AND type = ?'
+                params.append(problem_type)
+            if points is not None:
+                sql += ' AND points = ?'
+                params.append(points)
+            ids = array('q', (rowid for rowid, in self._connection().execute(sql, params)))
+            with self._lock:
+                self._ids[key] = ids
+        return ids
+
+    def count(self, topic, grade=None, problem_type=None, points=None):
+        """Number of questions matching the filters"""
+        self._check_reload()
+        return len(self._row_ids(topic, grade, problem_type, points))
+
+    def random_problem(self, topic, grade=None, problem_type=None, points=None):
+        """One random question matching the filters as a problem dict, or None"""
+        self._check_reload()
+        ids = self._row_ids(topic, grade, problem_type, points)
+        if not ids:
+            return None
+        row = self._connection().execute('SELECT id, type, question, answer, points, image FROM questions '
+                                         'WHERE rowid = ?', (random.choice(ids),)).fetchone()
+        if row is None:
+            return None  # removed since the ids were cached
+        return dict(zip(('id', 'type', 'question', 'answer', 'points', 'image'), row))
+
+    def get(self, problem_id):
+        """The question with this id as a problem dict plus its topic, or None"""
+        row = self._connection().execute('SELECT id, type, question, answer, points, image, topic FROM questions '
+                                         'WHERE id = ?', (problem_id,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('id', 'type', 'question', 'answer', 'points', 'image', 'topic'), row))
+
+def open_bank(path=None):
+    """The question bank at MATH_QUESTION_BANK, created on first use"""
+    return QuestionBank(path or os.environ.get('MATH_QUESTION_BANK', DEFAULT_PATH))
+
+def import_csv(bank_path, csv_path):
+    """Add or replace questions from a CSV file with a header row naming the columns:
+    topic, type, question, answer, points and optionally image, min_grade, max_grade"""
+    if not os.path.exists(bank_path):
+        create_bank(bank_path)
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        rows = [question_row(item['topic'], item, item.get('min_grade'), item.get('max_grade'))
+                for item in csv.DictReader(f)]
+    conn = sqlite3.connect(bank_path)
+    try:
+        insert_rows(conn, rows)
+    finally:
+        conn.close()
+    return len(rows)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Create the question bank or add questions to it")
+    parser.add_argument('--bank', default=os.environ.get('MATH_QUESTION_BANK', DEFAULT_PATH))
+    parser.add_argument('--import', dest='csv_path', metavar='CSV', help="add or replace questions from a CSV file")
+    args = parser.parse_args()
+    if args.csv_path:
+        print(f"Imported {import_csv(args.bank, args.csv_path)} questions into {args.bank}")
+    else:
+        open_bank(args.bank)
+        print(f"Question bank ready at {args.bank}")
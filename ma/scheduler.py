@@ -0,0 +1,116 @@
+"""Spaced repetition for practice problems (Leitner boxes).
+
+Every problem a student answers becomes a review card: its Leitner box, the
+time it is next due, its topic and the problem itself, as the catalog's
+shared record (saved as a list of its fields). A correct answer
+moves the card up a box and pushes its next review further out; a wrong
+answer sends it back to the first box and brings it back within minutes.
+
+Cards wait in one due-time heap per topic, so picking the next problem is a
+heap pop however many cards a student has collected. When nothing is due, a
+fresh problem comes from the shared problem pool instead. The number of
+cards due is kept up to date the same way, from one more heap of cards that
+are not due yet.
+"""
+import heapq
+
+from catalog import CATALOG, intern
+
+RETRY_DELAY = 10 * 60  # seconds before a missed problem comes back
+BOX_INTERVALS = [0, 1, 3, 7, 14, 30]  # days until the next review, per box
+DAY = 24 * 60 * 60
+
+def new_card(problem, topic):
+    """Review card for a problem the student hasn't answered before"""
+    return {'box': 0, 'due': 0, 'topic': topic, 'problem': problem}
+
+def load_cards(cards):
+    """Saved cards with their problems swapped for the catalog's shared records"""
+    return {problem_id: dict(card, topic=intern(card['topic']), problem=CATALOG.record(card['problem']))
+            for problem_id, card in cards.items()}
+
+def reviewed(card, correct, now):
+    """The card after an answer: up a box when correct, back to the first when not"""
+    if correct:
+        box = min(card['box'] + 1, len(BOX_INTERVALS) - 1)
+        due = now + BOX_INTERVALS[box] * DAY
+    else:
+        box = 0
+        due = now + RETRY_DELAY
+    return dict(card, box=box, due=due)
+
+class Scheduler:
+    """A student's review cards with one due-time heap per topic.
+
+    Heap entries are (due, problem id). Rescheduling a card pushes a new
+    entry and leaves the old one behind; stale entries are skipped when they
+    reach the top, which keeps every update O(log n). Cards move from the
+    upcoming heap into the due set as their time comes, so counting the due
+    cards doesn't look at the others.
+    """
+
+    def __init__(self, cards=None):
+        self.cards = cards if cards is not None else {}
+        self._heaps = {}
+        for problem_id, card in self.cards.items():
+            self._heaps.setdefault(card['topic'], []).append((card['due'], problem_id))
+        for heap in self._heaps.values():
+            heapq.heapify(heap)
+        self._upcoming = [(card['due'], problem_id) for problem_id, card in self.cards.items()]
+        heapq.heapify(self._upcoming)
+        self._due = set()  # ids of cards found due by due_count
+        self._serving = None  # id of the card last served by next() and not answered yet
+
+    def _pop_due(self, topic, now):
+        """Pop the most overdue card of a topic, or None if nothing is due"""
+        heap = self._heaps.get(topic, [])
+        while heap and heap[0][0] <= now:
+            due, problem_id = heapq.heappop(heap)
+            card = self.cards.get(problem_id)
+            if card is not None and card['due'] == due:
+                return card
+        return None
+
+    def due_count(self, now):
+        """Number of cards due for review; `now` never goes backwards"""
+        upcoming = self._upcoming
+        while upcoming and upcoming[0][0] <= now:
+            due, problem_id = heapq.heappop(upcoming)
+            card = self.cards.get(problem_id)
+            if card is not None and card['due'] == due:
+                self._due.add(problem_id)
+        return len(self._due)
+
+    def next(self, topics, now, fresh):
+        """Next problem for any of `topics`: the most overdue card, else `fresh(topic)`.
+
+        A served card leaves its heap until it is answered, so asking again
+        moves on to another problem; the card it skips goes back on its heap
+        then, to come round again.
+        """
+        skipped, self._serving = self._serving, None
+        try:
+            due = [(self._heaps[topic][0][0], topic) for topic in topics if self._heaps.get(topic)]
+            for _, topic in sorted(due):
+                card = self._pop_due(topic, now)
+                if card is not None:
+                    self._serving = card['problem'].id
+                    return card['problem'], topic
+            topic = topics[now % len(topics)]
+            return fresh(topic), topic
+        finally:
+            card = self.cards.get(skipped)
+            if card is not None:
+                heapq.heappush(self._heaps.setdefault(card['topic'], []), (card['due'], skipped))
+
+    def answer(self, problem, topic, correct, now):
+        """Reschedule a problem after an answer and return its updated card"""
+        card = self.cards.get(problem.id) or new_card(problem, topic)
+        card = reviewed(card, correct, now)
+        self.cards[problem.id] = card
+        heapq.heappush(self._heaps.setdefault(topic, []), (card['due'], problem.id))
+        if self._serving == problem.id:
+            self._serving = None
+        self._due.discard(problem.id)
+        heapq.heappush(self._upcoming, (card['due'], problem.id))
+        return card
@@ -0,0 +1,614 @@
+"""Storage backends for student progress.
+
+The backend is picked with the MATH_STORAGE environment variable:
+
+- ``json`` (default): a snapshot file plus an append-only change log per student
+- ``sqlite``: one shared SQLite database with profile, points history and
+  quiz history tables, keyed by student
+
+Both backends receive the same change records built by the app: a dict with
+``set`` (replaced keys), ``merge`` (dict keys updated in place) and ``append``
+(list items added) sections.
+"""
+import atexit
+import copy
+import hashlib
+import json
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from activity import ActiveDays, backfill_active_days, load_active_days
+from history import HISTORY_WINDOW, History, format_ts, load_history, pad_row
+from scheduler import load_cards
+
+HISTORY_KEYS = ('points_history', 'math_quiz_history')
+
+# --- CHANGE RECORDS ---
+
+def default_user_data(student_name=''):
+    """Fresh user data for a new student"""
+    return {
+        'current_grade': 'Grade 7',
+        'student_name': student_name,
+        'daily_streak': 0,
+        'last_activity_date': None,
+        'points': 0,
+        'level': 1,
+        'daily_challenges_completed': [],
+        'achievements': set(),
+        'points_history': History('points_history'),
+        'math_problems_completed': {},
+        'math_quiz_history': History('math_quiz_history'),
+        'daily_rollup': {},
+        'problems_solved': 0,
+        'math_types_completed': {},
+        'review_cards': {},
+        'active_days': ActiveDays(),
+        'exams_taken': set()
+    }
+
+def upgrade_user_data(data):
+    """Bring user data from an older save up to the current shape"""
+    if 'daily_rollup' not in data:
+        data['daily_rollup'] = build_daily_rollup(data.get('points_history', []), data.get('math_quiz_history', []))
+    for key in HISTORY_KEYS:
+        data[key] = load_history(key, data.get(key, []))
+    data['achievements'] = set(data['achievements'])
+    data['exams_taken'] = set(data.get('exams_taken', []))
+    data.setdefault('problems_solved', sum(data['math_problems_completed'].values()))
+    data.setdefault('math_types_completed', {})
+    data['review_cards'] = load_cards(data.get('review_cards', {}))
+    data['active_days'] = load_active_days(data['active_days']) if 'active_days' in data else backfill_active_days(data)
+    return data
+
+def build_daily_rollup(points_history, quiz_history):
+    """Per-day aggregates rebuilt from full (dict entry) history, for saves made before the rollup existed"""
+    rollup = {}
+    for entry in points_history:
+        day = rollup.setdefault(entry['date'][:10], {'points_gained': 0, 'total_points': None, 'topics': {}})
+        day['points_gained'] += entry['points_gained']
+        day['total_points'] = entry['total_points']
+    for attempt in quiz_history:
+        day = rollup.setdefault(attempt['timestamp'][:10], {'points_gained': 0, 'total_points': None, 'topics': {}})
+        day['topics'].setdefault(attempt['topic'], [0, 0])[0 if attempt['result'] == 'Correct' else 1] += 1
+    # Days with attempts but no points carry the previous day's total forward
+    total = 0
+    for key in sorted(rollup):
+        if rollup[key]['total_points'] is None:
+            rollup[key]['total_points'] = total
+        total = rollup[key]['total_points']
+    return rollup
+
+def new_changes():
+    """Empty change record: replaced keys, merged dict keys and appended list items"""
+    return {'set': {}, 'merge': {}, 'append': {}}
+
+# Rebuild values saved in their JSON form, so replayed changes match live ones
+LOADERS = {'active_days': load_active_days, 'review_cards': load_cards}
+
+def apply_changes(data, changes):
+    """Apply one change record to a user data dict"""
+    for key, value in changes.get('set', {}).items():
+        data[key] = LOADERS[key](value) if key in LOADERS else value
+    for key, values in changes.get('merge', {}).items():
+        data.setdefault(key, {}).update(LOADERS[key](values) if key in LOADERS else values)
+    for key, items in changes.get('append', {}).items():
+        target = data.setdefault(key, [])
+        if isinstance(target, set):
+            target.update(items)
+        else:
+            target.extend(items)
+    return data
+
+def merge_changes(into, changes):
+    """Fold a later change record into an earlier one so both can be written as one"""
+    for key, value in changes.get('set', {}).items():
+        # A replaced key makes earlier merges and appends to it moot
+        into['merge'].pop(key, None)
+        into['append'].pop(key, None)
+        into['set'][key] = value
+    for key, values in changes.get('merge', {}).items():
+        into['merge'].setdefault(key, {}).update(values)
+    for key, items in changes.get('append', {}).items():
+        into['append'].setdefault(key, []).extend(items)
+    return into
+
+def write_atomic(path, text):
+    """Replace a file so that a crash leaves either the old or the new version.
+    The temporary file is per process, so processes sharing a file don't write into each other's."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def encode_value(value):
+    """JSON form of the non-JSON values in user data: histories, active days and the achievements set"""
+    if isinstance(value, (History, ActiveDays)):
+        return value.to_json()
+    if isinstance(value, set):
+        return sorted(value)
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+def compact_json(value):
+    """Serialize without whitespace for log records and snapshots"""
+    return json.dumps(value, separators=(',', ':'), default=encode_value)
+
+EXPORT_BATCH = 10_000  # attempts per batch read by attempts_since()
+
+class Storage:
+    """Interface shared by the storage backends"""
+
+    def load(self, student):
+        """Return the saved user data for a student, or None if they are new"""
+        raise NotImplementedError
+
+    def save(self, student, changes):
+        """Persist one change record made to a student's user data"""
+        raise NotImplementedError
+
+    def flush(self, student=None):
+        """Make sure saved changes have reached disk"""
+
+    def attempts_since(self, watermark, batch_size=EXPORT_BATCH):
+        """Yield (attempts, watermark) batches of every student's quiz attempts saved after `watermark`.
+
+        Attempts are (student, ts, topic, question_type, correct, points,
+        problem_id, response_ms) tuples. The watermark is a JSON value (None
+        the first time); the one yielded with the last batch covers them all.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+# --- JSON SNAPSHOT + EVENT LOG BACKEND ---
+# Every save appends one compact change record to the student's log instead of
+# rewriting their whole document. Once enough records pile up, a background
+# thread folds them into a new snapshot and trims the log.
+
+LEGACY_DATA_FILE = 'math_user_data.json'
+LEGACY_LOG_FILE = 'math_user_data.log'
+SNAPSHOT_EVERY = 200  # log records to collect before writing a new snapshot
+
+def read_snapshot(path):
+    """Return (seq, user_data) from a snapshot file"""
+    if not os.path.exists(path):
+        return 0, default_user_data()
+    with open(path, 'r') as f:
+        snapshot = json.load(f)
+    if 'user_data' not in snapshot:
+        # Plain user data written before the event log existed
+        return 0, upgrade_user_data(snapshot)
+    return snapshot['seq'], upgrade_user_data(snapshot['user_data'])
+
+def read_log(path, after_seq):
+    """Return the logged change records newer than after_seq"""
+    records = []
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # record torn by a crash mid-write
+                if record['seq'] > after_seq:
+                    records.append(record)
+    return records
+
+def rebuild(data_path, log_path):
+    """Replay the log tail over the snapshot, returning (seq, user_data, records replayed)"""
+    seq, data = read_snapshot(data_path)
+    records = read_log(log_path, seq)
+    for record in records:
+        apply_changes(data, record)
+        seq = record['seq']
+    return seq, data, len(records)
+
+def append_line(path, line):
+    """Durably append one line, first terminating any line torn by an earlier crash"""
+    with open(path, 'a+b') as f:
+        if f.seek(0, os.SEEK_END):
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                f.write(b'\n')
+        f.write(line.encode('utf-8') + b'\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+class JsonLogStorage(Storage):
+    """Per-student snapshot and change log files in one directory"""
+
+    def __init__(self, directory='math_user_data', snapshot_every=SNAPSHOT_EVERY):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        self._states = {}
+        self._states_lock = threading.Lock()
+
+    def _state(self, student):
+        """Lock and log counters for one student, shared by all their sessions"""
+        with self._states_lock:
+            if student not in self._states:
+                self._states[student] = {'lock': threading.Lock(), 'seq': None, 'records': 0, 'compacting': False}
+            return self._states[student]
+
+    def _paths(self, student):
+        slug = re.sub(r'[^A-Za-z0-9_-]+', '_', student)[:40]
+        digest = hashlib.sha1(student.encode('utf-8')).hexdigest()[:8]
+        base = os.path.join(self.directory, f"{slug}-{digest}")
+        return base + '.json', base + '.log'
+
+    def _import_legacy(self, student, data_path):
+        """Adopt the old single-file save if it belongs to this student"""
+        if not os.path.exists(LEGACY_DATA_FILE):
+            return None
+        _, data, _ = rebuild(LEGACY_DATA_FILE, LEGACY_LOG_FILE)
+        if data.get('student_name') != student:
+            return None
+        write_atomic(data_path, compact_json({'seq': 0, 'user_data': data}))
+        return data
+
+    def load(self, student):
+        data_path, log_path = self._paths(student)
+        if not os.path.exists(data_path) and not os.path.exists(log_path):
+            return self._import_legacy(student, data_path)
+        state = self._state(student)
+        with state['lock']:
+            state['seq'], data, state['records'] = rebuild(data_path, log_path)
+        return data
+
+    def save(self, student, changes):
+        record = {op: values for op, values in changes.items() if values}
+        if not record:
+            return
+        data_path, log_path = self._paths(student)
+        state = self._state(student)
+        with state['lock']:
+            if state['seq'] is None:
+                state['seq'], _, state['records'] = rebuild(data_path, log_path)
+            record['seq'] = state['seq'] + 1
+            append_line(log_path, compact_json(record))
+            state['seq'] = record['seq']
+            state['records'] += 1
+            start_compaction = state['records'] >= self.snapshot_every and not state['compacting']
+            if start_compaction:
+                state['compacting'] = True
+        if start_compaction:
+            threading.Thread(target=self._compact, args=(state, data_path, log_path), daemon=True).start()
+
+    def attempts_since(self, watermark, batch_size=EXPORT_BATCH):
+        """The watermark holds how many of each student file's attempts have been exported, counted
+        from the daily rollup. Only the recent history window is kept, so attempts that dropped
+        out of it before an export are missed."""
+        watermark = dict(watermark or {})
+        bases = sorted({os.path.splitext(name)[0] for name in os.listdir(self.directory)
+                        if name.endswith(('.json', '.log'))})
+        batch = []
+        for base in bases:
+            path = os.path.join(self.directory, base)
+            _, data, _ = rebuild(path + '.json', path + '.log')
+            history = data['math_quiz_history']
+            total = sum(correct + incorrect for day in data['daily_rollup'].values()
+                        for correct, incorrect in day['topics'].values())
+            new = min(total - watermark.get(base, 0), len(history))
+            if new > 0:
+                batch += [(data['student_name'], *attempt) for attempt in history.rows(len(history) - new)]
+            watermark[base] = total
+            if len(batch) >= batch_size:
+                yield batch, dict(watermark)
+                batch = []
+        if batch:
+            yield batch, watermark
+
+    def _compact(self, state, data_path, log_path):
+        """Fold the log into a new snapshot, then drop the records it covers"""
+        try:
+            seq, data, _ = rebuild(data_path, log_path)
+            write_atomic(data_path, compact_json({'seq': seq, 'user_data': data}))
+            with state['lock']:
+                tail = read_log(log_path, seq)
+                write_atomic(log_path, ''.join(compact_json(r) + '\n' for r in tail))
+                state['records'] = len(tail)
+        finally:
+            state['compacting'] = False
+
+# --- SQLITE BACKEND ---
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS profile (
+    student TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS points_history (
+    id INTEGER PRIMARY KEY,
+    student TEXT NOT NULL,
+    date TEXT NOT NULL,
+    points_gained INTEGER NOT NULL,
+    total_points INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS points_history_student ON points_history (student, id);
+CREATE TABLE IF NOT EXISTS quiz_history (
+    id INTEGER PRIMARY KEY,
+    student TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    question_type TEXT NOT NULL,
+    result TEXT NOT NULL,
+    points INTEGER NOT NULL,
+    problem_id TEXT NOT NULL DEFAULT '',
+    response_ms INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS quiz_history_student ON quiz_history (student, id);
+CREATE TABLE IF NOT EXISTS review_cards (
+    student TEXT NOT NULL,
+    problem_id TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    box INTEGER NOT NULL,
+    due INTEGER NOT NULL,
+    problem TEXT NOT NULL,
+    PRIMARY KEY (student, problem_id)
+);
+"""
+
+# Columns added to tables after databases were created with them: table -> [(column, definition)]
+ADDED_COLUMNS = {
+    'quiz_history': [('problem_id', "TEXT NOT NULL DEFAULT ''"), ('response_ms', 'INTEGER NOT NULL DEFAULT 0')],
+}
+
+class SQLiteStorage(Storage):
+    """Shared SQLite database in WAL mode, accessed through a small connection pool.
+
+    The profile row holds everything except the history and the review
+    cards, which live in their own indexed tables: loading a student reads
+    only the recent window of the history, and a save upserts just the cards
+    it changed instead of rewriting them all in the profile.
+    """
+
+    def __init__(self, path='math_user_data.db', pool_size=4):
+        self.path = path
+        self._pool = queue.Queue()
+        for _ in range(pool_size):
+            self._pool.put(self._connect())
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+            for table, columns in ADDED_COLUMNS.items():
+                existing = {row['name'] for row in conn.execute(f'PRAGMA table_info({table})')}
+                for column, definition in columns:
+                    if column not in existing:
+                        try:
+                            conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+                        except sqlite3.OperationalError as e:
+                            if 'duplicate column' not in str(e):
+                                raise  # otherwise another process added it first
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    def load(self, student):
+        with self._connection() as conn:
+            row = conn.execute('SELECT data FROM profile WHERE student = ?', (student,)).fetchone()
+            if row is None:
+                return None
+            data = json.loads(row['data'])
+            if 'daily_rollup' not in data:
+                # One-off full read for profiles saved before the rollup existed
+                data['daily_rollup'] = build_daily_rollup(
+                    self._history_dicts(conn, 'points_history', student),
+                    self._history_dicts(conn, 'quiz_history', student))
+                with conn:
+                    conn.execute('UPDATE profile SET data = ? WHERE student = ?', (compact_json(data), student))
+            if 'review_cards' in data:
+                with conn:
+                    self._move_profile_cards(conn, student, data)
+                    conn.execute('UPDATE profile SET data = ? WHERE student = ?', (compact_json(data), student))
+            data['review_cards'] = {
+                row['problem_id']: {'box': row['box'], 'due': row['due'], 'topic': row['topic'],
+                                    'problem': json.loads(row['problem'])}
+                for row in conn.execute('SELECT * FROM review_cards WHERE student = ?', (student,))}
+            data['points_history'] = self._history_dicts(conn, 'points_history', student, HISTORY_WINDOW)
+            data['math_quiz_history'] = self._history_dicts(conn, 'quiz_history', student, HISTORY_WINDOW)
+        return upgrade_user_data(data)
+
+    def _history_dicts(self, conn, table, student, limit=-1):
+        """A student's newest `limit` history rows (all with -1) as dicts, oldest first"""
+        rows = [dict(row) for row in conn.execute(
+            f'SELECT * FROM {table} WHERE student = ? ORDER BY id DESC LIMIT ?', (student, limit))]
+        rows.reverse()
+        return rows
+
+    def _write_cards(self, conn, student, cards):
+        """Insert or replace review cards"""
+        conn.executemany(
+            'INSERT INTO review_cards (student, problem_id, topic, box, due, problem) VALUES (?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT (student, problem_id) DO UPDATE SET '
+            'topic = excluded.topic, box = excluded.box, due = excluded.due, problem = excluded.problem',
+            [(student, problem_id, card['topic'], card['box'], card['due'], compact_json(card['problem']))
+             for problem_id, card in cards.items()])
+
+    def _move_profile_cards(self, conn, student, profile):
+        """One-off move of cards saved inside the profile before they had their own table.
+        Cards already in the table are newer and are kept."""
+        conn.executemany(
+            'INSERT OR IGNORE INTO review_cards (student, problem_id, topic, box, due, problem) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            [(student, problem_id, card['topic'], card['box'], card['due'], compact_json(card['problem']))
+             for problem_id, card in profile.pop('review_cards').items()])
+
+    def attempts_since(self, watermark, batch_size=EXPORT_BATCH):
+        """The watermark is the id of the last exported quiz_history row"""
+        last_id = watermark or 0
+        with self._connection() as conn:
+            while True:
+                rows = conn.execute(
+                    "SELECT id, student, CAST(strftime('%s', timestamp, 'utc') AS INTEGER), topic, question_type, "
+                    "result = 'Correct', points, problem_id, response_ms FROM quiz_history "
+                    "WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch_size)).fetchall()
+                if not rows:
+                    return
+                last_id = rows[-1][0]
+                yield [tuple(row)[1:] for row in rows], last_id
+
+    def save(self, student, changes):
+        if not any(changes.values()):
+            return
+        appended = changes.get('append', {})
+        profile_changes = {
+            'set': {key: value for key, value in changes.get('set', {}).items() if key != 'review_cards'},
+            'merge': {key: values for key, values in changes.get('merge', {}).items() if key != 'review_cards'},
+            'append': {key: items for key, items in appended.items() if key not in HISTORY_KEYS}
+        }
+        with self._connection() as conn:
+            with conn:  # one transaction per change record
+                # Read-modify-write the profile under a write lock so concurrent saves don't clobber it
+                conn.execute('BEGIN IMMEDIATE')
+                row = conn.execute('SELECT data FROM profile WHERE student = ?', (student,)).fetchone()
+                if row is None:
+                    profile = {key: value for key, value in default_user_data(student).items()
+                               if key not in HISTORY_KEYS and key != 'review_cards'}
+                else:
+                    profile = json.loads(row['data'])
+                    if 'review_cards' in profile:
+                        self._move_profile_cards(conn, student, profile)
+                apply_changes(profile, profile_changes)
+                conn.execute(
+                    'INSERT INTO profile (student, data) VALUES (?, ?) '
+                    'ON CONFLICT (student) DO UPDATE SET data = excluded.data',
+                    (student, compact_json(profile)))
+                if 'review_cards' in changes.get('set', {}):
+                    conn.execute('DELETE FROM review_cards WHERE student = ?', (student,))
+                    self._write_cards(conn, student, changes['set']['review_cards'])
+                self._write_cards(conn, student, changes.get('merge', {}).get('review_cards', {}))
+                conn.executemany(
+                    'INSERT INTO points_history (student, date, points_gained, total_points) VALUES (?, ?, ?, ?)',
+                    [(student, format_ts(ts), gained, total)
+                     for ts, gained, total in appended.get('points_history', [])])
+                conn.executemany(
+                    'INSERT INTO quiz_history (student, timestamp, topic, question_type, result, points, '
+                    'problem_id, response_ms) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    [(student, format_ts(ts), topic, question_type, 'Correct' if correct else 'Incorrect', points,
+                      problem_id, response_ms)
+                     for ts, topic, question_type, correct, points, problem_id, response_ms
+                     in (pad_row('math_quiz_history', row) for row in appended.get('math_quiz_history', []))])
+
+    def close(self):
+        while not self._pool.empty():
+            self._pool.get().close()
+
+# --- WRITE-BEHIND QUEUE ---
+
+class WriteBehind(Storage):
+    """Wraps a backend so saves return at once and a worker thread writes them.
+
+    Change records queued for the same student before the worker gets to them
+    are coalesced into one write. Each record is copied when it is queued, as
+    the session goes on changing the values in it while the worker writes.
+    Loading a student first writes out anything queued for them, and
+    everything is flushed at interpreter exit. A failed write stays queued
+    and is retried; that student's next save raises its error instead of
+    queuing anything, so the caller keeps its changes and offers them again.
+    """
+
+    def __init__(self, backend, delay=0.2):
+        self.backend = backend
+        self.delay = delay  # seconds to let rapid updates pile up before writing
+        self._pending = {}
+        self._errors = {}  # student -> exception from their last failed write
+        self._closed = False
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()  # keeps writes for a student in order
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+        atexit.register(self.close)
+
+    def save(self, student, changes):
+        changes = copy.deepcopy(changes)
+        with self._cond:
+            error = self._errors.pop(student, None)
+            if error is None:
+                merge_changes(self._pending.setdefault(student, new_changes()), changes)
+                self._cond.notify()
+        if error is not None:
+            raise error  # nothing was queued
+
+    def _write(self, student, changes):
+        try:
+            self.backend.save(student, changes)
+        except Exception as e:
+            # Put the record back in front of anything queued since, and report it on the student's next save
+            with self._cond:
+                if student in self._pending:
+                    merge_changes(changes, self._pending[student])
+                self._pending[student] = changes
+                self._errors[student] = e
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+            time.sleep(self.delay)
+            self.flush()
+
+    def flush(self, student=None):
+        """Write out queued changes for one student, or for everyone"""
+        with self._write_lock:
+            with self._cond:
+                if student is None:
+                    batch, self._pending = self._pending, {}
+                else:
+                    batch = {student: self._pending.pop(student)} if student in self._pending else {}
+            for name, changes in batch.items():
+                self._write(name, changes)
+
+    def load(self, student):
+        self.flush(student)
+        return self.backend.load(student)
+
+    def attempts_since(self, watermark, batch_size=EXPORT_BATCH):
+        self.flush()
+        return self.backend.attempts_since(watermark, batch_size)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        atexit.unregister(self.close)
+        self.flush()
+        self.backend.close()
+
+def open_storage(backend=None):
+    """Create the storage backend named by `backend` or the MATH_STORAGE environment variable.
+
+    Saves go through a WriteBehind queue unless MATH_WRITE_BEHIND is set to 0.
+    """
+    backend = backend or os.environ.get('MATH_STORAGE', 'json')
+    if backend == 'json':
+        store = JsonLogStorage(os.environ.get('MATH_DATA_DIR', 'math_user_data'))
+    elif backend == 'sqlite':
+        store = SQLiteStorage(os.environ.get('MATH_DB_PATH', 'math_user_data.db'))
+    else:
+        raise ValueError(f"Unknown storage backend: {backend}")
+    if os.environ.get('MATH_WRITE_BEHIND', '1') != '0':
+        store = WriteBehind(store)
+    return store
@@ -0,0 +1,70 @@
+import random
+from datetime import date, timedelta
+
+from activity import ActiveDays, calendar, load_active_days
+
+START = date(2024, 1, 1)
+
+
+def days_of(offsets):
+    days = ActiveDays()
+    for offset in offsets:
+        days.mark(START + timedelta(days=offset))
+    return days
+
+
+def longest_run(offsets):
+    best = run = 0
+    for offset in range(max(offsets, default=-1) + 1):
+        run = run + 1 if offset in offsets else 0
+        best = max(best, run)
+    return best
+
+
+def test_mark_reports_new_days_and_accepts_earlier_ones():
+    days = ActiveDays()
+    assert days.mark(START + timedelta(days=5))
+    assert not days.mark(START + timedelta(days=5))
+    assert days.mark(START)  # graded later, before the first active day
+    assert (days.count(), days.last_day()) == (2, START + timedelta(days=5))
+
+
+def test_streaks():
+    days = days_of([0, 1, 2, 5, 6, 7, 8, 10])
+    assert days.longest_streak() == 4
+    assert days.streak_ending(START + timedelta(days=8)) == 4
+    assert days.streak_ending(START + timedelta(days=2)) == 3
+    assert days.streak_ending(START + timedelta(days=9)) == 0
+    assert days.streak_ending(START - timedelta(days=1)) == 0
+    assert days.current_streak(START + timedelta(days=11)) == 1  # today not done yet
+    assert days.current_streak(START + timedelta(days=12)) == 0
+    assert ActiveDays().longest_streak() == ActiveDays().streak_ending(START) == 0
+
+
+def test_streaks_match_a_day_by_day_count():
+    rng = random.Random(16)
+    for _ in range(300):
+        offsets = {offset for offset in range(rng.randrange(1, 400)) if rng.random() < rng.random()}
+        days = days_of(offsets)
+        assert days.longest_streak() == longest_run(offsets)
+        assert days.count() == len(offsets)
+        for offset in rng.sample(range(420), 10):
+            expected = 0
+            while offset - expected in offsets:
+                expected += 1
+            assert days.streak_ending(START + timedelta(days=offset)) == expected
+
+
+def test_saved_form_round_trips():
+    days = days_of([0, 3, 4, 300])
+    assert load_active_days(days.to_json()) == days
+    assert load_active_days(ActiveDays().to_json()) == ActiveDays()
+
+
+def test_calendar_is_whole_weeks_ending_today():
+    today = date(2024, 5, 15)  # a Wednesday
+    days = days_of([(today - START).days, (today - START).days - 1])
+    columns = calendar(days, today, weeks=2)
+    assert [cell[0].weekday() for cell in columns[0]] == list(range(7))
+    assert columns[1][2] == (today, True) and columns[1][1] == (today - timedelta(days=1), True)
+    assert columns[1][3] is None and columns[0][2] == (today - timedelta(days=7), False)
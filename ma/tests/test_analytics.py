@@ -0,0 +1,76 @@
+import os
+import random
+
+import pytest
+
+pytest.importorskip('pyarrow')
+
+import analytics
+import storage
+
+
+class ListStorage(storage.Storage):
+    """Attempts handed out in the order they were added; the watermark is how many were exported"""
+
+    def __init__(self):
+        self.attempts = []
+
+    def attempts_since(self, watermark, batch_size=storage.EXPORT_BATCH):
+        start = watermark or 0
+        for i in range(start, len(self.attempts), batch_size):
+            batch = self.attempts[i:i + batch_size]
+            yield batch, i + len(batch)
+
+
+def add_attempts(store, count, rng):
+    for _ in range(count):
+        student, question = rng.randrange(30), rng.randrange(20)
+        correct = rng.random() < (student + 5) / (question + 40)
+        store.attempts.append((f"s{student}", 1_700_000_000, 'Algebra', 'solve', int(correct), 10 * correct,
+                               f"q{question}", rng.choice([0, 800, 5000])))
+
+
+def stats_by_question(stats):
+    return {row['problem_id']: row for row in stats.to_pylist()}
+
+
+def test_runs_are_compacted_and_report_like_one_export(tmp_path, monkeypatch):
+    monkeypatch.setattr(analytics, 'COMPACT_EVERY', 3)
+    rng = random.Random(3)
+    store = ListStorage()
+    incremental = str(tmp_path / 'incremental')
+    for _ in range(7):
+        add_attempts(store, 200, rng)
+        assert analytics.export(store, 'list', incremental, batch_size=64) == 200
+    assert analytics.export(store, 'list', incremental) == 0
+
+    # Folded after runs 3, 5 and 7: each fold counts as one of the three files
+    for part in analytics.AGGREGATE_KEYS:
+        assert os.listdir(os.path.join(incremental, part)) == ['upto-00007.parquet']
+    assert len(os.listdir(os.path.join(incremental, 'attempts'))) == 7
+
+    at_once = str(tmp_path / 'at_once')
+    analytics.export(store, 'list', at_once)
+    expected = stats_by_question(analytics.report(at_once))
+    got = stats_by_question(analytics.report(incremental))
+    assert got.keys() == expected.keys()
+    for problem_id, row in expected.items():
+        for column, value in row.items():
+            assert got[problem_id][column] == pytest.approx(value), (problem_id, column)
+
+
+def test_discrimination_is_rebuilt_for_exports_without_pair_counts(tmp_path):
+    rng = random.Random(5)
+    store = ListStorage()
+    directory = str(tmp_path / 'out')
+    add_attempts(store, 500, rng)
+    analytics.export(store, 'list', directory)
+    expected = stats_by_question(analytics.report(directory))
+
+    for name in os.listdir(os.path.join(directory, 'pairs')):
+        os.remove(os.path.join(directory, 'pairs', name))
+    os.rmdir(os.path.join(directory, 'pairs'))
+    analytics.export(store, 'list', directory)
+    got = stats_by_question(analytics.report(directory))
+    for problem_id, row in expected.items():
+        assert got[problem_id]['discrimination'] == pytest.approx(row['discrimination'])
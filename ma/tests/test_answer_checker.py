@@ -0,0 +1,48 @@
+import pytest
+
+from answer_checker import is_correct
+
+
+@pytest.mark.parametrize('submitted, expected, problem_type', [
+    ('0.5', '1/2', None),
+    ('1/2', '0.5', 'calculation'),
+    ('-15+6x', '6x-15', 'expand'),
+    ('6*x - 15', '6x-15', 'expand'),
+    ('(x-3)(x+3)', '(x+3)(x-3)', 'factor'),
+    ('(x+3)(x-3)', '(x+3)(x-3)', 'factor'),
+    ('x^2+C', 'x^2 + C', 'integral'),
+    ('x^2 + 7', 'x^2 + C', 'integral'),
+    ('x²', 'x^2 + C', 'integral'),
+    ('3,2', '2,3', 'solve'),
+    ('x=2 or x=3', '2,3', 'solve'),
+    ('153.94', '153.94', None),
+    ('153.938', '153.94', None),
+    ('sqrt(3)/2', '0.87', None),
+    ('1/2', '0.5', 'trig'),  # sin 30°
+    ('adjacent / hypotenuse', 'Adjacent/Hypotenuse', 'definition'),
+])
+def test_equivalent_answers_are_accepted(submitted, expected, problem_type):
+    assert is_correct(submitted, expected, problem_type)
+
+
+@pytest.mark.parametrize('submitted, expected, problem_type', [
+    ('0.6', '1/2', None),
+    ('6x+15', '6x-15', 'expand'),
+    ('x^2-9', '(x+3)(x-3)', 'factor'),  # equal, but not factored
+    ('x^3+C', 'x^2 + C', 'integral'),
+    ('2', '2,3', 'solve'),
+    ('2,3,4', '2,3', 'solve'),
+    ('2,2', '2,3', 'solve'),
+    ('153.9', '153.94', None),
+    ('154', '153.94', None),
+    ('', '2', None),
+    ('   ', '2', None),
+    ('opposite/hypotenuse', 'Adjacent/Hypotenuse', 'definition'),
+    ('__import__("os")', '2', None),
+])
+def test_different_answers_are_rejected(submitted, expected, problem_type):
+    assert not is_correct(submitted, expected, problem_type)
+
+
+def test_overlong_answers_are_rejected_without_evaluation():
+    assert not is_correct('1+' * 500 + '1', '501')
@@ -0,0 +1,102 @@
+import json
+import random
+from datetime import date
+
+import leaderboard
+from leaderboard import Leaderboard, RankedScores, week_board
+
+
+def student(name, points, day=None):
+    key = (day or date.today()).strftime("%Y-%m-%d")
+    return {'student_name': name, 'points': points, 'math_problems_completed': {'Algebra': points // 10},
+            'daily_rollup': {key: {'points_gained': points, 'total_points': points, 'topics': {}}}}
+
+
+# --- RANKED SCORES ---
+
+def ranking(scores):
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+
+def test_ranked_scores_order_ties_by_name():
+    board = RankedScores()
+    for name, score in [('cy', 30), ('ada', 50), ('bob', 30), ('dee', 10)]:
+        board.set(name, score)
+    assert board.top(10) == [('ada', 50), ('bob', 30), ('cy', 30), ('dee', 10)]
+    assert [board.rank(name) for name in ('ada', 'bob', 'cy', 'dee', 'eve')] == [1, 2, 3, 4, None]
+
+
+def test_ranked_scores_report_changes_and_drop_zero_scores():
+    board = RankedScores()
+    assert board.set('ada', 10)
+    assert not board.set('ada', 10)
+    assert not board.set('bob', 0)
+    assert board.set('ada', 0)
+    assert len(board) == 0 and board.top(5) == [] and board.rank('ada') is None
+
+
+def test_ranked_scores_match_a_sorted_list():
+    rng = random.Random(11)
+    board, scores = RankedScores(), {}
+    for step in range(3000):
+        name, score = f"s{rng.randrange(200)}", rng.choice([0, rng.randrange(1, 60)])
+        board.set(name, score)
+        if score:
+            scores[name] = score
+        else:
+            scores.pop(name, None)
+        if step % 100 == 0:
+            expected = ranking(scores)
+            assert len(board) == len(expected)
+            assert board.top(len(expected) + 5) == expected
+            assert [board.rank(name) for name, _ in expected] == list(range(1, len(expected) + 1))
+
+
+# --- SAVING ---
+
+def test_saves_keep_entries_written_by_another_process(tmp_path):
+    path = str(tmp_path / 'leaderboard.json')
+    app = Leaderboard(path, save_delay=None)
+    app.update_student(student('ada', 50))
+    app.save()
+
+    grader = Leaderboard(path, save_delay=None)  # e.g. bulk_grade.py
+    grader.update_student(student('bob', 80))
+    grader.close()
+
+    app.update_student(student('ada', 60))
+    app.save()
+    with open(path) as f:
+        assert json.load(f)['boards']['points'] == {'ada': 60, 'bob': 80}
+    assert app.top('points') == [(1, 'bob', 80), (2, 'ada', 60)]
+    app.close()
+
+
+def test_finished_weeks_are_not_merged_back(tmp_path):
+    path = str(tmp_path / 'leaderboard.json')
+    last_week = Leaderboard(path, save_delay=None)
+    last_week.update_student(student('ada', 50, date(2026, 10, 7)), date(2026, 10, 7))
+    last_week.close()
+
+    board = Leaderboard(path, save_delay=None)
+    board.update_student(student('bob', 20, date(2026, 10, 14)), date(2026, 10, 14))
+    board.close()
+    with open(path) as f:
+        weeks = [name for name in json.load(f)['boards'] if name.startswith('week:')]
+    assert weeks == [week_board(date(2026, 10, 14))]
+
+
+def test_close_cancels_the_background_save(tmp_path, monkeypatch):
+    path = str(tmp_path / 'leaderboard.json')
+    unregistered = []
+    monkeypatch.setattr(leaderboard.atexit, 'unregister', unregistered.append)
+    board = Leaderboard(path, save_delay=60)
+    board.update_student(student('ada', 50))
+    timer = board._timer
+    board.close()
+    assert timer is not None and timer.finished.is_set()
+    assert unregistered == [board.save]
+    with open(path) as f:
+        assert json.load(f)['boards']['points'] == {'ada': 50}
+    board.update_student(student('ada', 70))
+    assert board._timer is None
@@ -0,0 +1,55 @@
+import random
+
+from catalog import Problem
+from scheduler import DAY, RETRY_DELAY, Scheduler
+
+
+def problem(n):
+    return Problem(f"p{n}", 'calculation', f"{n} + 1", str(n + 1), 10, None)
+
+
+def test_answers_move_cards_between_boxes():
+    scheduler = Scheduler()
+    card = scheduler.answer(problem(1), 'Algebra', True, 0)
+    assert (card['box'], card['due']) == (1, DAY)
+    card = scheduler.answer(problem(1), 'Algebra', False, DAY)
+    assert (card['box'], card['due']) == (0, DAY + RETRY_DELAY)
+
+
+def test_next_serves_the_most_overdue_card_then_fresh_problems():
+    scheduler = Scheduler()
+    scheduler.answer(problem(1), 'Algebra', False, 0)
+    scheduler.answer(problem(2), 'Geometry', False, 10)
+    fresh = lambda topic: problem(99)
+    now = 10 + RETRY_DELAY
+    assert scheduler.next(['Algebra', 'Geometry'], now, fresh) == (problem(1), 'Algebra')
+    scheduler.answer(problem(1), 'Algebra', True, now)
+    assert scheduler.next(['Algebra', 'Geometry'], now, fresh) == (problem(2), 'Geometry')
+    scheduler.answer(problem(2), 'Geometry', True, now)
+    assert scheduler.next(['Algebra', 'Geometry'], now, fresh)[0] == problem(99)
+
+
+def test_a_skipped_review_comes_back():
+    scheduler = Scheduler()
+    scheduler.answer(problem(1), 'Algebra', False, 0)
+    fresh = lambda topic: problem(99)
+    now = RETRY_DELAY
+    assert scheduler.next(['Algebra'], now, fresh)[0] == problem(1)
+    assert scheduler.next(['Algebra'], now, fresh)[0] == problem(99)  # Generate again without answering
+    assert scheduler.due_count(now) == 1
+    assert scheduler.next(['Algebra'], 10 ** 7, fresh)[0] == problem(1)
+    scheduler.answer(problem(1), 'Algebra', True, 10 ** 7)
+    assert scheduler.due_count(10 ** 7) == 0
+    assert scheduler.next(['Algebra'], 10 ** 7, fresh)[0] == problem(99)
+
+
+def test_due_count_matches_a_scan():
+    rng = random.Random(7)
+    scheduler = Scheduler({f"p{n}": {'box': 1, 'due': rng.randint(0, 5000), 'topic': 'Algebra',
+                                     'problem': problem(n)} for n in range(300)})
+    now = 0
+    for step in range(5000):
+        now += rng.randint(0, 20)
+        scheduler.answer(problem(rng.randint(0, 400)), 'Algebra', rng.random() < 0.6, now)
+        if step % 50 == 0:
+            assert scheduler.due_count(now) == sum(card['due'] <= now for card in scheduler.cards.values())
@@ -0,0 +1,258 @@
+import json
+import os
+
+import pytest
+
+import storage
+from storage import WriteBehind, apply_changes, new_changes
+
+
+class RecordingBackend(storage.Storage):
+    """Backend that keeps every record it is asked to write"""
+
+    def __init__(self, fail=()):
+        self.saved = []
+        self.fail = set(fail)
+
+    def save(self, student, changes):
+        if student in self.fail:
+            raise OSError(f"disk full for {student}")
+        self.saved.append((student, storage.compact_json(changes)))
+
+    def load(self, student):
+        return None
+
+
+def changes(op, key, value):
+    record = new_changes()
+    record[op][key] = value
+    return record
+
+
+# --- CHANGE RECORDS ---
+
+def test_apply_changes_sets_merges_and_appends():
+    data = {'points': 5, 'math_problems_completed': {'Algebra': 1}, 'achievements': {'A'}, 'log': [1]}
+    apply_changes(data, {'set': {'points': 15, 'level': 2},
+                         'merge': {'math_problems_completed': {'Geometry': 2}, 'daily_rollup': {'2024-05-01': {}}},
+                         'append': {'achievements': ['B', 'A'], 'log': [2, 3]}})
+    assert data == {'points': 15, 'level': 2, 'math_problems_completed': {'Algebra': 1, 'Geometry': 2},
+                    'daily_rollup': {'2024-05-01': {}}, 'achievements': {'A', 'B'}, 'log': [1, 2, 3]}
+
+
+def test_apply_changes_loads_values_saved_as_json():
+    data = apply_changes({}, {'set': {'active_days': {'start': '2024-05-01', 'bits': '5'}}})
+    assert data['active_days'].count() == 2
+
+
+def test_merge_changes_folds_later_records_into_earlier_ones():
+    into = {'set': {'points': 5}, 'merge': {'daily_rollup': {'d1': 1}, 'math_types_completed': {'solve': 1}},
+            'append': {'math_quiz_history': [(1,)], 'achievements': ['A']}}
+    storage.merge_changes(into, {'set': {'points': 9, 'math_types_completed': {'expand': 1}},
+                                 'merge': {'daily_rollup': {'d1': 2, 'd2': 1}},
+                                 'append': {'math_quiz_history': [(2,)]}})
+    assert into == {'set': {'points': 9, 'math_types_completed': {'expand': 1}},
+                    'merge': {'daily_rollup': {'d1': 2, 'd2': 1}},
+                    'append': {'math_quiz_history': [(1,), (2,)], 'achievements': ['A']}}
+
+
+def test_merged_records_apply_like_the_records_one_by_one():
+    records = [{'set': {'points': 5}, 'merge': {'topics': {'Algebra': 1}}, 'append': {'log': [1]}},
+               {'set': {'topics': {'Geometry': 1}}, 'merge': {}, 'append': {'log': [2]}},
+               {'set': {}, 'merge': {'topics': {'Algebra': 3}}, 'append': {'log': [3]}},
+               {'set': {'log': [0]}, 'merge': {}, 'append': {}},
+               {'set': {}, 'merge': {}, 'append': {'log': [4]}}]
+    one_by_one = {}
+    for record in records:
+        apply_changes(one_by_one, record)
+    merged = new_changes()
+    for record in records:
+        storage.merge_changes(merged, record)
+    assert apply_changes({}, merged) == one_by_one
+
+
+# --- JSON SNAPSHOT + EVENT LOG BACKEND ---
+
+def log_lines(path):
+    with open(path) as f:
+        return f.read().splitlines()
+
+
+def test_rebuild_replays_the_log_over_the_snapshot(tmp_path):
+    data_path, log_path = str(tmp_path / 'ada.json'), str(tmp_path / 'ada.log')
+    user_data = storage.default_user_data('ada')
+    user_data['points'] = 10
+    storage.write_atomic(data_path, storage.compact_json({'seq': 2, 'user_data': user_data}))
+    records = [{'seq': 1, 'set': {'points': 5}},  # already in the snapshot
+               {'seq': 2, 'set': {'points': 10}},
+               {'seq': 3, 'set': {'points': 20}, 'append': {'achievements': ['50 Points!']}},
+               {'seq': 4, 'merge': {'math_problems_completed': {'Algebra': 3}}}]
+    for record in records:
+        storage.append_line(log_path, json.dumps(record))
+    seq, data, replayed = storage.rebuild(data_path, log_path)
+    assert (seq, replayed) == (4, 2)
+    assert data['points'] == 20
+    assert data['achievements'] == {'50 Points!'}
+    assert data['math_problems_completed'] == {'Algebra': 3}
+
+
+def test_rebuild_without_a_snapshot_starts_from_defaults(tmp_path):
+    log_path = str(tmp_path / 'ada.log')
+    storage.append_line(log_path, json.dumps({'seq': 1, 'set': {'points': 7}}))
+    seq, data, replayed = storage.rebuild(str(tmp_path / 'missing.json'), log_path)
+    assert (seq, replayed, data['points'], data['level']) == (1, 1, 7, 1)
+
+
+def test_torn_log_lines_are_skipped_and_terminated(tmp_path):
+    log_path = str(tmp_path / 'ada.log')
+    storage.append_line(log_path, json.dumps({'seq': 1, 'set': {'points': 5}}))
+    with open(log_path, 'a') as f:
+        f.write('{"seq":2,"set":{"poi')  # crash mid-write
+    assert [r['seq'] for r in storage.read_log(log_path, 0)] == [1]
+
+    storage.append_line(log_path, json.dumps({'seq': 2, 'set': {'points': 9}}))
+    lines = log_lines(log_path)
+    assert len(lines) == 3 and lines[1] == '{"seq":2,"set":{"poi'
+    assert [r['set']['points'] for r in storage.read_log(log_path, 0)] == [5, 9]
+
+
+def test_saves_survive_reopening_and_compaction(tmp_path):
+    store = storage.JsonLogStorage(str(tmp_path), snapshot_every=1000)
+    for points in range(1, 6):
+        store.save('ada', changes('set', 'points', points))
+        store.save('ada', changes('append', 'achievements', [f"A{points}"]))
+    state = store._state('ada')
+    data_path, log_path = store._paths('ada')
+    store._compact(state, data_path, log_path)
+    assert log_lines(log_path) == []
+    store.save('ada', changes('set', 'level', 3))
+    assert len(log_lines(log_path)) == 1
+
+    data = storage.JsonLogStorage(str(tmp_path)).load('ada')
+    assert (data['points'], data['level']) == (5, 3)
+    assert data['achievements'] == {f"A{points}" for points in range(1, 6)}
+
+
+def test_compaction_keeps_records_logged_while_it_ran(tmp_path, monkeypatch):
+    store = storage.JsonLogStorage(str(tmp_path), snapshot_every=1000)
+    store.save('ada', changes('set', 'points', 1))
+    state = store._state('ada')
+    data_path, log_path = store._paths('ada')
+    rebuild = storage.rebuild
+
+    def rebuild_then_save(*paths):
+        result = rebuild(*paths)
+        store.save('ada', changes('set', 'level', 4))  # lands after the snapshot was read
+        return result
+
+    monkeypatch.setattr(storage, 'rebuild', rebuild_then_save)
+    store._compact(state, data_path, log_path)
+    monkeypatch.undo()
+    assert [json.loads(line)['seq'] for line in log_lines(log_path)] == [2]
+    data = storage.JsonLogStorage(str(tmp_path)).load('ada')
+    assert (data['points'], data['level']) == (1, 4)
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+
+
+# --- WRITE-BEHIND QUEUE ---
+
+def test_write_behind_coalesces_queued_records():
+    backend = RecordingBackend()
+    queue = WriteBehind(backend, delay=60)
+    queue.save('ada', changes('set', 'points', 10))
+    queue.save('ada', changes('append', 'achievements', ['First Problem Solved!']))
+    queue.save('ada', changes('set', 'points', 25))
+    queue.flush()
+    assert len(backend.saved) == 1
+    assert backend.saved[0] == ('ada', '{"set":{"points":25},"merge":{},"append":{"achievements":["First Problem Solved!"]}}')
+    queue.close()
+
+
+def test_write_behind_copies_every_queued_record():
+    # The session keeps changing its rollup days after saving them; the queued write must not see that
+    backend = RecordingBackend()
+    queue = WriteBehind(backend, delay=60)
+    first_day = {'points_gained': 10, 'total_points': 10, 'topics': {}}
+    second_day = {'points_gained': 5, 'total_points': 15, 'topics': {}}
+    queue.save('ada', changes('merge', 'daily_rollup', {'2024-05-01': first_day}))
+    queue.save('ada', changes('merge', 'daily_rollup', {'2024-05-02': second_day}))
+    first_day['points_gained'] = 99
+    second_day['points_gained'] = 99
+    second_day['topics']['Algebra'] = [1, 0]
+    queue.flush()
+    written = backend.saved[0][1]
+    assert '99' not in written and 'Algebra' not in written
+    queue.close()
+
+
+def test_write_behind_reports_errors_to_the_failing_student_only():
+    backend = RecordingBackend(fail={'ada'})
+    queue = WriteBehind(backend, delay=60)
+    queue.save('ada', changes('set', 'points', 10))
+    queue.flush()
+    queue.save('bob', changes('set', 'points', 5))  # someone else's save is unaffected
+    with pytest.raises(OSError):
+        queue.save('ada', changes('set', 'level', 2))  # not queued: the caller keeps it
+    backend.fail.clear()
+    queue.flush()
+    assert ('ada', '{"set":{"points":10},"merge":{},"append":{}}') in backend.saved
+    queue.save('ada', changes('set', 'level', 2))
+    queue.flush()
+    assert backend.saved[-1] == ('ada', '{"set":{"level":2},"merge":{},"append":{}}')
+    queue.close()
+
+
+def test_a_retried_save_writes_each_appended_row_once():
+    # The app's side of the contract: keep pending changes until save() returns, then start afresh
+    backend = RecordingBackend(fail={'ada'})
+    queue = WriteBehind(backend, delay=60)
+    pending = new_changes()
+
+    def attempt(row):
+        nonlocal pending
+        storage.merge_changes(pending, changes('append', 'math_quiz_history', [row]))
+        try:
+            queue.save('ada', pending)
+            pending = new_changes()
+        except OSError:
+            pass
+
+    attempt(1)
+    queue.flush()  # fails, and is retried later
+    attempt(2)  # reports the failure
+    backend.fail.clear()
+    attempt(3)
+    queue.flush()
+    written = [json.loads(record)['append']['math_quiz_history'] for _, record in backend.saved]
+    assert sorted(sum(written, [])) == [1, 2, 3]
+    queue.close()
+
+
+
+# --- SQLITE BACKEND ---
+
+def test_sqlite_keeps_review_cards_in_their_own_table(tmp_path):
+    store = storage.SQLiteStorage(str(tmp_path / 'math.db'))
+    card = {'box': 1, 'due': 100, 'topic': 'Algebra', 'problem': ['p1', 'calculation', '1 + 1', '2', 10, None]}
+    store.save('ada', changes('merge', 'review_cards', {'p1': card}))
+    store.save('ada', changes('merge', 'review_cards', {'p2': dict(card, problem=['p2', 'calculation', '2 + 2', '4', 10, None])}))
+    store.save('ada', changes('merge', 'review_cards', {'p1': dict(card, box=2, due=500)}))
+    with store._connection() as conn:
+        assert 'review_cards' not in conn.execute("SELECT data FROM profile").fetchone()['data']
+    cards = store.load('ada')['review_cards']
+    assert sorted(cards) == ['p1', 'p2']
+    assert (cards['p1']['box'], cards['p1']['due'], cards['p1']['problem'].answer) == (2, 500, '2')
+    store.close()
+
+
+@pytest.mark.parametrize('backend', ['json', 'sqlite'])
+def test_exams_taken_reload_as_a_set(tmp_path, backend):
+    open_store = {'json': lambda: storage.JsonLogStorage(str(tmp_path)),
+                  'sqlite': lambda: storage.SQLiteStorage(str(tmp_path / 'math.db'))}[backend]
+    store = open_store()
+    store.save('ada', changes('append', 'exams_taken', ['MATH101|grade 7|10']))
+    store.save('ada', changes('append', 'exams_taken', ['MATH101|grade 7|25']))
+    store.close()
+    store = open_store()
+    assert store.load('ada')['exams_taken'] == {'MATH101|grade 7|10', 'MATH101|grade 7|25'}
+    store.close()